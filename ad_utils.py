@@ -1,8 +1,26 @@
 # /ad_utils.py
-import ssl
-from flask import session
-from ldap3 import Server, Connection, Tls, ALL, SUBTREE, LEVEL, MODIFY_ADD
-from utils import load_rules, CONFIG
+import hashlib
+from datetime import datetime
+from flask import session, g
+from ldap3 import ServerPool, FIRST, ALL, SCHEMA, BASE, SUBTREE, LEVEL, MODIFY_ADD
+from ldap3.core.exceptions import LDAPCommunicationError, LDAPServerPoolExhaustedError
+from ldap3.utils.config import set_config_parameter
+from utils import load_rules, load_positions, CONFIG
+from dir_cache import cache_key, get_or_fetch, get_local, get_stale, invalidate, invalidated_within
+from dn_store import DNStore
+from dn_utils import parent_dn as get_parent_dn, same_dn, dn_suffixes, normalize_dn, escape_rdn_value
+from ldap_metrics import InstrumentedConnection, LDAP_CIRCUIT_OPEN
+from ldap_pool import ConnectionPool
+from circuit_breaker import CircuitBreaker
+from ldap_transport import CachedServer, SESSION_TLS, remember_session
+from scheduler import lane
+from deadlines import DeadlineExceeded, check as check_deadline, connect_timeout, remaining
+from dc_health import (read_controllers, write_controllers, read_port, mark_down, any_controller_reachable,
+                       LDAPS_PORT, DC_CONNECT_TIMEOUT)
+
+
+# ServerPool 每尝试完一轮所有域控后默认休眠 10 秒；这里只尝试一轮，失败应立即返回而不是让页面挂起
+set_config_parameter('POOLING_LOOP_TIMEOUT', 0)
 
 
 def get_base_dn(domain_name):
@@ -10,9 +28,185 @@ def get_base_dn(domain_name):
     return ",".join([f"DC={part}" for part in domain_name.split('.')])
 
 
+# 可替换的连接工厂 (基准测试用它接入模拟目录)，签名与 open_connection 相同
+_connection_factory = None
+
+
+def set_connection_factory(factory):
+    global _connection_factory
+    _connection_factory = factory
+
+
+# 域控全部不可达时快速失败：连续 CIRCUIT_FAILURE_THRESHOLD 次连接失败后断开，
+# 断开期间不再等待连接超时，后台每 CIRCUIT_PROBE_INTERVAL 秒探测一次，恢复后自动闭合
+_breaker = CircuitBreaker('ldap', any_controller_reachable,
+                          failure_threshold=CONFIG.get('CIRCUIT_FAILURE_THRESHOLD', 5),
+                          probe_interval=CONFIG.get('CIRCUIT_PROBE_INTERVAL', 10),
+                          on_change=lambda state: LDAP_CIRCUIT_OPEN.set(value=int(state == CircuitBreaker.OPEN)))
+
+
+def open_connection(bind_username, bind_password, call_site, domain_controller_ip=None, get_info=SCHEMA,
+                    role='write'):
+    """
+    创建并绑定到域控的 LDAPS 连接。所有 LDAP 连接都应通过这里创建，
+    以便每个操作都按 call_site 记录到 /metrics。
+    role='read' 时连接最近的读域控 (可配置为全局编录)，role='write' 时连接固定的写域控；
+    domain_controller_ip 可以覆盖配置中的域控列表。
+    配置了多台域控时构建 ServerPool，首选域控不可用时自动切换到下一台。
+    熔断器断开时直接抛出 CircuitOpenError，请求已超时抛出 DeadlineExceeded。
+    只有域控通信失败计入熔断；请求自身截止时间到期 (包括被截短的连接超时) 不计入。
+    """
+    check_deadline()
+    _breaker.before_call()
+    left = remaining()
+    # 请求剩余时间不足一个完整的连接超时时，连接超时被截短 (见 connect_timeout)
+    budget_limited = left is not None and left < DC_CONNECT_TIMEOUT
+    try:
+        conn = _open_connection(bind_username, bind_password, call_site, domain_controller_ip, get_info, role)
+    except DeadlineExceeded:
+        _breaker.record_neutral()  # 本次请求自己的时间用完了，不能说明域控不可用
+        raise
+    except (LDAPCommunicationError, LDAPServerPoolExhaustedError) as e:
+        if budget_limited and remaining() <= 0:
+            _breaker.record_neutral()  # 被截短的连接超时到期，同上
+        else:
+            _breaker.record_failure(str(e))
+        raise
+    except Exception:
+        _breaker.record_success()  # 绑定失败等错误说明域控有响应，不计入熔断
+        raise
+    _breaker.record_success()
+    return conn
+
+
+def _open_connection(bind_username, bind_password, call_site, domain_controller_ip, get_info, role):
+    if _connection_factory is not None:
+        return _connection_factory(bind_username, bind_password, call_site, domain_controller_ip, get_info)
+    if role == 'read':
+        hosts, port = read_controllers(domain_controller_ip), read_port()
+    else:
+        hosts, port = write_controllers(domain_controller_ip), LDAPS_PORT
+    # 地址解析走 DNS 缓存，TLS 使用共享的 SSLContext 并复用会话 (见 ldap_transport)
+    servers = [CachedServer(host, port=port, use_ssl=True, get_info=get_info, tls=SESSION_TLS,
+                            connect_timeout=connect_timeout(DC_CONNECT_TIMEOUT)) for host in hosts]
+    if len(servers) == 1:
+        conn = InstrumentedConnection(servers[0], user=bind_username, password=bind_password, auto_bind=True,
+                                      call_site=call_site)
+    else:
+        # FIRST: 按给定顺序尝试；active=1: 所有域控都尝试一轮后仍失败则抛出异常，而不是无限重试
+        server_pool = ServerPool(servers, FIRST, active=1, exhaust=False)
+        conn = InstrumentedConnection(server_pool, user=bind_username, password=bind_password, auto_bind=True,
+                                      call_site=call_site)
+        if conn.server.host != hosts[0]:
+            mark_down(hosts[0], f"connection failed, switched to {conn.server.host}", port)
+    remember_session(conn)  # TLS 1.3 的会话票据在绑定响应之前到达，此时才能取得可复用的会话
+    return conn
+
+
+# 每个 worker 进程一个连接池，线程之间独占借出
+_pool = ConnectionPool(max_idle=CONFIG.get('LDAP_POOL_MAX_IDLE', 4),
+                       idle_timeout=CONFIG.get('LDAP_POOL_IDLE_SECONDS', 60))
+
+
+def acquire_connection(bind_username, bind_password, call_site, domain_controller_ip=None, get_info=SCHEMA,
+                       role='write'):
+    """
+    从连接池借出一个已绑定的连接 (没有空闲连接时新建)，用完后必须调用 release_connection 归还。
+    登录校验密码时不要使用连接池，应直接调用 open_connection 重新绑定。
+    """
+    key = (role, domain_controller_ip, bind_username, hashlib.sha256(bind_password.encode('utf-8')).hexdigest(),
+           get_info)
+    conn = _pool.checkout(key, lambda: open_connection(bind_username, bind_password, call_site,
+                                                       domain_controller_ip, get_info, role))
+    conn.call_site = call_site  # 复用的连接按本次调用方记录指标
+    conn.pool_key = key
+    return conn
+
+
+def release_connection(conn, discard=False):
+    """归还连接；discard=True (如操作中途出现异常，连接状态不确定) 时直接关闭"""
+    key = getattr(conn, 'pool_key', None)
+    if discard or key is None:
+        if conn.bound:
+            conn.unbind()
+        return
+    _pool.checkin(key, conn)
+
+
+def close_pooled_connections():
+    """关闭所有空闲连接，例如在 gunicorn --preload 的 master 进程 fork 之前"""
+    _pool.close_all()
+
+
+def compile_rules(rules_data):
+    """
+    把规则转换为紧凑的只读结构：按关键字匹配的规则变为有序的 (关键字, 规范化 DN, 值) 元组，
+    职位规则保留字典以便按职位名直接查找。
+    关键字是位于本域之下的完整 DN 时预先规范化，匹配时判断 OU 是否位于该 DN 之下；
+    其他关键字 (包括 'OU=武汉1营' 这类不完整的 DN 片段) 按子串匹配。
+    """
+    base_dn = normalize_dn(get_base_dn(CONFIG['DOMAIN_NAME']))
+
+    def keyword_dn(keyword):
+        return normalize_dn(keyword) if '=' in keyword and base_dn in dn_suffixes(keyword) else None
+
+    def compile_keyword_rules(rules):
+        return tuple((keyword, keyword_dn(keyword), value) for keyword, value in rules.items())
+
+    return {
+        'battalion_rules': compile_keyword_rules(rules_data.get('battalion_rules', {})),
+        'position_rules': dict(rules_data.get('position_rules', {})),
+        'department_rules': compile_keyword_rules(rules_data.get('department_rules', {})),
+        'ou_group_rules': compile_keyword_rules(rules_data.get('ou_group_rules', {})),
+    }
+
+
+def _rule_matches(keyword, keyword_dn, ou_suffixes, ou_path):
+    if keyword_dn is not None:
+        return keyword_dn in ou_suffixes
+    return keyword in ou_path
+
+
+def get_compiled_rules():
+    """进程内缓存的已编译描述规则，规则被修改后自动重新加载；DN 关键字的判断依赖当前域，缓存键包含域名"""
+    return get_local(cache_key(CONFIG['DOMAIN_NAME'], 'rules'), lambda: compile_rules(load_rules()))
+
+
+def get_cached_positions():
+    """进程内缓存的职位数据，职位被修改后自动重新加载"""
+    return get_local(cache_key('positions'), load_positions)
+
+
+def compute_description(display_name, ou_path, position_name=None):
+    """按描述规则计算用户描述：优先匹配单位规则，其次部门规则；都不匹配时返回空字符串"""
+    rules_data = get_compiled_rules()
+    ou_suffixes = dn_suffixes(ou_path)
+
+    # 1. 优先应用单位规则
+    for ou_keyword, keyword_dn, ou_code in rules_data['battalion_rules']:
+        if _rule_matches(ou_keyword, keyword_dn, ou_suffixes, ou_path):
+            position_code = rules_data['position_rules'].get(position_name or "", "NA")
+            return f"{ou_code}-{position_code}-{display_name}"
+
+    # 2. 如果单位规则未匹配，再应用部门规则
+    for ou_keyword, keyword_dn, dept_prefix in rules_data['department_rules']:
+        if _rule_matches(ou_keyword, keyword_dn, ou_suffixes, ou_path):
+            return f"{dept_prefix}-{display_name}"
+    return ""
+
+
+def ou_rule_groups(ou_path):
+    """自动加组规则：返回 OU 匹配的第一条规则对应的组 (列表，未匹配时为空)"""
+    ou_suffixes = dn_suffixes(ou_path)
+    for ou_keyword, keyword_dn, group_dn in get_compiled_rules()['ou_group_rules']:
+        if _rule_matches(ou_keyword, keyword_dn, ou_suffixes, ou_path):
+            return [group_dn]
+    return []
+
+
 def create_ou_if_not_exists(conn, ou_dn, domain_name):
     """递归检查并创建不存在的组织单元 (OU)。"""
-    if ou_dn.lower() == get_base_dn(domain_name).lower():
+    if same_dn(ou_dn, get_base_dn(domain_name)):
         return True, "Base DN always exists."
 
     conn.search(search_base=ou_dn, search_filter='(objectClass=organizationalUnit)', search_scope=LEVEL,
@@ -20,7 +214,7 @@ def create_ou_if_not_exists(conn, ou_dn, domain_name):
     if conn.entries:
         return True, f"OU '{ou_dn}' already exists."
 
-    parent_dn = ','.join(ou_dn.split(',')[1:])
+    parent_dn = get_parent_dn(ou_dn)
 
     parent_exists, parent_message = create_ou_if_not_exists(conn, parent_dn, domain_name)
     if not parent_exists:
@@ -28,6 +222,7 @@ def create_ou_if_not_exists(conn, ou_dn, domain_name):
 
     conn.add(ou_dn, 'organizationalUnit')
     if conn.result['result'] == 0:
+        invalidate('ou')  # 通知本节点所有 worker 丢弃缓存的 OU 列表
         return True, f"Successfully created OU '{ou_dn}'."
     else:
         if conn.result['result'] == 68:
@@ -36,21 +231,32 @@ def create_ou_if_not_exists(conn, ou_dn, domain_name):
 
 
 def create_ad_user(domain_controller_ip, bind_username, bind_password, username, display_name, password, ou_path,
-                   domain_name, position_name=None, groups_to_add=None, conn_external=None):
-    """在 AD 中创建新用户的核心函数。"""
+                   domain_name, position_name=None, groups_to_add=None, conn_external=None, dry_run=False):
+    """
+    在 AD 中创建新用户的核心函数。
+    存在性检查和写入使用同一个写域控连接：只读副本可能尚未复制刚创建的对象，检查结果不可靠。
+    dry_run=True 时只做冲突检查和规则计算，不创建 OU、用户，也不修改组，返回将要执行的操作说明。
+    传入 conn_external 时，连接中断和超时 (LDAPCommunicationError、DeadlineExceeded) 直接抛给调用方。
+    """
     conn = conn_external
+    failed = False
     try:
         if not conn:
-            tls_config = Tls(validate=ssl.CERT_NONE, version=ssl.PROTOCOL_TLS_CLIENT)
-            server = Server(domain_controller_ip, port=636, use_ssl=True, get_info=ALL, tls=tls_config)
-            conn = Connection(server, user=bind_username, password=bind_password, auto_bind=True)
+            conn = acquire_connection(bind_username, bind_password, 'create_ad_user', domain_controller_ip,
+                                      get_info=ALL)
 
         if not conn.bound:
             return False, f"错误: LDAP 认证失败。 {conn.result}"
 
-        ou_exists, ou_message = create_ou_if_not_exists(conn, ou_path, domain_name)
-        if not ou_exists:
-            return False, f"OU 创建失败: {ou_message}"
+        ou_note = ""
+        if dry_run:
+            if not conn.search(search_base=ou_path, search_filter='(objectClass=organizationalUnit)',
+                               search_scope=BASE, attributes=['ou']):
+                ou_note = f" OU '{ou_path}' 不存在，将自动创建。"
+        else:
+            ou_exists, ou_message = create_ou_if_not_exists(conn, ou_path, domain_name)
+            if not ou_exists:
+                return False, f"OU 创建失败: {ou_message}"
 
         # 最终修正：使用正确、简洁的逻辑来检查用户是否存在
         conn.search(
@@ -71,42 +277,14 @@ def create_ad_user(domain_controller_ip, bind_username, bind_password, username,
             return False, f"错误: 用户姓名 '{display_name}' 已存在于此组织单元中。"
 
         # --- 规则应用逻辑 ---
-        rules_data = load_rules()
-        battalion_rules = rules_data.get('battalion_rules', {})
-        position_rules = rules_data.get('position_rules', {})
-        department_rules = rules_data.get('department_rules', {})
-        ou_group_rules = rules_data.get('ou_group_rules', {})
-
-        description = ""
-        is_battalion = False
-
-        # 1. 优先应用单位规则
-        for ou_keyword, ou_code in battalion_rules.items():
-            if ou_keyword in ou_path:
-                current_position_name = position_name if position_name else ""
-                position_code = position_rules.get(current_position_name, "NA")
-                description = f"{ou_code}-{position_code}-{display_name}"
-                is_battalion = True
-                break
-
-        # 2. 如果单位规则未匹配，再应用部门规则
-        if not is_battalion:
-            for ou_keyword, dept_prefix in department_rules.items():
-                if ou_keyword in ou_path:
-                    description = f"{dept_prefix}-{display_name}"
-                    break
-
-        # 3. 应用自动加组规则
+        description = compute_description(display_name, ou_path, position_name)
         if groups_to_add is None:
             groups_to_add = []
-        for ou_keyword, group_dn in ou_group_rules.items():
-            if ou_keyword in ou_path:
-                groups_to_add.append(group_dn)
-                break
+        groups_to_add.extend(ou_rule_groups(ou_path))
 
         # --- 规则应用结束 ---
 
-        user_dn = f"CN={display_name},{ou_path}"
+        user_dn = f"CN={escape_rdn_value(display_name)},{ou_path}"
         user_principal_name = f"{username}@{domain_name}"
         encoded_password = f'"{password}"'.encode('utf-16-le')
         user_account_control = 512 + 65536
@@ -120,6 +298,14 @@ def create_ad_user(domain_controller_ip, bind_username, bind_password, username,
         if description:
             attributes['description'] = description
 
+        if dry_run:
+            message = f"[试运行] 将创建用户 '{display_name}' (登录名: {username})，DN: {user_dn}。{ou_note}"
+            if description:
+                message += f" 描述: '{description}'。"
+            if groups_to_add:
+                message += f" 加入组: {', '.join(sorted(set(groups_to_add)))}。"
+            return True, message
+
         conn.add(user_dn, attributes=attributes)
         if conn.result['result'] != 0:
             return False, f"创建用户 '{username}' 时出错: {conn.result['description']}"
@@ -136,34 +322,46 @@ def create_ad_user(domain_controller_ip, bind_username, bind_password, username,
             success_message += f" 描述已自动设为 '{description}'。"
 
         return True, success_message
+    except (DeadlineExceeded, LDAPCommunicationError) as e:
+        failed = True  # 连接可能仍有未读完的响应或已断开，不能归还连接池
+        if conn_external:
+            # 批量处理：交给工作线程记为出错 (可重试) 并换用新连接，而不是当作该行的永久失败
+            raise
+        if isinstance(e, DeadlineExceeded):
+            return False, f"错误: {e} 请在 AD 中确认用户 '{display_name}' 是否已创建。"
+        return False, f"错误: 与域控的连接中断 ({e})，请在 AD 中确认用户 '{display_name}' 是否已创建。"
     except Exception as e:
+        failed = True
         return False, f"发生意外错误: {e}"
     finally:
-        if not conn_external and conn and conn.bound:
-            conn.unbind()
+        if not conn_external and conn:
+            release_connection(conn, discard=failed)
 
 
-def get_ou_list():
-    """从 AD 获取所有组织单元 (OU) 列表"""
+def _read_role(namespace):
+    """
+    写后读一致性：该类对象刚被写入 (如 create_ou_if_not_exists 新建了 OU) 时，
+    读域控可能尚未完成复制，在 READ_YOUR_WRITES_SECONDS 内改从写域控读取。
+    """
+    return 'write' if invalidated_within(namespace, CONFIG.get('READ_YOUR_WRITES_SECONDS', 120)) else 'read'
+
+
+def _fetch_ou_list(bind_username, bind_password, region_filter):
+    """连接域控拉取 OU 列表并按地区过滤，失败时抛出异常。"""
     ou_list = []
     conn = None
-    bind_username, bind_password = session.get('bind_username'), session.get('bind_password')
-    if not bind_username or not bind_password: return []
+    failed = True
     try:
-        tls_config = Tls(validate=ssl.CERT_NONE, version=ssl.PROTOCOL_TLS_CLIENT)
-        server = Server(CONFIG['DOMAIN_CONTROLLER_IP'], port=636, use_ssl=True, tls=tls_config)
-        conn = Connection(server, user=bind_username, password=bind_password, auto_bind=True)
-        if not conn.bound: return []
-        search_base = get_base_dn(CONFIG['DOMAIN_NAME'])
-        conn.search(search_base, '(objectClass=organizationalUnit)', SUBTREE, attributes=['distinguishedName'])
-        for entry in conn.entries: ou_list.append(str(entry.distinguishedName))
-    except Exception as e:
-        print(f"Error fetching OU list: {e}")
+        with lane('refresh'):  # 缓存刷新排在交互操作之后、批量任务之前
+            conn = acquire_connection(bind_username, bind_password, 'get_ou_list', role=_read_role('ou'))
+            if not conn.bound: raise ConnectionError(f"LDAP 认证失败: {conn.result}")
+            search_base = get_base_dn(CONFIG['DOMAIN_NAME'])
+            conn.search(search_base, '(objectClass=organizationalUnit)', SUBTREE, attributes=['distinguishedName'])
+            for entry in conn.entries: ou_list.append(str(entry.distinguishedName))
+        failed = False
     finally:
-        if conn and conn.bound: conn.unbind()
-    # 使用全局配置过滤 OU
-    region_filter = CONFIG.get('ACTIVE_REGION_CODE', 'all')
-    
+        if conn: release_connection(conn, discard=failed)
+
     # 查找匹配的配置项
     selected_region_config = next((item for item in CONFIG.get('REGION_OPTIONS', []) if item["code"] == region_filter), None)
 
@@ -172,26 +370,89 @@ def get_ou_list():
         # 只要 DN 中包含任意一个关键词即保留
         ou_list = [dn for dn in ou_list if any(k in dn for k in keywords)]
 
-    return sorted(list(set(ou_list)))
+    return ou_list
 
 
-def get_group_list():
-    """从 AD 获取所有安全组列表"""
+def _ou_cache_key(region_filter):
+    return cache_key(CONFIG['DOMAIN_NAME'], region_filter, 'ou')
+
+
+def _group_cache_key():
+    # 安全组不按地区过滤，地区部分固定为 '*'
+    return cache_key(CONFIG['DOMAIN_NAME'], '*', 'group')
+
+
+def _to_dn_store(dn_list):
+    """去重、排序并转换为紧凑的 DNStore，只在缓存填充时执行一次"""
+    return DNStore(dn_list, get_base_dn(CONFIG['DOMAIN_NAME']))
+
+
+def _stale_fallback(key, error, what):
+    """拉取失败时返回上一次成功拉取的列表，并在页面上提示数据时间；从未拉取过时返回空列表"""
+    print(f"Error fetching {what}: {error}")
+    stale = get_stale(key, decode=_to_dn_store)
+    if stale is None:
+        return DNStore()
+    value, fetched_at = stale
+    g.directory_stale_notice = (f"无法连接域控，OU/安全组列表为缓存数据 "
+                                f"(数据截至 {datetime.fromtimestamp(fetched_at):%Y-%m-%d %H:%M})。")
+    return value
+
+
+def get_ou_list():
+    """从 AD 获取所有组织单元 (OU)，返回 DNStore；并发请求共享同一次拉取"""
+    bind_username, bind_password = session.get('bind_username'), session.get('bind_password')
+    if not bind_username or not bind_password: return DNStore()
+    # 使用全局配置过滤 OU
+    region_filter = CONFIG.get('ACTIVE_REGION_CODE', 'all')
+    key = _ou_cache_key(region_filter)
+    try:
+        return get_or_fetch(key, lambda: _fetch_ou_list(bind_username, bind_password, region_filter),
+                            decode=_to_dn_store)
+    except Exception as e:
+        return _stale_fallback(key, e, 'OU list')
+
+
+def _fetch_group_list(bind_username, bind_password):
+    """连接域控拉取安全组列表，失败时抛出异常。"""
     group_list = []
     conn = None
+    failed = True
+    try:
+        with lane('refresh'):  # 缓存刷新排在交互操作之后、批量任务之前
+            conn = acquire_connection(bind_username, bind_password, 'get_group_list', role=_read_role('group'))
+            if not conn.bound: raise ConnectionError(f"LDAP 认证失败: {conn.result}")
+            search_base = get_base_dn(CONFIG['DOMAIN_NAME'])
+            conn.search(search_base, '(&(objectClass=group)(groupType:1.2.840.113556.1.4.803:=-2147483648))',
+                        SUBTREE, attributes=['distinguishedName'])
+            for entry in conn.entries: group_list.append(str(entry.distinguishedName))
+        failed = False
+    finally:
+        if conn: release_connection(conn, discard=failed)
+    return group_list
+
+
+def get_group_list():
+    """从 AD 获取所有安全组，返回 DNStore；并发请求共享同一次拉取"""
     bind_username, bind_password = session.get('bind_username'), session.get('bind_password')
-    if not bind_username or not bind_password: return []
+    if not bind_username or not bind_password: return DNStore()
+    key = _group_cache_key()
     try:
-        tls_config = Tls(validate=ssl.CERT_NONE, version=ssl.PROTOCOL_TLS_CLIENT)
-        server = Server(CONFIG['DOMAIN_CONTROLLER_IP'], port=636, use_ssl=True, tls=tls_config)
-        conn = Connection(server, user=bind_username, password=bind_password, auto_bind=True)
-        if not conn.bound: return []
-        search_base = get_base_dn(CONFIG['DOMAIN_NAME'])
-        conn.search(search_base, '(&(objectClass=group)(groupType:1.2.840.113556.1.4.803:=-2147483648))', SUBTREE,
-                    attributes=['distinguishedName'])
-        for entry in conn.entries: group_list.append(str(entry.distinguishedName))
+        return get_or_fetch(key, lambda: _fetch_group_list(bind_username, bind_password), decode=_to_dn_store)
     except Exception as e:
-        print(f"Error fetching group list: {e}")
-    finally:
-        if conn and conn.bound: conn.unbind()
-    return sorted(list(set(group_list)))
\ No newline at end of file
+        return _stale_fallback(key, e, 'group list')
+
+
+def preload_directory_snapshot(bind_username, bind_password):
+    """
+    在 fork 之前 (gunicorn --preload) 预热 OU/安全组快照、已编译规则和职位数据。
+    worker 以写时复制方式共享这些只读数据，首个请求无需再访问域控。
+    """
+    region_filter = CONFIG.get('ACTIVE_REGION_CODE', 'all')
+    ou_list = get_or_fetch(_ou_cache_key(region_filter),
+                           lambda: _fetch_ou_list(bind_username, bind_password, region_filter), decode=_to_dn_store)
+    group_list = get_or_fetch(_group_cache_key(), lambda: _fetch_group_list(bind_username, bind_password),
+                              decode=_to_dn_store)
+    get_compiled_rules()
+    get_cached_positions()
+    return len(ou_list), len(group_list)
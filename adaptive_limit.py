@@ -0,0 +1,56 @@
+# /adaptive_limit.py
+"""
+AIMD (加性增、乘性减) 并发上限，用于批量导入、同步等后台通道。
+  - 每收集 window 个操作的耗时计算一次 p95：p95 不超过基线的 tolerance 倍 (延迟没有随并发上升) 时上限 +1，
+    否则保持不变
+  - 域控返回 busy (51)、unavailable (52) 或操作超时时上限立即乘以 backoff；
+    cooldown 秒内只减一次，避免同一时刻在途的多个操作连续把上限压到最低
+基线取观察到的最低 p95；延迟处于平稳区间时缓慢向当前值靠拢，以适应域控负载的长期变化。
+"""
+import math
+import time
+import threading
+
+# 表示域控过载的结果：busy、unavailable、超时
+OVERLOAD_RESULTS = {51, 52, 'timeout'}
+
+
+class AIMDLimit:
+    def __init__(self, initial=2, min_limit=1, max_limit=12, window=20, tolerance=1.5, backoff=0.5, cooldown=1.0):
+        self.limit = max(min_limit, min(initial, max_limit))
+        self.min_limit, self.max_limit = min_limit, max_limit
+        self.window, self.tolerance, self.backoff, self.cooldown = window, tolerance, backoff, cooldown
+        self.baseline = None
+        self._samples = []
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration, outcome):
+        """记录一次操作的耗时和结果，返回调整后的上限；上限未变化时返回 None"""
+        with self._lock:
+            if outcome in OVERLOAD_RESULTS:
+                now = time.monotonic()
+                if now - self._last_decrease < self.cooldown:
+                    return None
+                self._last_decrease = now
+                self._samples.clear()  # 过载前的延迟样本已不能代表当前状态
+                return self._set(max(self.min_limit, math.floor(self.limit * self.backoff)))
+
+            self._samples.append(duration)
+            if len(self._samples) < self.window:
+                return None
+            samples, self._samples = sorted(self._samples), []
+            p95 = samples[math.ceil(len(samples) * 0.95) - 1]
+            if self.baseline is None or p95 < self.baseline:
+                self.baseline = p95
+            if p95 <= self.baseline * self.tolerance:
+                self.baseline += (p95 - self.baseline) * 0.05
+                return self._set(min(self.max_limit, self.limit + 1))
+            return None
+
+    def _set(self, limit):
+        # 调用方持有锁
+        if limit == self.limit:
+            return None
+        self.limit = limit
+        return limit
@@ -0,0 +1,324 @@
+# /audit.py
+"""
+目录写操作审计日志。
+每次 add/modify/delete/modify_dn 记录一行 JSON (NDJSON) 到 AUDIT_DIR/audit.jsonl：
+操作人、操作类型、DN、LDAP 结果码、耗时和修改的属性 (密码等敏感属性只记录属性名)。
+
+写入经由后台线程批量完成：调用方只是把条目放进队列，
+写线程每 AUDIT_FLUSH_INTERVAL 秒最多 fsync 一次，批量创建上万行也不会逐行同步落盘。
+日志文件超过 AUDIT_MAX_BYTES 后轮转为 audit.jsonl.1 ... audit.jsonl.N。
+同时写入 SQLite 索引 (audit_index.sqlite3)，按 DN、名称、操作人查询无需扫描日志文件；
+轮转时删除早于最旧日志文件的索引记录，索引与保留的日志范围一致；索引丢失时会从现有日志文件重建。
+操作人统一记录为小写账号名 (见 operator_name)：页面操作、后台批量任务和命令行工具使用同一账号时可以一起查到。
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from flask import has_request_context, session, g
+from utils import CONFIG
+from dn_utils import normalize_dn, parse_dn, rdn_value
+
+try:
+    import fcntl  # 仅在类 Unix 系统上可用，用于多个 worker 之间串行化写入和轮转
+except ImportError:
+    fcntl = None
+
+AUDIT_DIR = CONFIG.get('AUDIT_DIR', 'logs')
+AUDIT_FILE = os.path.join(AUDIT_DIR, 'audit.jsonl')
+AUDIT_INDEX = os.path.join(AUDIT_DIR, 'audit_index.sqlite3')
+AUDIT_MAX_BYTES = CONFIG.get('AUDIT_MAX_BYTES', 100 * 1024 * 1024)
+AUDIT_BACKUP_COUNT = CONFIG.get('AUDIT_BACKUP_COUNT', 10)
+AUDIT_FLUSH_INTERVAL = CONFIG.get('AUDIT_FLUSH_INTERVAL', 0.5)
+AUDIT_BATCH_SIZE = 5000
+
+# 只记录属性名、不记录值的属性
+SENSITIVE_ATTRIBUTES = {'unicodepwd', 'userpassword', 'ntpwdhistory', 'lmpwdhistory'}
+
+_queue = queue.Queue()
+_wake = threading.Event()
+_writer = {'pid': None, 'thread': None}
+_writer_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    operator TEXT,
+    operation TEXT,
+    dn TEXT,
+    dn_norm TEXT,
+    name TEXT,
+    result INTEGER,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audit_dn ON audit (dn_norm, ts);
+CREATE INDEX IF NOT EXISTS audit_name ON audit (name, ts);
+CREATE INDEX IF NOT EXISTS audit_operator ON audit (operator, ts);
+CREATE INDEX IF NOT EXISTS audit_ts ON audit (ts);
+"""
+
+
+def operator_name(user):
+    """绑定账号的各种写法 (user@domain、DOMAIN\\user、DN) -> 小写账号名；api:<客户端> 保持不变"""
+    if not user or user.startswith('api:'):
+        return user or ''
+    if '\\' in user:
+        user = user.split('\\', 1)[1]
+    elif '@' in user:
+        user = user.split('@', 1)[0]
+    elif '=' in user:
+        rdns = parse_dn(user)
+        user = rdn_value(rdns[0]) if rdns else user
+    return user.lower()
+
+
+def _current_operator(fallback):
+    # 后台批量任务和命令行工具没有请求上下文，fallback 为连接的绑定账号
+    if has_request_context():
+        if g.get('api_client'):
+            return f"api:{g.api_client}"
+        return operator_name(session.get('bind_username') or fallback)
+    return operator_name(fallback)
+
+
+def _describe_values(attribute, values):
+    if attribute.lower() in SENSITIVE_ATTRIBUTES:
+        return '***'
+    if not isinstance(values, (list, tuple, set)):
+        values = [values]
+    return [v.decode('utf-8', errors='replace') if isinstance(v, bytes) else str(v) for v in values]
+
+
+def describe_changes(operation, args, kwargs):
+    """从 ldap3 调用参数中提取 (DN, 变更摘要)"""
+    dn = args[0] if args else kwargs.get('dn')
+    changes = None
+    if operation == 'add':
+        attributes = dict(args[2] if len(args) > 2 else kwargs.get('attributes') or {})
+        object_class = args[1] if len(args) > 1 else kwargs.get('object_class')
+        if object_class:
+            attributes.setdefault('objectClass', object_class)
+        changes = {attr: _describe_values(attr, values) for attr, values in attributes.items()}
+    elif operation == 'modify':
+        changes = {}
+        for attr, change in (args[1] if len(args) > 1 else kwargs.get('changes') or {}).items():
+            # ldap3 接受 (操作, 值列表) 或 [(操作, 值列表), ...]
+            items = [change] if change and isinstance(change[0], str) else change
+            changes[attr] = [[op, _describe_values(attr, values)] for op, values in items]
+    elif operation == 'modify_dn':
+        changes = {'relative_dn': args[1] if len(args) > 1 else kwargs.get('relative_dn'),
+                   'new_superior': args[3] if len(args) > 3 else kwargs.get('new_superior')}
+    return dn, changes
+
+
+def record(operation, dn, result, duration, operator=None, description=None, changes=None):
+    """记录一次写操作，只入队不做 IO"""
+    now = time.time()
+    entry = {
+        'time': datetime.fromtimestamp(now).astimezone().isoformat(timespec='milliseconds'),
+        'ts': now,
+        'operator': _current_operator(operator),
+        'operation': operation,
+        'dn': dn,
+        'result': result,
+        'description': description,
+        'duration_ms': round(duration * 1000, 1),
+        'changes': changes,
+    }
+    _ensure_writer()
+    _queue.put(entry)
+
+
+def _ensure_writer():
+    # fork 之后子进程中没有写线程，按 pid 判断是否需要重新启动
+    if _writer['pid'] == os.getpid():
+        return
+    with _writer_lock:
+        if _writer['pid'] != os.getpid():
+            thread = threading.Thread(target=_writer_loop, name='audit-writer', daemon=True)
+            thread.start()
+            _writer.update(pid=os.getpid(), thread=thread)
+
+
+def _writer_loop():
+    index = None
+    while True:
+        batch = [_queue.get()]
+        while len(batch) < AUDIT_BATCH_SIZE:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            index = _write_batch(batch, index)
+        except Exception as e:
+            print(f"ERROR: Failed to write {len(batch)} audit entries: {e}")
+            index = None
+        for _ in batch:
+            _queue.task_done()
+        # 限制落盘频率：间隔期内到达的条目会合并到下一批；flush() 可立即唤醒
+        _wake.wait(AUDIT_FLUSH_INTERVAL)
+        _wake.clear()
+
+
+@contextmanager
+def _file_lock():
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(AUDIT_DIR, 'audit.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _log_files():
+    """现有日志文件，从最旧到最新"""
+    rotated = [f"{AUDIT_FILE}.{i}" for i in range(AUDIT_BACKUP_COUNT, 0, -1)]
+    return [path for path in rotated + [AUDIT_FILE] if os.path.exists(path)]
+
+
+def _rotate_if_needed(incoming_bytes):
+    """需要时轮转日志文件，返回是否发生了轮转"""
+    try:
+        size = os.path.getsize(AUDIT_FILE)
+    except FileNotFoundError:
+        return False
+    if size == 0 or size + incoming_bytes <= AUDIT_MAX_BYTES:
+        return False
+    for i in range(AUDIT_BACKUP_COUNT - 1, 0, -1):
+        if os.path.exists(f"{AUDIT_FILE}.{i}"):
+            os.replace(f"{AUDIT_FILE}.{i}", f"{AUDIT_FILE}.{i + 1}")
+    os.replace(AUDIT_FILE, f"{AUDIT_FILE}.1")
+    return True
+
+
+def _oldest_retained_ts():
+    """仍保留的最旧日志文件中第一条记录的时间戳；没有可读的记录时返回 None"""
+    for path in _log_files():
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    return json.loads(line)['ts']
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+    return None
+
+
+def _prune_index(index):
+    """删除日志文件已被轮转删除的索引记录，索引大小随日志保留量而不是总记录数增长"""
+    oldest = _oldest_retained_ts()
+    if oldest is not None:
+        index.execute("DELETE FROM audit WHERE ts < ?", (oldest,))
+
+
+def _index_row(entry):
+    dn = entry.get('dn') or ''
+    rdns = parse_dn(dn)
+    name = rdn_value(rdns[0]).lower() if rdns else ''
+    return (entry['ts'], operator_name(entry.get('operator')), entry.get('operation'), dn,
+            normalize_dn(dn) if dn else '', name, entry.get('result') if isinstance(entry.get('result'), int) else None,
+            json.dumps(entry, ensure_ascii=False))
+
+
+def _insert(index, entries):
+    index.executemany("INSERT INTO audit (ts, operator, operation, dn, dn_norm, name, result, entry) "
+                      "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [_index_row(e) for e in entries])
+
+
+def _open_index():
+    index = sqlite3.connect(AUDIT_INDEX, timeout=30)
+    index.execute('PRAGMA journal_mode=WAL')
+    index.executescript(_SCHEMA)
+    return index
+
+
+def _rebuild_index(index):
+    """索引文件丢失时 (首次启用或被删除) 从现有日志文件重建"""
+    count = 0
+    for path in _log_files():
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = []
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+            _insert(index, entries)
+            count += len(entries)
+    index.commit()
+    if count:
+        print(f"INFO: Rebuilt audit index from {count} log entries.")
+
+
+def _write_batch(batch, index):
+    os.makedirs(AUDIT_DIR, exist_ok=True)
+    data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in batch).encode('utf-8')
+    with _file_lock():
+        rotated = _rotate_if_needed(len(data))
+        with open(AUDIT_FILE, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if index is None or not os.path.exists(AUDIT_INDEX):
+            missing = not os.path.exists(AUDIT_INDEX)
+            index = _open_index()
+            if missing:
+                _rebuild_index(index)  # 已包含刚写入的这一批
+                return index
+        if rotated:
+            _prune_index(index)
+        _insert(index, batch)
+        index.commit()
+    return index
+
+
+def flush(timeout=5.0):
+    """等待队列中的条目全部落盘 (进程退出、命令行工具结束时调用)"""
+    if _writer['pid'] != os.getpid():
+        return True
+    _wake.set()
+    with _queue.all_tasks_done:
+        return _queue.all_tasks_done.wait_for(lambda: not _queue.unfinished_tasks, timeout)
+
+
+atexit.register(flush)
+
+
+def search(dn=None, name=None, operator=None, operation=None, limit=200):
+    """
+    查询审计记录，按时间倒序。
+    dn 为完整 DN 时精确匹配 (大小写无关)；name 按 RDN 值前缀匹配 (如登录显示名 '张')；
+    operator 按账号名精确匹配，user@domain、DOMAIN\\user 等写法均可。
+    """
+    if not os.path.exists(AUDIT_INDEX):
+        return []
+    clauses, params = [], []
+    if dn:
+        clauses.append('dn_norm = ?')
+        params.append(normalize_dn(dn))
+    if name:
+        # 前缀匹配写成范围查询才能使用索引
+        clauses.append('name >= ? AND name < ?')
+        params.extend([name.lower(), name.lower() + '\uffff'])
+    if operator:
+        clauses.append('operator = ?')
+        params.append(operator_name(operator))
+    if operation:
+        clauses.append('operation = ?')
+        params.append(operation)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    index = sqlite3.connect(AUDIT_INDEX, timeout=30)
+    try:
+        rows = index.execute(f"SELECT entry FROM audit {where} ORDER BY ts DESC LIMIT ?", params + [limit]).fetchall()
+    finally:
+        index.close()
+    return [json.loads(row[0]) for row in rows]
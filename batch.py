@@ -0,0 +1,218 @@
+# /batch.py
+"""
+批量创建用户。
+CSV 各行由多个工作线程并发处理，每个线程持有一个连接池连接；
+实际同时在途的 LDAP 操作数由 scheduler 的 batch 通道决定 (AIMD 按域控延迟和 busy/unavailable 结果调整)，
+线程数只是上限。run_batch 的结果按行号顺序返回，与逐行处理时一致；
+stream_batch 边读边处理，按完成顺序产出结果，用于流式的批量接口。
+"""
+import csv
+import io
+import time
+import queue
+import threading
+import contextvars
+from ldap3 import ALL
+from utils import CONFIG
+from ad_utils import create_ad_user, get_cached_positions, acquire_connection, release_connection
+from ldap_metrics import BATCHES, BATCH_ROWS, BATCH_SECONDS
+from scheduler import lane, LDAP_BATCH_MAX_IN_FLIGHT
+
+BATCH_WORKERS = CONFIG.get('BATCH_WORKERS', LDAP_BATCH_MAX_IN_FLIGHT)
+
+
+def parse_csv(data):
+    """CSV 文件内容 (bytes) -> [(行号, 列列表), ...]，跳过表头"""
+    reader = csv.reader(io.StringIO(data.decode('UTF-8'), newline=None))
+    next(reader, None)
+    return list(enumerate(reader, 2))
+
+
+def _process_row(conn, bind_username, bind_password, line_no, row, dry_run=False):
+    """处理一行，返回 (结果说明, 结果分类)"""
+    if len(row) < 3:
+        return f"第 {line_no} 行: 格式错误，至少需要 姓名,登录名,OU路径 三列。", 'skipped'
+
+    display_name, username, ou_path = row[0].strip(), row[1].strip(), row[2].strip()
+    position_name = row[3].strip() if len(row) > 3 and row[3] else None
+
+    if not all([display_name, username, ou_path]):
+        return f"第 {line_no} 行 ({display_name}): 跳过，姓名、登录名或 OU 路径为空。", 'skipped'
+
+    groups_to_add = list(get_cached_positions().get(position_name, []))  # 复制一份，避免修改缓存
+
+    success, message = create_ad_user(
+        domain_controller_ip=CONFIG['DOMAIN_CONTROLLER_IP'],
+        bind_username=bind_username, bind_password=bind_password,
+        username=username, display_name=display_name,
+        password=CONFIG['DEFAULT_USER_PASSWORD'], ou_path=ou_path, domain_name=CONFIG['DOMAIN_NAME'],
+        position_name=position_name, groups_to_add=groups_to_add,
+        conn_external=conn, dry_run=dry_run
+    )
+    result_prefix = "✅ 成功" if success else "❌ 失败"
+    return f"第 {line_no} 行 [{display_name}]: {result_prefix} - {message}", 'success' if success else 'failure'
+
+
+def _worker(rows, results, bind_username, bind_password, dry_run, on_result, process):
+    """从 rows 队列取一组行 [(行号, 列列表), ...] 按顺序处理，取到 None 时退出；results 为 None 时不保留结果 (流式处理)"""
+    conn = None
+    try:
+        with lane('batch'):
+            while True:
+                unit = rows.get()
+                if unit is None:
+                    return
+                for line_no, row in unit:
+                    try:
+                        if row is None:
+                            message, outcome = f"第 {line_no} 行: 无法解析的记录。", 'skipped'
+                        else:
+                            if conn is None or conn.closed:
+                                if conn is not None:
+                                    release_connection(conn, discard=True)
+                                conn = acquire_connection(bind_username, bind_password, 'batch_create',
+                                                          get_info=ALL)
+                            message, outcome = process(conn, bind_username, bind_password, line_no, row, dry_run)
+                    except Exception as e:
+                        # 包括连接中断和超时：记为出错而不是失败，重新运行时会重试该行；连接可能已不可用，换一个
+                        message, outcome = f"第 {line_no} 行: 处理时发生意外错误 - {e}", 'error'
+                        if conn is not None:
+                            release_connection(conn, discard=True)
+                            conn = None
+                    if results is not None:
+                        results[line_no] = message
+                    if not dry_run:
+                        BATCH_ROWS.inc(outcome)
+                    if on_result is not None:
+                        on_result(line_no, row, message, outcome)
+    finally:
+        if conn is not None:
+            release_connection(conn, discard=conn.closed)
+
+
+def _start_workers(count, pending, results, bind_username, bind_password, dry_run, on_result, process,
+                   on_exit=None):
+    threads = []
+    for _ in range(count):
+        # 每个线程使用调用方上下文的独立副本 (请求截止时间、Server-Timing 统计等)
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(_run_worker, on_exit, pending, results, bind_username,
+                                                            bind_password, dry_run, on_result, process),
+                                  name='batch-worker', daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def _run_worker(on_exit, *args):
+    try:
+        _worker(*args)
+    finally:
+        if on_exit is not None:
+            on_exit()
+
+
+def _group_rows(rows, key):
+    """按 key(列列表) 把行分组，组内保持原顺序、组按首次出现的顺序排列；key 为 None 或返回 None 的行单独成组"""
+    units, by_key = [], {}
+    for line_no, row in rows:
+        unit_key = key(row) if key is not None and row is not None else None
+        if unit_key is None:
+            units.append([(line_no, row)])
+        elif unit_key in by_key:
+            by_key[unit_key].append((line_no, row))
+        else:
+            by_key[unit_key] = [(line_no, row)]
+            units.append(by_key[unit_key])
+    return units
+
+
+def run_batch(rows, bind_username, bind_password, workers=None, dry_run=False, on_result=None, process=None,
+              key=None):
+    """
+    并发处理 [(行号, 列列表), ...]，返回按行号排序的结果说明列表。
+    on_result(行号, 列列表, 结果说明, 结果分类) 在每行处理完后由工作线程调用 (需自行保证线程安全)，
+    结果分类为 'success' / 'failure' / 'skipped' / 'error'。
+    process(连接, 绑定用户名, 绑定密码, 行号, 列列表, dry_run) 处理一行并返回 (结果说明, 结果分类)，
+    默认创建用户；其他批量操作 (如 lifecycle) 传入自己的处理函数，共用连接池和并发控制。
+    key(列列表) 返回相同值的行 (如同一账号的多个操作) 由同一个工作线程按行号顺序依次处理，不会并发执行。
+    """
+    batch_start = time.perf_counter()
+    units = _group_rows(rows, key)
+    count = max(1, min(workers or BATCH_WORKERS, len(units)))
+    pending = queue.Queue()
+    for unit in units:
+        pending.put(unit)
+    for _ in range(count):
+        pending.put(None)
+    results = {}
+    threads = _start_workers(count, pending, results, bind_username, bind_password, dry_run, on_result,
+                             process or _process_row)
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        BATCHES.inc()
+        BATCH_SECONDS.inc(amount=time.perf_counter() - batch_start)
+    return [results[line_no] for line_no, _ in rows if line_no in results]
+
+
+def stream_batch(rows, bind_username, bind_password, workers=None, dry_run=False, process=None):
+    """
+    边读边处理：rows 可以是逐条产出 (行号, 列列表) 的迭代器 (如逐行解析的请求体)，列列表为 None 表示无法解析。
+    按完成顺序产出 (行号, 列列表, 结果说明, 结果分类)。
+    待处理队列和结果队列都有界：调用方不取结果时工作线程等待，读取随之暂停，内存占用与总行数无关。
+    因此 rows 不能依赖调用方先取走结果才能继续产出 (如发完请求体才读响应的 HTTP 客户端)，
+    这种输入应先读完 (见 api.bulk_create_users 的临时文件)。
+    调用方提前关闭生成器 (如客户端断开) 时停止读取，已开始的行处理完后工作线程退出。
+    """
+    batch_start = time.perf_counter()
+    count = max(1, workers or BATCH_WORKERS)
+    pending = queue.Queue(maxsize=count * 2)
+    finished = queue.Queue(maxsize=count * 2)
+    cancelled = threading.Event()
+
+    def put(target, item):
+        """放入有界队列；等待期间生成器被关闭时放弃，返回是否已放入"""
+        while not cancelled.is_set():
+            try:
+                target.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed():
+        try:
+            for item in rows:
+                if not put(pending, [item]):
+                    break
+        except Exception as e:
+            print(f"ERROR: 读取批量数据时出错: {e}")
+        finally:
+            if cancelled.is_set():
+                while True:  # 丢弃尚未开始的行
+                    try:
+                        pending.get_nowait()
+                    except queue.Empty:
+                        break
+            for _ in range(count):
+                pending.put(None)
+
+    feeder = threading.Thread(target=contextvars.copy_context().run, args=(feed,), name='batch-feeder', daemon=True)
+    feeder.start()
+    _start_workers(count, pending, None, bind_username, bind_password, dry_run,
+                   on_result=lambda *result: put(finished, result), process=process or _process_row,
+                   on_exit=lambda: put(finished, None))
+    running = count
+    try:
+        while running:
+            result = finished.get()
+            if result is None:
+                running -= 1
+            else:
+                yield result
+    finally:
+        cancelled.set()
+        BATCHES.inc()
+        BATCH_SECONDS.inc(amount=time.perf_counter() - batch_start)
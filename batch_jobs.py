@@ -0,0 +1,285 @@
+# /batch_jobs.py
+"""
+后台批量任务与实时进度 (Server-Sent Events)。
+页面上传 CSV 后任务在后台线程中运行 (batch.run_batch)，页面通过 SSE 订阅进度，无需轮询。
+
+任务状态保存在 BATCH_JOBS_DIR 中，任何 worker 进程都能推送进度，不要求与运行任务的进程相同：
+  - <任务ID>.json   状态快照 (计数、状态、更新时间)，每 BATCH_EVENT_INTERVAL 秒最多原子替换一次
+  - <任务ID>.ndjson 每行一个处理结果，追加写入
+  - <任务ID>.input.json 解析后的 CSV 行，用于继续已中断的任务
+SSE 每个周期最多推送一个 progress 事件，包含计数和自上次以来新完成的行 (最多 BATCH_EVENT_MAX_ROWS 行，
+其余留到下一个事件)。事件 ID 是结果文件的读取位置，浏览器断线重连时从该位置继续。
+
+每个打开的 SSE 连接在 gthread worker 中占用一个线程。为了不挤占交互请求，每个 worker 进程最多同时保持
+BATCH_SSE_MAX_STREAMS 个连接，每个连接最长 BATCH_SSE_MAX_SECONDS 秒后关闭，由浏览器带着事件 ID 自动重连；
+超出上限的连接只返回一次当前进度并立即关闭，浏览器 BATCH_SSE_BUSY_RETRY_MS 毫秒后重连 (相当于轮询)。
+
+运行任务的进程退出 (重启、发布) 后快照不再更新，超过 BATCH_JOB_STALE_SECONDS 的任务视为已中断 (lost)。
+已中断的任务可以继续 (resume_job)：跳过结果文件中已成功的行，其余行重新处理，结果追加到同一任务。
+"""
+import os
+import json
+import time
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from utils import CONFIG
+from batch import run_batch
+
+try:
+    import fcntl  # 仅在类 Unix 系统上可用，用于多个 worker 之间串行化继续任务的操作
+except ImportError:
+    fcntl = None
+
+BATCH_JOBS_DIR = CONFIG.get('BATCH_JOBS_DIR', 'batch_jobs')
+BATCH_EVENT_INTERVAL = CONFIG.get('BATCH_EVENT_INTERVAL', 0.25)
+BATCH_EVENT_MAX_ROWS = CONFIG.get('BATCH_EVENT_MAX_ROWS', 500)
+BATCH_JOB_STALE_SECONDS = CONFIG.get('BATCH_JOB_STALE_SECONDS', 60)
+BATCH_JOB_RETENTION = CONFIG.get('BATCH_JOB_RETENTION', 7 * 24 * 3600)
+BATCH_SSE_MAX_STREAMS = CONFIG.get('BATCH_SSE_MAX_STREAMS', 2)
+BATCH_SSE_MAX_SECONDS = CONFIG.get('BATCH_SSE_MAX_SECONDS', 30)
+BATCH_SSE_BUSY_RETRY_MS = CONFIG.get('BATCH_SSE_BUSY_RETRY_MS', 5000)
+SSE_KEEPALIVE_SECONDS = 15
+
+FINISHED_STATES = ('done', 'failed', 'lost')
+
+# 本进程中正在推送的 SSE 连接数上限
+_stream_slots = threading.BoundedSemaphore(BATCH_SSE_MAX_STREAMS)
+
+
+def _paths(job_id):
+    base = os.path.join(BATCH_JOBS_DIR, job_id)
+    return base + '.json', base + '.ndjson'
+
+
+def _input_path(job_id):
+    return os.path.join(BATCH_JOBS_DIR, job_id + '.input.json')
+
+
+def valid_job_id(job_id):
+    return len(job_id) == 16 and all(c in '0123456789abcdef' for c in job_id)
+
+
+def _write_snapshot(path, snapshot):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)  # 原子替换，其他 worker 不会读到半个文件
+
+
+def load_job(job_id):
+    """任务状态快照；任务不存在时返回 None。运行任务的进程已退出时状态改为 lost"""
+    if not valid_job_id(job_id):
+        return None
+    try:
+        with open(_paths(job_id)[0], 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if snapshot['state'] == 'running' and time.time() - snapshot['updated_at'] > BATCH_JOB_STALE_SECONDS:
+        snapshot['state'] = 'lost'
+    return snapshot
+
+
+def _purge_expired():
+    cutoff = time.time() - BATCH_JOB_RETENTION
+    for entry in os.scandir(BATCH_JOBS_DIR):
+        if entry.name.endswith(('.json', '.ndjson', '.lock')) and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def _file_lock(job_id):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(BATCH_JOBS_DIR, job_id + '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _Job:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.snapshot_path, self.events_path = _paths(snapshot['id'])
+        self._events = open(self.events_path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def on_result(self, line_no, row, message, outcome):
+        record = {'line': line_no, 'outcome': outcome, 'message': message}
+        with self._lock:
+            self._events.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._events.flush()
+            self.snapshot['counts'][outcome] += 1
+
+    def save(self):
+        with self._lock:
+            self.snapshot['updated_at'] = time.time()
+            snapshot = dict(self.snapshot, counts=dict(self.snapshot['counts']))
+        _write_snapshot(self.snapshot_path, snapshot)
+
+    def run(self, rows, bind_username, bind_password):
+        worker = threading.Thread(target=self._run_batch, args=(rows, bind_username, bind_password),
+                                  name='batch-job', daemon=True)
+        worker.start()
+        # 按固定周期写快照：合并同一周期内完成的行，同时作为任务仍在运行的心跳
+        while worker.is_alive():
+            worker.join(BATCH_EVENT_INTERVAL)
+            self.save()
+        self._events.close()
+        self.save()
+
+    def _run_batch(self, rows, bind_username, bind_password):
+        try:
+            run_batch(rows, bind_username, bind_password, on_result=self.on_result)
+            state, error = 'done', None
+        except Exception as e:
+            print(f"ERROR: 批量任务 {self.snapshot['id']} 失败: {e}")
+            state, error = 'failed', str(e)
+        with self._lock:
+            self.snapshot['state'], self.snapshot['error'] = state, error
+
+
+def _launch(job, rows, bind_username, bind_password):
+    job.save()
+    # 使用新的上下文：任务比发起它的请求活得长，不能继承请求的截止时间和统计对象
+    thread = threading.Thread(target=contextvars.Context().run, args=(job.run, rows, bind_username, bind_password),
+                              name='batch-job-runner', daemon=True)
+    thread.start()
+
+
+def start_job(rows, bind_username, bind_password, operator, filename=None):
+    """在后台线程中处理 [(行号, 列列表), ...]，返回任务 ID"""
+    os.makedirs(BATCH_JOBS_DIR, exist_ok=True)
+    _purge_expired()
+    job_id = secrets.token_hex(8)
+    _write_snapshot(_input_path(job_id), rows)
+    now = time.time()
+    job = _Job({'id': job_id, 'operator': operator, 'filename': filename, 'total': len(rows),
+                'state': 'running', 'counts': {'success': 0, 'failure': 0, 'skipped': 0, 'error': 0},
+                'started_at': now, 'updated_at': now, 'error': None})
+    _launch(job, rows, bind_username, bind_password)
+    return job_id
+
+
+def _truncate_partial_line(path):
+    """进程在写结果时退出可能留下半行，继续追加前截掉，否则该行之后的结果都无法读取"""
+    try:
+        with open(path, 'rb+') as f:
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+    except FileNotFoundError:
+        pass
+
+
+def resume_job(job_id, bind_username, bind_password):
+    """
+    继续已中断 (lost) 的任务：跳过已成功的行，其余行重新处理，结果追加到同一任务。
+    返回 (是否已开始, 说明)；多个 worker 同时请求时只有一个会继续。
+    """
+    with _file_lock(job_id):
+        snapshot = load_job(job_id)
+        if snapshot is None or snapshot['state'] != 'lost':
+            return False, "只有已中断的任务可以继续。"
+        try:
+            with open(_input_path(job_id), 'r', encoding='utf-8') as f:
+                rows = [(line_no, row) for line_no, row in json.load(f)]
+        except FileNotFoundError:
+            return False, "该任务没有保存原始数据，无法继续。"
+
+        _, events_path = _paths(job_id)
+        _truncate_partial_line(events_path)
+        succeeded = {line for line, record in _last_outcomes(job_id).items() if record['outcome'] == 'success'}
+        remaining = [(line_no, row) for line_no, row in rows if line_no not in succeeded]
+        job = _Job(dict(snapshot, state='running', error=None, resumes=snapshot.get('resumes', 0) + 1,
+                        counts={'success': len(succeeded), 'failure': 0, 'skipped': 0, 'error': 0}))
+        _launch(job, remaining, bind_username, bind_password)
+    return True, f"继续处理剩余的 {len(remaining)} 行。"
+
+
+def _read_rows(events_path, offset):
+    """从 offset 开始读取最多 BATCH_EVENT_MAX_ROWS 条完整的结果，返回 (结果列表, 新的 offset)"""
+    rows = []
+    try:
+        with open(events_path, 'rb') as f:
+            f.seek(offset)
+            while len(rows) < BATCH_EVENT_MAX_ROWS:
+                line = f.readline()
+                if not line.endswith(b'\n'):  # 尚未写完的行留到下次读取
+                    break
+                rows.append(json.loads(line))
+                offset += len(line)
+    except FileNotFoundError:
+        pass
+    return rows, offset
+
+
+def _sse(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def job_events(job_id, offset=0):
+    """
+    SSE 事件流生成器：progress (计数 + 新完成的行)，任务结束时发送 end 事件并结束。
+    offset 为浏览器重连时带回的 Last-Event-ID。
+    本进程的 SSE 连接数已达上限时只推送一次当前进度就关闭，由浏览器稍后重连。
+    """
+    _, events_path = _paths(job_id)
+    streaming = _stream_slots.acquire(blocking=False)
+    try:
+        yield f"retry: {2000 if streaming else BATCH_SSE_BUSY_RETRY_MS}\n\n"
+        closes_at = time.monotonic() + (BATCH_SSE_MAX_SECONDS if streaming else 0)
+        last_sent = 0.0
+        last_counts = None
+        while True:
+            snapshot = load_job(job_id)
+            if snapshot is None:
+                yield _sse('end', {'state': 'missing'})
+                return
+            rows, offset = _read_rows(events_path, offset)
+            finished = snapshot['state'] in FINISHED_STATES
+            now = time.monotonic()
+            if rows or snapshot['counts'] != last_counts or now - last_sent >= SSE_KEEPALIVE_SECONDS:
+                yield _sse('progress', {'state': snapshot['state'], 'total': snapshot['total'],
+                                        'counts': snapshot['counts'], 'rows': rows}, offset)
+                last_sent, last_counts = now, snapshot['counts']
+            if finished and len(rows) < BATCH_EVENT_MAX_ROWS:
+                yield _sse('end', {'state': snapshot['state'], 'error': snapshot.get('error'),
+                                   'counts': snapshot['counts']}, offset)
+                return
+            if now >= closes_at:
+                return  # 释放线程，浏览器带着最后的事件 ID 重连
+            if len(rows) < BATCH_EVENT_MAX_ROWS:  # 积压较多时立即继续推送
+                time.sleep(BATCH_EVENT_INTERVAL)
+    finally:
+        if streaming:
+            _stream_slots.release()
+
+
+def _last_outcomes(job_id):
+    """每行最后一次的处理结果 {行号: 结果记录}；继续过的任务同一行可能有多条结果"""
+    offset, last = 0, {}
+    while True:
+        chunk, offset = _read_rows(_paths(job_id)[1], offset)
+        for row in chunk:
+            last[row['line']] = row
+        if len(chunk) < BATCH_EVENT_MAX_ROWS:
+            break
+    return last
+
+
+def job_report(job_id):
+    """任务全部结果说明 (按行号排序，每行取最后一次结果)，用于下载完整报告"""
+    last = _last_outcomes(job_id)
+    return [last[line]['message'] for line in sorted(last)]
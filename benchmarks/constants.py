@@ -0,0 +1,10 @@
+# /benchmarks/constants.py
+"""
+模拟域的名称和管理员账号。
+单独成模块、不依赖应用代码：prepare_workdir 需要在任何应用模块 (utils 在导入时读取当前目录的
+config.json) 导入之前用到它们，而 mock_ad 经 ldap_metrics 间接导入了 utils。
+"""
+BASE_DN = 'DC=bench,DC=local'
+DOMAIN_NAME = 'bench.local'
+ADMIN_DN = f'CN=bench-admin,CN=Users,{BASE_DN}'
+ADMIN_PASSWORD = 'Bench#Passw0rd'
@@ -0,0 +1,293 @@
+# /benchmarks/mock_ad.py
+"""
+基于 ldap3 MOCK_SYNC 的模拟 AD，提供与真实域控接近的语义：
+- 重复 DN 或重复 sAMAccountName 返回 68 (entryAlreadyExists)；
+- 搜索基准不存在返回 32 (noSuchObject)，存在但无匹配返回 0；
+- 支持 AD 的按位匹配规则 (1.2.840.113556.1.4.803 / 804)，用于安全组过滤；
+- 为常用的等值过滤条件和单层搜索建立索引，避免模拟器自身的线性扫描掩盖应用的开销；
+- 每种 LDAP 操作可注入固定延迟，模拟与域控之间的网络往返。
+"""
+import time
+import threading
+import ldap3.operation.search as ldap3_search
+from ldap3 import Server, MOCK_SYNC, OFFLINE_AD_2012_R2
+from ldap3.strategy.mockSync import MockSyncStrategy
+from ldap3.operation.search import parse_filter, ROOT, AND, MATCH_EQUAL, MATCH_EXTENSIBLE
+from ldap3.operation.add import add_request_to_dict
+from ldap3.operation.delete import delete_request_to_dict
+from ldap3.operation.modifyDn import modify_dn_request_to_dict
+from ldap3.utils.conv import to_unicode, to_raw
+from ldap3.utils.dn import safe_dn
+from ldap3.utils.ciDict import CaseInsensitiveDict
+from dn_utils import parent_dn
+from ldap_metrics import InstrumentedConnection
+from benchmarks.constants import BASE_DN, DOMAIN_NAME, ADMIN_DN, ADMIN_PASSWORD
+
+BITWISE_AND = '1.2.840.113556.1.4.803'
+BITWISE_OR = '1.2.840.113556.1.4.804'
+GLOBAL_SECURITY_GROUP = -2147483646  # 全局安全组 (0x80000002)
+GLOBAL_DISTRIBUTION_GROUP = 2
+
+RESULT_NO_SUCH_OBJECT = 32
+RESULT_ENTRY_ALREADY_EXISTS = 68
+
+# 建立等值索引的属性 (小写)
+INDEXED_ATTRIBUTES = ('samaccountname', 'objectclass', 'cn')
+
+_OBJECT_CLASSES = {
+    'domainDNS': [b'top', b'domain', b'domainDNS'],
+    'container': [b'top', b'container'],
+    'organizationalUnit': [b'top', b'organizationalUnit'],
+    'group': [b'top', b'group'],
+    'user': [b'top', b'person', b'organizationalPerson', b'user'],
+}
+
+
+def _matching_rule_assertion_to_string(assertion):
+    """
+    ldap3 2.9 把扩展匹配过滤器还原为字符串时只调用了 str()，
+    模拟服务器随后无法解析。这里按 RFC 4515 还原为 attr[:dn]:rule:=value。
+    """
+    attr = str(assertion['type']) if assertion['type'].isValue else ''
+    dn_attributes = ':dn' if assertion['dnAttributes'].isValue and bool(assertion['dnAttributes']) else ''
+    rule = ':' + str(assertion['matchingRule']) if assertion['matchingRule'].isValue else ''
+    return f"{attr}{dn_attributes}{rule}:={to_unicode(bytes(assertion['matchValue']))}"
+
+
+ldap3_search.matching_rule_assertion_to_string = _matching_rule_assertion_to_string
+
+
+def _to_uint32(value):
+    return int(to_unicode(value)) & 0xFFFFFFFF
+
+
+def _indexes(server):
+    if not hasattr(server, 'ad_index'):
+        server.ad_index = {attr: {} for attr in INDEXED_ATTRIBUTES}
+        server.ad_children = {}
+    return server.ad_index, server.ad_children
+
+
+class ADMockStrategy(MockSyncStrategy):
+    """在 MOCK_SYNC 之上补充 AD 语义、索引和延迟注入"""
+
+    def send(self, message_type, request, controls=None):
+        delay = getattr(self.connection.server, 'latency', {}).get(message_type)
+        if delay:
+            time.sleep(delay)
+        # 模拟目录和索引由所有连接共享，并发线程对它的读写需要串行化 (延迟在锁外，可以重叠)
+        with self.connection.server.ad_lock:
+            return super().send(message_type, request, controls)
+
+    def _index_entry(self, dn):
+        index, children = _indexes(self.connection.server)
+        entry = self.connection.server.dit[dn]
+        for attr in INDEXED_ATTRIBUTES:
+            for raw in entry.get(attr, ()):
+                index[attr].setdefault(to_unicode(raw).lower(), set()).add(dn)
+        children.setdefault(parent_dn(dn).lower(), set()).add(dn)
+
+    def _unindex_entry(self, dn):
+        index, children = _indexes(self.connection.server)
+        entry = self.connection.server.dit.get(dn)
+        if entry is None:
+            return
+        for attr in INDEXED_ATTRIBUTES:
+            for raw in entry.get(attr, ()):
+                index[attr].get(to_unicode(raw).lower(), set()).discard(dn)
+        children.get(parent_dn(dn).lower(), set()).discard(dn)
+
+    def add_entry(self, dn, attributes, validate=True):
+        added = super().add_entry(dn, attributes, validate)
+        if added and dn != 'cn=schema':
+            escaped_dn = safe_dn(dn)
+            # AD 为每个对象自动维护 distinguishedName
+            self.connection.server.dit[escaped_dn]['distinguishedName'] = [to_raw(escaped_dn)]
+            self._index_entry(escaped_dn)
+        return added
+
+    def seed_entry(self, dn, object_class, attributes):
+        """批量初始化用的快速路径：跳过 schema 校验直接写入目录"""
+        entry = CaseInsensitiveDict()
+        entry['objectClass'] = list(_OBJECT_CLASSES[object_class])
+        for attr, value in attributes.items():
+            entry[attr] = [to_raw(v) for v in value] if isinstance(value, list) else [to_raw(value)]
+        entry['distinguishedName'] = [to_raw(dn)]
+        entry['entryDN'] = [to_raw(dn)]
+        self.connection.server.dit[dn] = entry
+        self._index_entry(dn)
+
+    def remove_entry(self, dn):
+        self._unindex_entry(safe_dn(dn))
+        return super().remove_entry(dn)
+
+    def mock_add(self, request_message, controls):
+        request = add_request_to_dict(request_message)
+        for attr, values in request['attributes'].items():
+            if attr.lower() == 'samaccountname' and values:
+                index, _ = _indexes(self.connection.server)
+                if index['samaccountname'].get(to_unicode(values[0]).lower()):
+                    return {'resultCode': RESULT_ENTRY_ALREADY_EXISTS, 'matchedDN': '',
+                            'diagnosticMessage': '00000524: UpdErr: DSID-031A11E2, problem 6005 (ENTRY_EXISTS)',
+                            'referral': None}
+        return super().mock_add(request_message, controls)
+
+    def mock_delete(self, request_message, controls):
+        self._unindex_entry(safe_dn(delete_request_to_dict(request_message)['entry']))
+        return super().mock_delete(request_message, controls)
+
+    def mock_modify_dn(self, request_message, controls):
+        # 移动/重命名后按新 DN 重建索引 (MOCK_SYNC 直接改写目录，不经过 add_entry/remove_entry)
+        dn = safe_dn(modify_dn_request_to_dict(request_message)['entry'])
+        dit = self.connection.server.dit
+        before = set(dit)
+        self._unindex_entry(dn)
+        result = super().mock_modify_dn(request_message, controls)
+        for new_dn in set(dit) - before:
+            dit[new_dn]['distinguishedName'] = [to_raw(new_dn)]
+            self._index_entry(new_dn)
+            # AD 自动维护指向该对象的链接属性 (组的 member)
+            old_value = dn.lower()
+            for entry in dit.values():
+                members = entry.get('member')
+                if members and any(to_unicode(raw).lower() == old_value for raw in members):
+                    entry['member'] = [to_raw(new_dn) if to_unicode(raw).lower() == old_value else raw
+                                       for raw in members]
+        if dn in dit:
+            self._index_entry(dn)
+        return result
+
+    def evaluate_filter_node(self, node, candidates):
+        if node.tag != MATCH_EXTENSIBLE:
+            return super().evaluate_filter_node(node, candidates)
+        node.matched, node.unmatched = set(), set()
+        attr, rule = node.assertion['attr'], node.assertion['matchingRule']
+        mask = _to_uint32(node.assertion['value'])
+        dit = self.connection.server.dit
+        for candidate in candidates:
+            matched = False
+            if rule in (BITWISE_AND, BITWISE_OR) and attr in dit[candidate]:
+                for raw in dit[candidate][attr]:
+                    value = _to_uint32(raw)
+                    if (rule == BITWISE_AND and value & mask == mask) or (rule == BITWISE_OR and value & mask):
+                        matched = True
+            (node.matched if matched else node.unmatched).add(candidate)
+
+    def _indexed_candidates(self, filter_root):
+        node = filter_root.elements[0] if filter_root.tag == ROOT else filter_root
+        nodes = node.elements if node.tag == AND else [node]
+        index, _ = _indexes(self.connection.server)
+        best = None
+        for element in nodes:
+            if element.tag == MATCH_EQUAL and element.assertion['attr'].lower() in INDEXED_ATTRIBUTES:
+                found = index[element.assertion['attr'].lower()].get(to_unicode(element.assertion['value']).lower(), ())
+                if best is None or len(found) < len(best):
+                    best = found
+        return best
+
+    def _execute_search(self, request):
+        dit = self.connection.server.dit
+        base = safe_dn(request['base'])
+        base_lower = base.lower()
+        scope = request['scope']
+        attributes = [attr.lower() for attr in request['attributes']]
+        filter_root = parse_filter(request['filter'], self.connection.server.schema, auto_escape=True,
+                                   auto_encode=False, validator=self.connection.server.custom_validator,
+                                   check_names=self.connection.check_names)
+
+        if base not in dit and base_lower != 'cn=schema':
+            return [], {'resultCode': RESULT_NO_SUCH_OBJECT, 'matchedDN': '',
+                        'diagnosticMessage': 'no such object', 'referral': None}
+
+        indexed = self._indexed_candidates(filter_root)
+        _, children = _indexes(self.connection.server)
+        if scope == 0:
+            candidates = [base]
+        elif scope == 1:
+            level = children.get(base_lower, set())
+            candidates = [dn for dn in indexed if dn in level] if indexed is not None else list(level)
+        else:
+            pool = indexed if indexed is not None else dit.keys()
+            candidates = [dn for dn in pool if dn.lower().endswith(base_lower)]
+
+        matched = self.evaluate_filter_node(filter_root, candidates) if candidates else set()
+        responses = []
+        for match in sorted(matched):
+            responses.append({
+                'object': match,
+                'attributes': [{'type': attr, 'vals': [] if request['typesOnly'] else dit[match][attr]}
+                               for attr in dit[match]
+                               if attr.lower() != 'entrydn' and (attr.lower() in attributes or '*' in attributes)]
+            })
+        if request['sizeLimit'] > 0:
+            responses = responses[:request['sizeLimit']]
+        return responses, {'resultCode': 0, 'matchedDN': '', 'diagnosticMessage': '', 'referral': None}
+
+
+class MockDirectory:
+    """一个共享的模拟目录：所有连接共用同一个 Server 对象及其中的条目"""
+
+    def __init__(self, latency=None):
+        self.server = Server('bench-dc.bench.local', get_info=OFFLINE_AD_2012_R2)
+        # 操作名 (bind/search/add/modify/...) -> 秒，转换为 ldap3 的请求类型名
+        self.server.latency = {f"{op}Request": seconds for op, seconds in (latency or {}).items()}
+        self.server.ad_lock = threading.RLock()
+        self.leaf_ous = []
+        self.group_dns = []
+        conn = self.connect(bind=False)
+        conn.strategy.seed_entry(BASE_DN, 'domainDNS', {'dc': 'bench'})
+        conn.strategy.seed_entry(f'CN=Users,{BASE_DN}', 'container', {'cn': 'Users'})
+        conn.strategy.seed_entry(ADMIN_DN, 'user', {'cn': 'bench-admin', 'sAMAccountName': 'bench-admin',
+                                                    'userPassword': ADMIN_PASSWORD})
+
+    def connect(self, call_site='bench', bind=True):
+        conn = InstrumentedConnection(self.server, user=ADMIN_DN, password=ADMIN_PASSWORD,
+                                      client_strategy=MOCK_SYNC, call_site=call_site)
+        strategy = ADMockStrategy(conn)
+        conn.strategy = strategy
+        conn.send = strategy.send
+        conn.open = strategy.open
+        conn.get_response = strategy.get_response
+        conn.post_send_single_response = strategy.post_send_single_response
+        conn.post_send_search = strategy.post_send_search
+        if bind:
+            conn.bind()
+        return conn
+
+    def connection_factory(self, bind_username, bind_password, call_site, domain_controller_ip=None, get_info=None):
+        """与 ad_utils.open_connection 签名一致；任何登录名都映射为基准测试管理员"""
+        return self.connect(call_site)
+
+    def seed(self, ous, groups, users):
+        """生成三级 OU 树 (区域 / 部门 / 小组)，安全组与通讯组各半，用户平均分布在叶子 OU 中"""
+        strategy = self.connect(bind=False).strategy
+        regions = max(1, min(ous, 10))
+        departments = max(0, min(ous - regions, regions * 10))
+        teams = max(0, ous - regions - departments)
+
+        def add_ous(names, parents):
+            dns = []
+            for i, name in enumerate(names):
+                dn = f'OU={name},{parents[i % len(parents)]}'
+                strategy.seed_entry(dn, 'organizationalUnit', {'ou': name})
+                dns.append(dn)
+            return dns
+
+        region_dns = add_ous([f'区域{r}' for r in range(regions)], [BASE_DN])
+        department_dns = add_ous([f'部门{d}' for d in range(departments)], region_dns)
+        team_dns = add_ous([f'小组{t}' for t in range(teams)], department_dns or region_dns)
+        self.leaf_ous = team_dns or department_dns or region_dns
+
+        group_root = add_ous(['User Groups'], [BASE_DN])[0]
+        group_ous = add_ous([f'Groups{g}' for g in range(max(1, min(groups // 500, 100)))], [group_root])
+        for g in range(groups):
+            dn = f'CN=Group-{g},{group_ous[g % len(group_ous)]}'
+            group_type = GLOBAL_SECURITY_GROUP if g % 2 == 0 else GLOBAL_DISTRIBUTION_GROUP
+            strategy.seed_entry(dn, 'group', {'cn': f'Group-{g}', 'sAMAccountName': f'group-{g}',
+                                              'groupType': str(group_type)})
+            self.group_dns.append(dn)
+
+        for u in range(users):
+            dn = f'CN=Seed User {u},{self.leaf_ous[u % len(self.leaf_ous)]}'
+            strategy.seed_entry(dn, 'user', {'cn': f'Seed User {u}', 'sAMAccountName': f'seed{u}',
+                                             'userAccountControl': '512'})
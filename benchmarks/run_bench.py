@@ -0,0 +1,324 @@
+# /benchmarks/run_bench.py
+"""
+吞吐量基准测试：在模拟 AD 上测量单用户创建、批量创建和控制面板渲染，并与保存的基线比较。
+
+    python -m benchmarks.run_bench                       # 默认规模: 10k OU / 50k 组 / 200k 用户
+    python -m benchmarks.run_bench --scale 0.05          # 快速运行
+    python -m benchmarks.run_bench --latency search=2,add=5,modify=3,bind=3
+    python -m benchmarks.run_bench --save-baseline       # 把本次结果保存为基线
+    python -m benchmarks.run_bench --threads 16          # 模拟 gthread worker 中的并发线程数
+
+与基线相比任一指标退化超过 --threshold (默认 10%) 时以退出码 1 结束。
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, 'benchmarks', 'baseline.json')
+
+# 指标名 -> 是否越大越好
+METRICS = {
+    'create_ad_user.users_per_sec': True,
+    'create_ad_user.ms_per_user': False,
+    'create_ad_user.ldap_ops_per_user': False,
+    'dashboard.cold_ms': False,
+    'dashboard.warm_ms': False,
+    'dashboard.cold_peak_mb': False,
+    'concurrent.users_per_sec': True,
+    'concurrent.dashboard_per_sec': True,
+}
+
+
+def parse_latency(text):
+    """'search=2,add=5' -> {'search': 0.002, 'add': 0.005}"""
+    latency = {}
+    for part in filter(None, (text or '').split(',')):
+        op, _, ms = part.partition('=')
+        latency[op.strip()] = float(ms) / 1000
+    return latency
+
+
+def prepare_workdir(workdir):
+    """
+    生成基准测试专用的 config.json / 规则 / 职位文件并切换到该目录。
+    必须在导入任何应用模块 (包括 benchmarks.mock_ad) 之前调用：utils 在导入时读取当前目录的 config.json。
+    """
+    if 'utils' in sys.modules:
+        raise RuntimeError("prepare_workdir() must run before application modules are imported "
+                           "(utils.CONFIG would point at the wrong config.json)")
+    from benchmarks.constants import BASE_DN as base_dn, DOMAIN_NAME
+    config = {
+        "DOMAIN_CONTROLLER_IP": "bench-dc.bench.local",
+        "DOMAIN_NAME": DOMAIN_NAME,
+        "DEFAULT_USER_PASSWORD": "Bench#User1",
+        "REGION_OPTIONS": [{"code": "all", "name": "all", "keywords": []}],
+        "ACTIVE_REGION_CODE": "all",
+        "CACHE_DIR": os.path.join(workdir, 'cache'),
+    }
+    rules = {
+        "battalion_rules": {f"OU=区域0,{base_dn}": "R0", f"OU=区域1,{base_dn}": "R1"},
+        "position_rules": {"工程师": "ENG"},
+        "department_rules": {f"OU=区域2,{base_dn}": "R2-DEPT"},
+        "ou_group_rules": {f"OU=区域0,{base_dn}": f"CN=Group-0,OU=Groups0,OU=User Groups,{base_dn}"},
+    }
+    positions = {"工程师": [f"CN=Group-2,OU=Groups0,OU=User Groups,{base_dn}"]}
+    for name, data in (('config.json', config), ('description_rules.json', rules), ('positions.json', positions)):
+        with open(os.path.join(workdir, name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    os.chdir(workdir)
+
+
+def total_ops(exclude=('bind', 'unbind')):
+    from ldap_metrics import LDAP_OPS
+    return sum(value for (operation, _, _), value in LDAP_OPS._values.items() if operation not in exclude)
+
+
+def bench_create_ad_user(directory, count, password):
+    import ad_utils
+    from benchmarks.mock_ad import DOMAIN_NAME
+    conn = directory.connect('bench_create_ad_user')
+    ops_before = total_ops()
+    failures = 0
+    start = time.perf_counter()
+    for i in range(count):
+        success, _ = ad_utils.create_ad_user(
+            'bench-dc', 'bench', 'bench', username=f'bench-single-{i}', display_name=f'Bench Single {i}',
+            password=password, ou_path=directory.leaf_ous[i % len(directory.leaf_ous)],
+            domain_name=DOMAIN_NAME, position_name='工程师', groups_to_add=[], conn_external=conn)
+        failures += 0 if success else 1
+    elapsed = time.perf_counter() - start
+    conn.unbind()
+    return {
+        'create_ad_user.users_per_sec': count / elapsed,
+        'create_ad_user.ms_per_user': elapsed * 1000 / count,
+        'create_ad_user.ldap_ops_per_user': (total_ops() - ops_before) / count,
+        'create_ad_user.failures': failures,
+    }
+
+
+def logged_in_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(bind_username='bench-admin@bench.local', bind_password='bench', display_username='bench-admin')
+    return client
+
+
+def bench_batch_create(app, directory, sizes):
+    from ldap_metrics import BATCH_ROWS
+    results = {}
+    client = logged_in_client(app)
+    client.get('/dashboard')  # 预热 OU/组缓存，只测量批量处理本身
+    for size in sizes:
+        csv_text = io.StringIO()
+        csv_text.write('姓名,登录名,OU路径,职位\n')
+        for i in range(size):
+            ou = directory.leaf_ous[i % len(directory.leaf_ous)]
+            csv_text.write(f'Batch {size}-{i},batch-{size}-{i},"{ou}",工程师\n')
+        data = {'user_file': (io.BytesIO(csv_text.getvalue().encode('utf-8')), 'bench.csv')}
+        failed_before = BATCH_ROWS.value('failure') + BATCH_ROWS.value('error')
+        start = time.perf_counter()
+        response = client.post('/batch_create', data=data, content_type='multipart/form-data')
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"batch_create returned HTTP {response.status_code}")
+        results[f'batch_create.rows_per_sec.{size}'] = size / elapsed
+        results[f'batch_create.failed_rows.{size}'] = BATCH_ROWS.value('failure') + BATCH_ROWS.value('error') - failed_before
+        METRICS.setdefault(f'batch_create.rows_per_sec.{size}', True)
+    return results
+
+
+def _clear_directory_cache(cache_dir):
+    import dir_cache
+    dir_cache._entries.clear()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def bench_dashboard(app, cache_dir, warm_runs=5):
+    client = logged_in_client(app)
+
+    _clear_directory_cache(cache_dir)
+    start = time.perf_counter()
+    client.get('/dashboard')
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    warm = []
+    for _ in range(warm_runs):
+        start = time.perf_counter()
+        client.get('/dashboard')
+        warm.append((time.perf_counter() - start) * 1000)
+
+    # 内存峰值单独测量，tracemalloc 本身会拖慢计时
+    _clear_directory_cache(cache_dir)
+    tracemalloc.start()
+    client.get('/dashboard')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'dashboard.cold_ms': cold_ms,
+        'dashboard.warm_ms': sum(warm) / len(warm),
+        'dashboard.cold_peak_mb': peak / (1024 * 1024),
+    }
+
+
+def bench_concurrent(app, directory, threads, count, password):
+    """
+    模拟一个 gthread worker：一半线程并发创建用户 (经连接池借出连接)，另一半并发渲染控制面板。
+    任何线程抛出的异常或失败的创建都会计入 failures。
+    """
+    import ad_utils
+    from benchmarks.mock_ad import DOMAIN_NAME
+    from ldap_metrics import LDAP_OPS
+    creators = max(1, threads // 2)
+    readers = max(1, threads - creators)
+    per_creator = max(1, count // creators)
+    errors, created, pages = [], [0] * creators, [0] * readers
+    stop = threading.Event()
+    binds_before = sum(v for (op, _, _), v in LDAP_OPS._values.items() if op == 'bind')
+
+    def create(worker):
+        try:
+            for i in range(per_creator):
+                success, message = ad_utils.create_ad_user(
+                    'bench-dc', 'bench', 'bench', username=f'bench-mt-{worker}-{i}',
+                    display_name=f'Bench MT {worker}-{i}', password=password,
+                    ou_path=directory.leaf_ous[(worker * per_creator + i) % len(directory.leaf_ous)],
+                    domain_name=DOMAIN_NAME, position_name='工程师', groups_to_add=[])
+                if not success:
+                    errors.append(message)
+                created[worker] += 1
+        except Exception as e:
+            errors.append(repr(e))
+
+    def read(worker):
+        client = logged_in_client(app)
+        try:
+            while not stop.is_set():
+                if client.get('/dashboard').status_code != 200:
+                    errors.append('dashboard returned non-200')
+                pages[worker] += 1
+        except Exception as e:
+            errors.append(repr(e))
+
+    reader_threads = [threading.Thread(target=read, args=(w,)) for w in range(readers)]
+    creator_threads = [threading.Thread(target=create, args=(w,)) for w in range(creators)]
+    start = time.perf_counter()
+    for t in reader_threads + creator_threads:
+        t.start()
+    for t in creator_threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in reader_threads:
+        t.join()
+    binds = sum(v for (op, _, _), v in LDAP_OPS._values.items() if op == 'bind') - binds_before
+    for message in errors[:5]:
+        print(f"  concurrent failure: {message}")
+    return {
+        'concurrent.users_per_sec': sum(created) / elapsed,
+        'concurrent.dashboard_per_sec': sum(pages) / elapsed,
+        'concurrent.failures': len(errors),
+        'concurrent.binds': binds,
+    }
+
+
+def compare(results, baseline, threshold):
+    """返回 (报告行列表, 是否存在退化)"""
+    lines, regressed = [], False
+    for name in sorted(results):
+        value = results[name]
+        old = baseline.get('results', {}).get(name)
+        if name not in METRICS or not old:
+            lines.append(f"  {name:<40} {value:>12.2f}")
+            continue
+        change = (value - old) / old * 100
+        worse = -change if METRICS[name] else change
+        flag = ''
+        if worse > threshold:
+            flag, regressed = '  <-- REGRESSION', True
+        lines.append(f"  {name:<40} {value:>12.2f}   baseline {old:>12.2f}   {change:+7.1f}%{flag}")
+    return lines, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AdUser throughput benchmarks on a synthetic AD.')
+    parser.add_argument('--ous', type=int, default=10000)
+    parser.add_argument('--groups', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply directory sizes, e.g. 0.05 for a quick run')
+    parser.add_argument('--create-count', type=int, default=200, help='users created in the create_ad_user scenario')
+    parser.add_argument('--batch-sizes', default='100,1000')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent threads in the gthread scenario')
+    parser.add_argument('--concurrent-count', type=int, default=400, help='users created in the gthread scenario')
+    parser.add_argument('--latency', default='', help='injected per-operation latency in ms, e.g. search=2,add=5')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed regression in percent')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+
+    params = {
+        'ous': int(args.ous * args.scale), 'groups': int(args.groups * args.scale),
+        'users': int(args.users * args.scale), 'create_count': args.create_count,
+        'batch_sizes': [int(s) for s in args.batch_sizes.split(',') if s], 'latency': args.latency,
+        'threads': args.threads, 'concurrent_count': args.concurrent_count,
+    }
+
+    workdir = tempfile.mkdtemp(prefix='aduser-bench-')
+    original_cwd = os.getcwd()
+    try:
+        prepare_workdir(workdir)
+        # 以下模块在导入时读取当前目录的 config.json
+        from benchmarks import mock_ad
+        import ad_utils
+        from run import app
+
+        print(f"Seeding mock AD: {params['ous']} OUs, {params['groups']} groups, {params['users']} users ...")
+        start = time.perf_counter()
+        directory = mock_ad.MockDirectory(parse_latency(args.latency))
+        directory.seed(params['ous'], params['groups'], params['users'])
+        print(f"Seeded in {time.perf_counter() - start:.1f}s")
+        ad_utils.set_connection_factory(directory.connection_factory)
+        logging.getLogger('aduser.requests').setLevel(logging.ERROR)  # 逐请求日志会干扰计时输出
+
+        results = {}
+        results.update(bench_create_ad_user(directory, params['create_count'], 'Bench#User1'))
+        results.update(bench_batch_create(app, directory, params['batch_sizes']))
+        results.update(bench_dashboard(app, os.path.join(workdir, 'cache')))
+        results.update(bench_concurrent(app, directory, params['threads'], params['concurrent_count'], 'Bench#User1'))
+    finally:
+        if 'audit' in sys.modules:
+            sys.modules['audit'].flush()  # 审计日志写在临时目录中，删除前先等写线程落盘
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print(f"WARNING: baseline was recorded with different parameters: {baseline.get('params')}")
+
+    lines, regressed = compare(results, baseline, args.threshold)
+    print("Results:")
+    print('\n'.join(lines))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# /blueprints/api.py
+"""
+供 HR 系统调用的 JSON 接口，使用令牌认证 (请求头 Authorization: Bearer <令牌>)。
+
+令牌在 config.json 的 API_TOKENS 中配置，只保存令牌的 SHA-256，每个令牌使用自己的绑定账号凭据文件：
+    "API_TOKENS": {"hr-system": {"token_sha256": "<hex>", "credentials": "/etc/aduser/hr-bind.json"}}
+
+    POST /api/users         单个用户，JSON 对象，返回结构化结果
+    POST /api/users/bulk    NDJSON 请求体 (每行一个用户)，经批量引擎处理，按完成顺序逐条以 NDJSON 返回结果
+两个接口都支持 ?dry_run=1：只检查冲突并计算描述和安全组，不写入 AD。
+
+批量接口先把请求体完整读入临时文件 (超过 API_BULK_SPOOL_MEMORY 字节写到磁盘)，再开始处理和返回结果：
+大多数 HTTP 客户端发完整个请求体之后才读响应，边读边返回时双方都会阻塞。
+请求体超过 API_BULK_MAX_BYTES 时返回 413。
+
+用户记录: {"display_name": ..., "username": ..., "ou_path": ..., "position": 可选, "groups": 可选 (仅单个创建)}
+"""
+import json
+import hmac
+import hashlib
+import tempfile
+from functools import wraps
+from flask import Blueprint, request, g, jsonify, Response, stream_with_context
+from utils import CONFIG
+from ad_utils import create_ad_user, get_cached_positions
+from batch import stream_batch
+from bulk_import import load_credentials, check_bind
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+RECORD_FIELDS = ('display_name', 'username', 'ou_path', 'position')
+
+API_BULK_MAX_BYTES = CONFIG.get('API_BULK_MAX_BYTES', 256 * 1024 * 1024)
+API_BULK_SPOOL_MEMORY = CONFIG.get('API_BULK_SPOOL_MEMORY', 8 * 1024 * 1024)
+
+
+def _authenticate(header):
+    """返回 (令牌名称, 令牌配置)；令牌无效时返回 None"""
+    scheme, _, token = (header or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    digest = hashlib.sha256(token.strip().encode('utf-8')).hexdigest()
+    for name, client in CONFIG.get('API_TOKENS', {}).items():
+        if hmac.compare_digest(digest, client.get('token_sha256', '')):
+            return name, client
+    return None
+
+
+def api_token_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        client = _authenticate(request.headers.get('Authorization'))
+        if client is None:
+            return jsonify(error='令牌无效或缺失。'), 401
+        name, settings = client
+        try:
+            g.bind_username, g.bind_password = load_credentials(settings.get('bind_username'),
+                                                                settings.get('credentials'))
+        except (OSError, ValueError) as e:
+            print(f"ERROR: API 令牌 '{name}' 的绑定凭据无法读取: {e}")
+            return jsonify(error='服务端绑定凭据配置错误。'), 500
+        g.api_client = name
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+def _dry_run():
+    return request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+
+def _record_to_row(record):
+    """JSON 用户记录 -> batch 使用的列列表；格式不正确时抛出 ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError("每条记录必须是 JSON 对象。")
+    values = [record.get(field) or '' for field in RECORD_FIELDS]
+    if not all(isinstance(value, str) for value in values):
+        raise ValueError("字段值必须是字符串。")
+    return values
+
+
+def _read_ndjson(stream, errors):
+    """
+    逐行读取 NDJSON 请求体，产出 (序号, 列列表)；无法解析的行产出 None 并把原因记入 errors。
+    读完或停止读取时关闭 stream：读取在批量引擎的线程中进行，不能由响应结束时关闭。
+    """
+    index = 0
+    with stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            index += 1
+            try:
+                yield index, _record_to_row(json.loads(line))
+            except ValueError as e:  # json.JSONDecodeError 是 ValueError 的子类
+                errors[index] = str(e)
+                yield index, None
+
+
+def _spool_body(stream, max_bytes):
+    """把请求体读入临时文件并回到开头；超过 max_bytes 时关闭文件并返回 None"""
+    spool = tempfile.SpooledTemporaryFile(max_size=API_BULK_SPOOL_MEMORY)
+    size = 0
+    for chunk in iter(lambda: stream.read(64 * 1024), b''):
+        size += len(chunk)
+        if size > max_bytes:
+            spool.close()
+            return None
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+@api_bp.route('/users', methods=['POST'])
+@api_token_required
+def create_user():
+    record = request.get_json(silent=True)
+    try:
+        display_name, username, ou_path, position = (value.strip() for value in _record_to_row(record))
+        groups = record.get('groups') or []
+        if not isinstance(groups, list) or not all(isinstance(group, str) for group in groups):
+            raise ValueError("groups 必须是字符串列表。")
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 400
+    if not all([display_name, username, ou_path]):
+        return jsonify(success=False, message="display_name、username 和 ou_path 都必须填写。"), 400
+
+    groups_to_add = groups + list(get_cached_positions().get(position, [])) if position else groups
+    dry_run = _dry_run()
+    success, message = create_ad_user(
+        domain_controller_ip=CONFIG['DOMAIN_CONTROLLER_IP'],
+        bind_username=g.bind_username, bind_password=g.bind_password,
+        username=username, display_name=display_name,
+        password=CONFIG['DEFAULT_USER_PASSWORD'], ou_path=ou_path, domain_name=CONFIG['DOMAIN_NAME'],
+        position_name=position or None, groups_to_add=groups_to_add, dry_run=dry_run
+    )
+    status = (200 if dry_run else 201) if success else 422
+    return jsonify(success=success, username=username, display_name=display_name, ou_path=ou_path,
+                   message=message), status
+
+
+@api_bp.route('/users/bulk', methods=['POST'])
+@api_token_required
+def bulk_create_users():
+    # 先校验绑定账号，避免每条记录都返回同样的连接错误
+    success, message = check_bind(g.bind_username, g.bind_password)
+    if not success:
+        return jsonify(error=message), 503
+
+    if request.content_length is not None and request.content_length > API_BULK_MAX_BYTES:
+        return jsonify(error=f"请求体超过 {API_BULK_MAX_BYTES} 字节，请拆分后提交。"), 413
+    body = _spool_body(request.stream, API_BULK_MAX_BYTES)
+    if body is None:
+        return jsonify(error=f"请求体超过 {API_BULK_MAX_BYTES} 字节，请拆分后提交。"), 413
+
+    errors = {}
+    records = _read_ndjson(body, errors)
+    results = stream_batch(records, g.bind_username, g.bind_password, dry_run=_dry_run())
+
+    def generate():
+        for index, row, message, outcome in results:
+            yield json.dumps({
+                'index': index,
+                'username': row[1].strip() if row else None,
+                'success': outcome == 'success',
+                'outcome': outcome,
+                'message': errors.pop(index, None) or message,
+            }, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), content_type='application/x-ndjson; charset=utf-8')
@@ -1,8 +1,8 @@
 # /blueprints/auth.py
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app
-from ldap3 import Server, Connection, Tls, ALL
-import ssl
+from ldap3 import ALL
 from utils import CONFIG
+from ad_utils import open_connection
 
 auth_bp = Blueprint('auth', __name__, template_folder='../templates')
 
@@ -23,11 +23,10 @@ def login():
 
         bind_user = f"{username_input}@{CONFIG['DOMAIN_NAME']}" if '@' not in username_input else username_input
         try:
-            tls_config = Tls(validate=ssl.CERT_NONE, version=ssl.PROTOCOL_TLS_CLIENT)
-            server = Server(CONFIG['DOMAIN_CONTROLLER_IP'], port=636, use_ssl=True, get_info=ALL, tls=tls_config)
-            conn = Connection(server, user=bind_user, password=bind_pass, auto_bind=True)
+            conn = open_connection(bind_user, bind_pass, 'login', get_info=ALL, role='read')
             if conn.bound:
                 conn.unbind()
+                session.regenerate()
                 session.update(bind_username=bind_user, bind_password=bind_pass,
                                display_username=bind_user.split('@')[0])
                 return redirect(url_for('main.dashboard'))
@@ -1,12 +1,13 @@
 # /blueprints/main.py
-import csv
-import io
-import ssl
 from flask import Blueprint, render_template, request, session, flash, redirect, url_for, current_app, \
-    send_from_directory
-from ldap3 import Server, Connection, Tls, ALL
-from utils import login_required, simplify_dn, load_positions, CONFIG
-from ad_utils import create_ad_user, get_ou_list, get_group_list, get_base_dn
+    send_from_directory, jsonify, Response, abort
+from ldap3 import ALL
+from utils import login_required, CONFIG
+from ad_utils import create_ad_user, get_ou_list, get_group_list, get_cached_positions, \
+    acquire_connection, release_connection
+from batch import parse_csv, run_batch
+from batch_jobs import start_job, resume_job, load_job, job_events, job_report
+from bulk_import import check_bind
 
 main_bp = Blueprint('main', __name__, template_folder='../templates')
 
@@ -32,13 +33,11 @@ def dashboard():
             )
             result_message, result_type = message, 'success' if success else 'error'
 
-    base_dn = get_base_dn(CONFIG['DOMAIN_NAME'])
-    ou_options_raw = get_ou_list()
-    ou_options_display = [{'dn': dn, 'name': simplify_dn(dn, base_dn)} for dn in ou_options_raw]
-    group_options = get_group_list()
+    ou_options_display = get_ou_list().options()
+    group_options = get_group_list().options()
 
     return render_template('dashboard.html', config=CONFIG, result_message=result_message, result_type=result_type,
-                           ou_options=ou_options_display, group_options=group_options, positions=load_positions())
+                           ou_options=ou_options_display, group_options=group_options, positions=get_cached_positions())
 
 
 @main_bp.route('/batch_create', methods=['POST'])
@@ -55,64 +54,105 @@ def batch_create():
 
     batch_results = []
     conn = None
+    failed = False
     try:
-        tls_config = Tls(validate=ssl.CERT_NONE, version=ssl.PROTOCOL_TLS_CLIENT)
-        server = Server(CONFIG['DOMAIN_CONTROLLER_IP'], port=636, use_ssl=True, get_info=ALL, tls=tls_config)
-        conn = Connection(server, user=session['bind_username'], password=session['bind_password'], auto_bind=True)
-
+        # 先校验绑定账号，避免每一行都报告同样的连接错误；校验用的连接归还后由工作线程复用
+        conn = acquire_connection(session['bind_username'], session['bind_password'], 'batch_create', get_info=ALL)
         if not conn.bound:
             flash(f"LDAP 连接失败: {conn.result}", 'error')
             return redirect(url_for('main.dashboard'))
+        release_connection(conn)
+        conn = None
 
-        stream = io.StringIO(file.stream.read().decode("UTF-8"), newline=None)
-        csv_reader = csv.reader(stream)
+        rows = parse_csv(file.stream.read())
+        batch_results = run_batch(rows, session['bind_username'], session['bind_password'])
 
-        next(csv_reader, None)
+    except Exception as e:
+        failed = True
+        flash(f'处理文件时出错: {e}', 'error')
+    finally:
+        if conn:
+            release_connection(conn, discard=failed)
 
-        for i, row in enumerate(csv_reader, 2):
-            try:
-                if len(row) < 3:
-                    batch_results.append(f"第 {i} 行: 格式错误，至少需要 姓名,登录名,OU路径 三列。")
-                    continue
+    ou_options_display = get_ou_list().options()
+    group_options = get_group_list().options()
 
-                display_name, username, ou_path = row[0].strip(), row[1].strip(), row[2].strip()
-                position_name = row[3].strip() if len(row) > 3 and row[3] else None
+    return render_template('dashboard.html', config=CONFIG, batch_results=batch_results,
+                           ou_options=ou_options_display, group_options=group_options, positions=get_cached_positions())
 
-                if not all([display_name, username, ou_path]):
-                    batch_results.append(f"第 {i} 行 ({display_name}): 跳过，姓名、登录名或 OU 路径为空。")
-                    continue
 
-                positions_data = load_positions()
-                groups_to_add = positions_data.get(position_name, [])
+@main_bp.route('/batch_jobs', methods=['POST'])
+@login_required
+def batch_job_start():
+    """上传 CSV 并在后台开始批量创建，返回任务 ID；页面随后订阅 /batch_jobs/<任务ID>/events 获取进度"""
+    file = request.files.get('user_file')
+    if file is None or not file.filename.endswith('.csv'):
+        return jsonify(error='请选择一个有效的 .csv 文件。'), 400
+    try:
+        rows = parse_csv(file.stream.read())
+    except (UnicodeDecodeError, ValueError) as e:
+        return jsonify(error=f'处理文件时出错: {e}'), 400
 
-                success, message = create_ad_user(
-                    domain_controller_ip=CONFIG['DOMAIN_CONTROLLER_IP'],
-                    bind_username=session['bind_username'], bind_password=session['bind_password'],
-                    username=username, display_name=display_name,
-                    password=CONFIG['DEFAULT_USER_PASSWORD'], ou_path=ou_path, domain_name=CONFIG['DOMAIN_NAME'],
-                    position_name=position_name, groups_to_add=groups_to_add,
-                    conn_external=conn
-                )
+    conn = None
+    failed = False
+    try:
+        # 先校验绑定账号，避免每一行都报告同样的连接错误
+        conn = acquire_connection(session['bind_username'], session['bind_password'], 'batch_create', get_info=ALL)
+        if not conn.bound:
+            return jsonify(error=f"LDAP 连接失败: {conn.result}"), 502
+    except Exception as e:
+        failed = True
+        return jsonify(error=f'LDAP 连接失败: {e}'), 502
+    finally:
+        if conn:
+            release_connection(conn, discard=failed)
 
-                result_prefix = "✅ 成功" if success else "❌ 失败"
-                batch_results.append(f"第 {i} 行 [{display_name}]: {result_prefix} - {message}")
+    job_id = start_job(rows, session['bind_username'], session['bind_password'], session['bind_username'],
+                       file.filename)
+    return jsonify(job_id=job_id, total=len(rows), events_url=url_for('main.batch_job_events', job_id=job_id),
+                   report_url=url_for('main.batch_job_report', job_id=job_id),
+                   resume_url=url_for('main.batch_job_resume', job_id=job_id))
 
-            except Exception as e:
-                batch_results.append(f"第 {i} 行: 处理时发生意外错误 - {e}")
 
-    except Exception as e:
-        flash(f'处理文件时出错: {e}', 'error')
-    finally:
-        if conn and conn.bound:
-            conn.unbind()
+def _own_job(job_id):
+    job = load_job(job_id)
+    if job is None or job['operator'] != session['bind_username']:
+        abort(404)
+    return job
 
-    base_dn = get_base_dn(CONFIG['DOMAIN_NAME'])
-    ou_options_raw = get_ou_list()
-    ou_options_display = [{'dn': dn, 'name': simplify_dn(dn, base_dn)} for dn in ou_options_raw]
-    group_options = get_group_list()
 
-    return render_template('dashboard.html', config=CONFIG, batch_results=batch_results,
-                           ou_options=ou_options_display, group_options=group_options, positions=load_positions())
+@main_bp.route('/batch_jobs/<job_id>/resume', methods=['POST'])
+@login_required
+def batch_job_resume(job_id):
+    """继续已中断的任务 (如运行任务的 worker 被重启)，已成功的行不会重复处理"""
+    _own_job(job_id)
+    success, message = check_bind(session['bind_username'], session['bind_password'])
+    if not success:
+        return jsonify(error=message), 502
+    success, message = resume_job(job_id, session['bind_username'], session['bind_password'])
+    if not success:
+        return jsonify(error=message), 409
+    return jsonify(message=message)
+
+
+@main_bp.route('/batch_jobs/<job_id>/events')
+@login_required
+def batch_job_events(job_id):
+    """批量任务进度的 Server-Sent Events 流，任务结束后关闭；?offset= 指定首次连接的起始位置"""
+    _own_job(job_id)
+    offset = request.headers.get('Last-Event-ID') or request.args.get('offset', '0')
+    response = Response(job_events(job_id, int(offset) if offset.isdigit() else 0), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 经 nginx 反向代理时不缓冲事件
+    return response
+
+
+@main_bp.route('/batch_jobs/<job_id>/report')
+@login_required
+def batch_job_report(job_id):
+    job = _own_job(job_id)
+    return Response('\n'.join(job_report(job_id)) + '\n', mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename=batch-report-{job["id"]}.txt'})
 
 
 @main_bp.route('/download_template')
@@ -3,6 +3,10 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from utils import (login_required, load_config, save_config, load_positions,
                    save_positions, load_rules, save_rules, CONFIG)
 from ad_utils import get_group_list, get_ou_list
+from dir_cache import invalidate
+from profiler import parse_paths
+from dc_health import status as dc_status
+from audit import search as search_audit
 
 management_bp = Blueprint('management', __name__, template_folder='../templates')
 
@@ -16,12 +20,23 @@ def settings():
             {'DOMAIN_CONTROLLER_IP': request.form.get('dc_ip'), 'DOMAIN_NAME': request.form.get('domain_name'),
              'DEFAULT_USER_PASSWORD': request.form.get('default_user_password'),
              'ACTIVE_REGION_CODE': request.form.get('active_region')})
+        # 请求性能分析只允许已登录用户修改 (设置页面在首次配置时无需登录)：采样率限制在 0~1，留空或非法值视为关闭
+        profiler_changed = 'bind_username' in session
+        if profiler_changed:
+            try:
+                profile_rate = min(max(float(request.form.get('profile_sample_rate') or 0), 0.0), 1.0)
+            except ValueError:
+                profile_rate = 0.0
+            current_config.update({'PROFILE_SAMPLE_RATE': profile_rate,
+                                   'PROFILE_PATHS': parse_paths(request.form.get('profile_paths'))})
         save_config(current_config)
         CONFIG.update(current_config)
+        if profiler_changed:
+            invalidate('profiler')
         flash('服务器配置已更新。', 'success')
         return redirect(url_for('main.dashboard') if 'bind_username' in session else url_for('auth.login'))
     current_config, _ = load_config()
-    return render_template('settings.html', config=current_config)
+    return render_template('settings.html', config=current_config, dc_status=dc_status())
 
 
 @management_bp.route('/positions', methods=['GET', 'POST'])
@@ -51,6 +66,7 @@ def positions():
                 else:
                     positions_data[position_name] = selected_groups
                     save_positions(positions_data)
+                    invalidate('positions')
                     flash(f"职位 '{position_name}' 创建成功。", 'success')
             else:
                 flash("创建失败：职位名称和所选组不能为空。", 'error')
@@ -72,6 +88,7 @@ def positions():
                 del positions_data[original_name]
                 positions_data[new_name] = selected_groups
                 save_positions(positions_data)
+                invalidate('positions')
                 flash(f"职位 '{original_name}' 已成功更新为 '{new_name}'。", 'success')
 
         elif action == 'delete':
@@ -79,13 +96,14 @@ def positions():
             if p_name_to_delete in positions_data:
                 del positions_data[p_name_to_delete]
                 save_positions(positions_data)
+                invalidate('positions')
                 flash(f"职位 '{p_name_to_delete}' 已被删除。", 'success')
 
         return redirect(url_for('management.positions'))
 
     return render_template('positions.html',
                            positions=positions_data,
-                           group_options=get_group_list(),
+                           group_options=get_group_list().options(),
                            config=CONFIG,
                            edit_data=edit_data)  # 将待编辑数据传给模板
 
@@ -124,6 +142,7 @@ def rules():
                 else:
                     rules_data[target_dict_name][key] = value
                     save_rules(rules_data)
+                    invalidate('rules')
                     flash('规则添加成功。', 'success')
             else:
                 flash('创建失败：键和值都不能为空。', 'error')
@@ -143,19 +162,21 @@ def rules():
                 del rules_data[target_dict_name][original_key]
                 rules_data[target_dict_name][new_key] = new_value
                 save_rules(rules_data)
+                invalidate('rules')
                 flash(f"规则 '{original_key}' 已成功更新。", 'success')
 
         elif action == 'delete':
             if target_dict_name and key in rules_data[target_dict_name]:
                 del rules_data[target_dict_name][key]
                 save_rules(rules_data)
+                invalidate('rules')
                 flash('规则删除成功。', 'success')
 
         return redirect(url_for('management.rules'))
 
     ou_options = get_ou_list()
     position_options = load_positions().keys()
-    group_options = get_group_list()
+    group_options = get_group_list().options()
 
     return render_template('rules.html',
                            rules=rules_data,
@@ -163,4 +184,13 @@ def rules():
                            ou_options=ou_options,
                            position_options=position_options,
                            group_options=group_options,
-                           edit_data=edit_data)  # 将待编辑数据传给模板
\ No newline at end of file
+                           edit_data=edit_data)  # 将待编辑数据传给模板
+
+
+@management_bp.route('/audit')
+@login_required
+def audit_log():
+    # 查询条件：完整 DN 精确匹配、名称前缀、操作人、操作类型，均可留空
+    query = {field: request.args.get(field, '').strip() for field in ('dn', 'name', 'operator', 'operation')}
+    entries = search_audit(**{field: value or None for field, value in query.items()})
+    return render_template('audit.html', entries=entries, query=query, config=CONFIG)
@@ -0,0 +1,11 @@
+# /blueprints/monitoring.py
+from flask import Blueprint, Response
+from ldap_metrics import render_prometheus
+
+monitoring_bp = Blueprint('monitoring', __name__)
+
+
+@monitoring_bp.route('/metrics')
+def metrics():
+    """Prometheus 文本格式的 LDAP 操作与批量处理指标"""
+    return Response(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
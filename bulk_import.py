@@ -0,0 +1,193 @@
+# /bulk_import.py
+"""
+命令行批量导入用户，不经过浏览器上传，适合在应用主机上由 cron 运行大批量导入。
+与 /batch_create 使用同一套逻辑 (create_ad_user、描述规则、职位安全组、batch 通道的并发控制)。
+
+    cd /opt/aduser && python -m bulk_import users.csv --credentials /etc/aduser/bind.json
+    python -m bulk_import users.csv --bind-user svc_aduser --workers 8
+    python -m bulk_import users.csv --credentials bind.json --dry-run     # 只检查冲突和计算规则，不写入 AD
+    python -m bulk_import users.csv --credentials bind.json --resume      # 跳过报告中已成功的登录名
+
+绑定密码按以下顺序获取：--credentials 指定的 JSON 文件 ({"bind_username": ..., "bind_password": ...}，
+权限应为 0600)、环境变量 ADUSER_BIND_PASSWORD、终端交互输入。
+需要在应用目录下运行 (读取 config.json、positions.json、description_rules.json)。
+
+每行处理完后立即追加到结果报告 (默认 <csv>.report.csv，试运行为 <csv>.dry-run.csv)，
+中途中断后加 --resume 重新运行即可继续。进度每秒最多输出一行。
+全部成功时退出码为 0，有失败或错误的行时为 1，无法开始导入时为 2。
+"""
+import os
+import sys
+import csv
+import json
+import stat
+import time
+import getpass
+import argparse
+import threading
+from ldap3 import ALL
+
+REPORT_FIELDS = ['行号', '姓名', '登录名', '结果', '说明']
+
+
+def load_credentials(bind_user=None, credentials_path=None):
+    """返回 (绑定用户名, 绑定密码)"""
+    username, password = bind_user, None
+    if credentials_path:
+        mode = os.stat(credentials_path).st_mode
+        if mode & (stat.S_IRWXG | stat.S_IRWXO):
+            print(f"WARNING: '{credentials_path}' 可被其他用户读取，建议 chmod 600。", file=sys.stderr)
+        with open(credentials_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        username = username or data.get('bind_username')
+        password = data.get('bind_password')
+    if password is None:
+        password = os.environ.get('ADUSER_BIND_PASSWORD')
+    if not username:
+        raise ValueError("未指定绑定账号，请使用 --bind-user 或在凭据文件中提供 bind_username。")
+    if password is None:
+        if not sys.stdin.isatty():
+            raise ValueError("未提供绑定密码，请使用 --credentials 或环境变量 ADUSER_BIND_PASSWORD。")
+        password = getpass.getpass(f"{username} 的密码: ")
+    return username, password
+
+
+def completed_logins(report_path):
+    """读取已有报告，返回最近一次结果为成功的登录名集合"""
+    last = {}
+    if not os.path.exists(report_path):
+        return set()
+    with open(report_path, 'r', encoding='utf-8-sig', newline='') as f:
+        for record in csv.DictReader(f):
+            last[record.get('登录名', '')] = record.get('结果')
+    return {login for login, outcome in last.items() if login and outcome == 'success'}
+
+
+class Progress:
+    """线程安全地写报告并输出进度；on_result 由 batch 工作线程调用"""
+
+    def __init__(self, report_file, total, interval=1.0):
+        self.writer = csv.writer(report_file)
+        self.report_file = report_file
+        self.total, self.interval = total, interval
+        self.counts = {'success': 0, 'failure': 0, 'skipped': 0, 'error': 0}
+        self.started = time.perf_counter()
+        self._last_print = 0.0
+        self._lock = threading.Lock()
+
+    def on_result(self, line_no, row, message, outcome):
+        display_name = row[0].strip() if row else ''
+        username = row[1].strip() if len(row) > 1 else ''
+        with self._lock:
+            self.writer.writerow([line_no, display_name, username, outcome, message])
+            self.report_file.flush()
+            self.counts[outcome] += 1
+            if outcome in ('failure', 'error'):
+                print(message, flush=True)
+            now = time.perf_counter()
+            if now - self._last_print >= self.interval or self.done == self.total:
+                self._last_print = now
+                self.print_line(now)
+
+    @property
+    def done(self):
+        return sum(self.counts.values())
+
+    def print_line(self, now):
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        print(f"[{self.done}/{self.total}] 成功 {self.counts['success']} 失败 {self.counts['failure']} "
+              f"跳过 {self.counts['skipped']} 错误 {self.counts['error']} | {rate:.1f} 行/秒 | "
+              f"剩余约 {eta:.0f} 秒", flush=True)
+
+
+def check_bind(bind_username, bind_password):
+    """先校验绑定账号，避免每一行都报告同样的连接错误；返回 (是否成功, 说明)"""
+    from ad_utils import acquire_connection, release_connection
+    conn = None
+    try:
+        conn = acquire_connection(bind_username, bind_password, 'batch_create', get_info=ALL)
+        if not conn.bound:
+            return False, f"LDAP 认证失败: {conn.result}"
+        release_connection(conn)
+        conn = None
+        return True, "绑定成功。"
+    except Exception as e:
+        return False, f"无法连接域控: {e}"
+    finally:
+        if conn is not None:
+            release_connection(conn, discard=True)
+
+
+def import_rows(rows, bind_username, bind_password, report_path, workers=None, dry_run=False, append=False,
+                process=None, fields=REPORT_FIELDS, key=None):
+    """
+    处理 [(行号, 列列表), ...] 并逐行写入结果报告；append=True 且报告已存在时追加。
+    process 为 None 时创建用户，process 和 key 见 batch.run_batch；报告的第 2、3 列取自每行的前两列，表头为 fields。
+    返回 (各结果分类的行数, 用时秒数)。
+    """
+    import audit
+    from batch import run_batch
+
+    new_report = not (append and os.path.exists(report_path))
+    with open(report_path, 'w' if new_report else 'a', encoding='utf-8-sig' if new_report else 'utf-8',
+              newline='') as report_file:
+        if new_report:
+            csv.writer(report_file).writerow(fields)
+        progress = Progress(report_file, len(rows))
+        try:
+            run_batch(rows, bind_username, bind_password, workers=workers, dry_run=dry_run,
+                      on_result=progress.on_result, process=process, key=key)
+        finally:
+            audit.flush()
+    return progress.counts, time.perf_counter() - progress.started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='从 CSV 批量创建 AD 用户 (列: 姓名,登录名,OU路径[,职位])。')
+    parser.add_argument('csv_path', help='CSV 文件 (UTF-8，第一行为表头)')
+    parser.add_argument('--bind-user', help='绑定账号，如 DOMAIN\\admin 或 admin@domain')
+    parser.add_argument('--credentials', help='包含 bind_username / bind_password 的 JSON 凭据文件')
+    parser.add_argument('--workers', type=int, default=None, help='工作线程数上限 (默认 BATCH_WORKERS)')
+    parser.add_argument('--dry-run', action='store_true', help='只检查冲突并计算描述和安全组，不写入 AD')
+    parser.add_argument('--resume', action='store_true', help='跳过报告中已成功创建的登录名')
+    parser.add_argument('--report', help='结果报告路径 (默认 <csv>.report.csv，试运行为 <csv>.dry-run.csv)')
+    args = parser.parse_args(argv)
+
+    # 以下模块在导入时读取当前目录的 config.json
+    from batch import parse_csv
+
+    report_path = args.report or (os.path.splitext(args.csv_path)[0] +
+                                  ('.dry-run.csv' if args.dry_run else '.report.csv'))
+    try:
+        bind_username, bind_password = load_credentials(args.bind_user, args.credentials)
+        with open(args.csv_path, 'rb') as f:
+            rows = parse_csv(f.read())
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+
+    if args.resume:
+        done = completed_logins(report_path)
+        rows = [(line_no, row) for line_no, row in rows if len(row) < 2 or row[1].strip() not in done]
+        print(f"继续上次导入：跳过 {len(done)} 个已成功的登录名，剩余 {len(rows)} 行。")
+    if not rows:
+        print("没有需要处理的行。")
+        return 0
+
+    success, message = check_bind(bind_username, bind_password)
+    if not success:
+        print(f"ERROR: {message}", file=sys.stderr)
+        return 2
+
+    print(f"{'试运行' if args.dry_run else '开始导入'}: {len(rows)} 行，结果报告: {report_path}")
+    counts, elapsed = import_rows(rows, bind_username, bind_password, report_path, workers=args.workers,
+                                  dry_run=args.dry_run, append=args.resume)
+    print(f"完成: {sum(counts.values())} 行，用时 {elapsed:.1f} 秒 — 成功 {counts['success']}，"
+          f"失败 {counts['failure']}，跳过 {counts['skipped']}，错误 {counts['error']}。")
+    return 1 if counts['failure'] or counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
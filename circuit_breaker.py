@@ -0,0 +1,98 @@
+# /circuit_breaker.py
+"""
+熔断器：连续 failure_threshold 次连接失败后断开 (open)，之后的调用立即失败而不再等待连接超时。
+断开期间后台线程每 probe_interval 秒调用一次 probe()，成功后进入半开 (half_open) 状态，
+放行一次试探调用：成功则恢复 (closed)，失败则重新断开。
+"""
+import os
+import time
+import threading
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于断开状态，调用被立即拒绝"""
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, name, probe, failure_threshold=5, probe_interval=10, on_change=None):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.on_change = on_change
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._trial_in_flight = False
+        self._probe_pid = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        # 调用方持有锁
+        if state != self.state:
+            self.state = state
+            print(f"WARNING: Circuit '{self.name}' is now {state}."
+                  + (f" Last error: {self.last_error}" if state == self.OPEN else ''))
+            if self.on_change:
+                self.on_change(state)
+
+    def before_call(self):
+        """调用前检查；断开时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self._ensure_probe()
+            retry_in = max(0, int(self.probe_interval - (time.monotonic() - self.opened_at) % self.probe_interval))
+        raise CircuitOpenError(f"域控暂时不可用 (连续 {self.failures} 次连接失败: {self.last_error})，"
+                               f"约 {retry_in} 秒后自动重试。")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_neutral(self):
+        """调用结果不能说明依赖的状态 (如调用方自己的截止时间已到)：不计入成功或失败，只归还半开状态的试探名额"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+                self._ensure_probe()
+
+    def _ensure_probe(self):
+        # 调用方持有锁；fork 之后子进程中没有探测线程，按 pid 判断是否需要重新启动
+        if self._probe_pid != os.getpid():
+            self._probe_pid = os.getpid()
+            threading.Thread(target=self._probe_loop, name=f'circuit-{self.name}', daemon=True).start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            with self._lock:
+                if self.state != self.OPEN:
+                    self._probe_pid = None
+                    return
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            if healthy:
+                with self._lock:
+                    if self.state == self.OPEN:
+                        self._set_state(self.HALF_OPEN)
+                    self._probe_pid = None
+                return
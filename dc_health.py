@@ -0,0 +1,189 @@
+# /dc_health.py
+"""
+多域控健康检查、延迟排序与读写路由。
+CONFIG['DOMAIN_CONTROLLER_IP'] 可以填写多个域控，用逗号分隔 (如 'dc1.long.cn, dc2.long.cn')。
+每隔 DC_HEALTH_INTERVAL 秒对每台域控实际使用的端口做一次 TCP + TLS 握手探测
+(读域控探测读端口，启用全局编录时为 3269；写域控探测 636，同时承担读写的域控两个端口分别探测)，
+ad_utils 按此结果构建 ldap3 ServerPool，首选域控失败时依次尝试后面的域控：
+  - 读 (OU/组列表等): READ_DOMAIN_CONTROLLERS (默认即全部域控) 按是否可达和握手耗时排序，选最近的；
+    READ_FROM_GLOBAL_CATALOG 为 true 时改用全局编录端口 3269
+  - 写: WRITE_DOMAIN_CONTROLLER 固定的域控；未配置时按配置顺序取第一台健康的域控，
+    所有 worker / 节点得到相同的选择，避免在不同域控上写入同一对象造成复制冲突
+探测在后台线程中进行，只有进程内第一次使用时会同步等待 (最多一个连接超时)；
+探测同时刷新域控的 DNS 缓存 (见 ldap_transport)。
+"""
+import ssl
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils import CONFIG
+from ldap_transport import resolve, client_context
+
+LDAPS_PORT = 636
+GLOBAL_CATALOG_SSL_PORT = 3269
+DC_HEALTH_INTERVAL = CONFIG.get('DC_HEALTH_INTERVAL', 30)
+DC_CONNECT_TIMEOUT = CONFIG.get('DC_CONNECT_TIMEOUT', 3)
+
+_lock = threading.Lock()
+# targets: 所有需要探测的 (域控, 端口)；results: {(域控, 端口): (是否可达, 毫秒, 错误)}
+_state = {'targets': (), 'checked_at': 0.0, 'results': {}, 'refreshing': False}
+
+
+def parse_controllers(value):
+    """'dc1, dc2' 或 ['dc1', 'dc2'] -> ('dc1', 'dc2')"""
+    if isinstance(value, (list, tuple)):
+        return tuple(h.strip() for h in value if h and h.strip())
+    return tuple(h.strip() for h in (value or '').split(',') if h.strip())
+
+
+def probe(host, port=LDAPS_PORT, timeout=DC_CONNECT_TIMEOUT):
+    """返回 (是否可达, 握手耗时毫秒, 错误信息)；解析结果写入 DNS 缓存，建立 LDAP 连接时可直接使用"""
+    try:
+        address = resolve(host, port)[0][4]
+        start = time.perf_counter()  # 只统计连接与握手，与是否命中 DNS 缓存无关
+        with socket.create_connection(address[:2], timeout=timeout) as sock:
+            with client_context().wrap_socket(sock, server_hostname=host):  # 与 LDAPS 连接的证书策略一致
+                pass
+        return True, (time.perf_counter() - start) * 1000, None
+    except (OSError, ssl.SSLError) as e:
+        return False, None, str(e)
+
+
+def _refresh(targets):
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        results = dict(zip(targets, executor.map(lambda target: probe(*target), targets)))
+    with _lock:
+        if _state['targets'] == targets:
+            _state['results'] = results
+            _state['checked_at'] = time.monotonic()
+        _state['refreshing'] = False
+    return results
+
+
+def _refresh_in_background(targets):
+    with _lock:
+        if _state['refreshing']:
+            return
+        _state['refreshing'] = True
+    threading.Thread(target=_refresh, args=(targets,), name='dc-health', daemon=True).start()
+
+
+def read_port():
+    return GLOBAL_CATALOG_SSL_PORT if CONFIG.get('READ_FROM_GLOBAL_CATALOG') else LDAPS_PORT
+
+
+def _read_hosts(value=None):
+    if value is None:
+        value = CONFIG.get('READ_DOMAIN_CONTROLLERS') or CONFIG.get('DOMAIN_CONTROLLER_IP')
+    return parse_controllers(value)
+
+
+def _write_hosts(value=None):
+    """固定的写域控在前，其余按配置顺序"""
+    hosts = parse_controllers(value if value is not None else CONFIG.get('DOMAIN_CONTROLLER_IP'))
+    pinned = parse_controllers(CONFIG.get('WRITE_DOMAIN_CONTROLLER'))
+    return tuple(dict.fromkeys(pinned + hosts))
+
+
+def _all_targets():
+    port = read_port()
+    targets = [(host, port) for host in _read_hosts()] + [(host, LDAPS_PORT) for host in _write_hosts()]
+    return tuple(dict.fromkeys(targets))
+
+
+def _current_results(targets):
+    """探测结果 {(域控, 端口): (是否可达, 毫秒, 错误)}；targets 不在当前探测范围内时一并纳入"""
+    targets = tuple(dict.fromkeys(_all_targets() + tuple(targets)))
+    with _lock:
+        if _state['targets'] != targets:
+            # 配置变化 (或首次使用)：旧的探测结果作废
+            _state.update(targets=targets, results={}, checked_at=0.0)
+        results = _state['results']
+        stale = time.monotonic() - _state['checked_at'] > DC_HEALTH_INTERVAL
+    if not results:
+        return _refresh(targets)  # 首次使用：同步探测，最多等待一个连接超时
+    if stale:
+        _refresh_in_background(targets)
+    return results
+
+
+def _is_healthy(results, target):
+    return results.get(target, (True, None, None))[0] is not False
+
+
+def _rank(targets, results):
+    """按 (不可达排在最后, 握手耗时, 配置顺序) 排序"""
+    def key(target):
+        _, latency, _ = results.get(target, (True, None, None))
+        return (not _is_healthy(results, target), latency if latency is not None else float('inf'),
+                targets.index(target))
+    return sorted(targets, key=key)
+
+
+def _read_order(hosts, port, results):
+    return [host for host, _ in _rank([(host, port) for host in hosts], results)]
+
+
+def _write_order(hosts, results):
+    # sorted 是稳定排序，保持配置顺序
+    return sorted(hosts, key=lambda host: not _is_healthy(results, (host, LDAPS_PORT)))
+
+
+def ranked_controllers(value=None, port=LDAPS_PORT):
+    """按 (不可达排在最后, 握手耗时) 排序的域控列表；只有一台域控时无需排序，不做探测"""
+    hosts = parse_controllers(value if value is not None else CONFIG.get('DOMAIN_CONTROLLER_IP'))
+    if len(hosts) <= 1:
+        return list(hosts)
+    return _read_order(hosts, port, _current_results(tuple((host, port) for host in hosts)))
+
+
+def read_controllers(value=None):
+    """读操作使用的域控，最近的健康域控在前；按读端口 (read_port) 的探测结果排序"""
+    return ranked_controllers(_read_hosts(value), read_port())
+
+
+def write_controllers(value=None):
+    """写操作使用的域控：固定的写域控在前，其余按配置顺序作为故障切换备选 (不按延迟排序)"""
+    hosts = _write_hosts(value)
+    if len(hosts) <= 1:
+        return list(hosts)
+    return _write_order(hosts, _current_results(tuple((host, LDAPS_PORT) for host in hosts)))
+
+
+def mark_down(host, error, port=LDAPS_PORT):
+    """连接时发现域控不可用：立即降级排序，并提前触发下一轮探测"""
+    with _lock:
+        if (host, port) in _state['targets']:
+            _state['results'] = {**_state['results'], (host, port): (False, None, error)}
+            _state['checked_at'] = 0.0
+
+
+def any_controller_reachable():
+    """重新探测所有域控，任意一台可达即返回 True (熔断器断开后的恢复探测)"""
+    targets = _all_targets()
+    if not targets:
+        return False
+    return any(healthy for healthy, _, _ in _refresh(targets).values())
+
+
+def status():
+    """
+    设置页面展示用：[{'host', 'port', 'healthy', 'latency_ms', 'error', 'reader', 'writer'}, ...]，按读排序。
+    reader / writer 标记当前用于读、写的域控；全部基于同一份探测结果计算，不会前后不一致。
+    """
+    targets = _all_targets()
+    if not targets:
+        return []
+    results = _current_results(targets)
+    port = read_port()
+    readers = _read_order(_read_hosts(), port, results)
+    writers = _write_order(_write_hosts(), results)
+    reader = (readers[0], port) if readers else None
+    writer = (writers[0], LDAPS_PORT) if writers else None
+    rows = []
+    for target in _rank(list(targets), results):
+        healthy, latency, error = results.get(target, (None, None, None))
+        rows.append({'host': target[0], 'port': target[1], 'healthy': healthy, 'latency_ms': latency,
+                     'error': error, 'reader': target == reader, 'writer': target == writer})
+    return rows
@@ -0,0 +1,100 @@
+# /deadlines.py
+"""
+请求级截止时间，传递到该请求内的每个 LDAP 操作：
+  - 搜索带上 time_limit (剩余秒数，向上取整)，由域控在服务端停止搜索
+  - 每个操作前把套接字接收超时设为 剩余时间 + DEADLINE_GRACE，域控无响应时不会一直阻塞 worker
+  - 新建连接的连接超时不超过剩余时间
+超时后抛出 DeadlineExceeded；读取 OU/安全组列表的调用方据此回退到缓存数据。
+
+每个端点的时限 (秒) 在 config.json 的 REQUEST_DEADLINES 中覆盖，null 表示不限制；
+未列出的端点使用 DEFAULT_REQUEST_DEADLINE。
+不限时的请求 (及请求之外的调用) 中，每个操作仍受 LDAP_RECEIVE_TIMEOUT 约束。
+"""
+import math
+import time
+import contextvars
+from contextlib import contextmanager
+from flask import request, g
+from utils import CONFIG
+
+DEFAULT_REQUEST_DEADLINE = CONFIG.get('DEFAULT_REQUEST_DEADLINE', 15)
+LDAP_RECEIVE_TIMEOUT = CONFIG.get('LDAP_RECEIVE_TIMEOUT', 60)
+DEADLINE_GRACE = CONFIG.get('DEADLINE_GRACE', 1.0)
+
+# 批量创建按行数耗时、进度事件流持续到任务结束，不设整体时限
+DEFAULT_REQUEST_DEADLINES = {'main.dashboard': 10, 'auth.login': 10, 'main.batch_create': None,
+                             'api.bulk_create_users': None, 'main.batch_job_events': None}
+
+# 当前请求的截止时间 (time.monotonic())，None 表示不限制
+current_deadline = contextvars.ContextVar('current_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """请求已超过截止时间"""
+
+    def __init__(self, message=None):
+        super().__init__(message or "操作超时：域控未在请求时限内响应，请稍后重试。")
+
+
+def endpoint_deadline(endpoint):
+    deadlines = dict(DEFAULT_REQUEST_DEADLINES)
+    deadlines.update(CONFIG.get('REQUEST_DEADLINES', {}))
+    return deadlines.get(endpoint, DEFAULT_REQUEST_DEADLINE)
+
+
+def remaining():
+    """剩余秒数 (可能为负)；没有截止时间时返回 None"""
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check():
+    if expired():
+        raise DeadlineExceeded()
+
+
+def time_limit():
+    """搜索的服务端 time_limit (整秒，0 表示不限制)"""
+    left = remaining()
+    return 0 if left is None else max(1, math.ceil(left))
+
+
+def receive_timeout():
+    left = remaining()
+    return LDAP_RECEIVE_TIMEOUT if left is None else max(0.1, min(LDAP_RECEIVE_TIMEOUT, left + DEADLINE_GRACE))
+
+
+def connect_timeout(default):
+    left = remaining()
+    return default if left is None else max(0.1, min(default, left))
+
+
+@contextmanager
+def deadline(seconds):
+    """在请求之外 (如命令行工具) 为一段代码设置截止时间；seconds 为 None 时不限制"""
+    token = current_deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def _before_request():
+    seconds = endpoint_deadline(request.endpoint)
+    g.deadline_token = current_deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+def _teardown_request(exc):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        current_deadline.reset(token)
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
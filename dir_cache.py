@@ -0,0 +1,227 @@
+# /dir_cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from utils import CONFIG
+
+try:
+    import fcntl  # 仅在类 Unix 系统上可用，用于跨 worker 的文件锁
+except ImportError:
+    fcntl = None
+
+CACHE_DIR = CONFIG.get('CACHE_DIR', 'cache')
+DEFAULT_TTL = CONFIG.get('DIRECTORY_CACHE_TTL', 300)
+
+GENERATION_FILE = os.path.join(CACHE_DIR, 'generations.json')
+
+_MISS = object()
+_lock = threading.Lock()
+_entries = {}   # key -> (fetched_at, generation, value)
+_inflight = {}  # key -> _Flight
+_local = {}     # key -> (generation, value)，仅进程内缓存
+_generations = {'stamp': None, 'data': {}}
+
+
+class _Flight:
+    """一次正在进行中的目录拉取，同一进程内的并发调用者共享其结果。"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def cache_key(*parts):
+    """由 (域, 地区, 对象类型) 等部分组成缓存键；最后一段是失效时使用的命名空间"""
+    return ':'.join(str(p) for p in parts)
+
+
+def _namespace(key):
+    return key.rsplit(':', 1)[-1]
+
+
+def _current_generations():
+    """读取代际计数文件；只有文件被替换过 (inode/mtime 变化) 才重新解析。"""
+    try:
+        st = os.stat(GENERATION_FILE)
+    except FileNotFoundError:
+        return {}
+    stamp = (st.st_ino, st.st_mtime_ns)
+    if stamp != _generations['stamp']:
+        try:
+            with open(GENERATION_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return _generations['data']
+        _generations.update(stamp=stamp, data=data)
+    return _generations['data']
+
+
+def _generation(key):
+    return _current_generations().get(_namespace(key), 0)
+
+
+def _cache_path(key, suffix):
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, f"{digest}.{suffix}")
+
+
+def _lookup_memory(key, ttl):
+    entry = _entries.get(key)
+    if entry and time.time() - entry[0] < ttl and entry[1] == _generation(key):
+        return entry[2]
+    return _MISS
+
+
+def _read_file(key, ttl, decode):
+    try:
+        with open(_cache_path(key, 'json'), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return _MISS
+    generation = _generation(key)
+    if time.time() - data.get('fetched_at', 0) >= ttl or data.get('generation', 0) != generation:
+        return _MISS
+    value = decode(data['value']) if decode else data['value']
+    _entries[key] = (data['fetched_at'], generation, value)
+    return value
+
+
+def _write_json(path, data):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)  # 原子替换，其他 worker 不会读到半个文件
+
+
+def _write_file(key, fetched_at, generation, value):
+    _write_json(_cache_path(key, 'json'),
+                {'key': key, 'fetched_at': fetched_at, 'generation': generation, 'value': value})
+
+
+@contextmanager
+def _file_lock(key):
+    """跨 worker 的互斥：同一时刻只有一个进程针对该键访问域控。"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_cache_path(key, 'lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _fetch_shared(key, fetch_func, ttl, decode):
+    with _file_lock(key):
+        # 等锁期间其他 worker 可能已经拉取并写入了结果
+        value = _read_file(key, ttl, decode)
+        if value is _MISS:
+            # 先记录代际：拉取期间若发生写入失效，结果会以旧代际保存并在下次读取时被丢弃
+            generation = _generation(key)
+            fetched_at = time.time()
+            value = fetch_func()
+            _write_file(key, fetched_at, generation, value)
+            if decode:
+                value = decode(value)
+            _entries[key] = (fetched_at, generation, value)
+    return value
+
+
+def get_or_fetch(key, fetch_func, ttl=None, decode=None):
+    """
+    读取缓存；未命中时以 singleflight 方式调用 fetch_func。
+    同一进程内的并发调用者等待同一次拉取，其他 worker 通过文件锁等待并复用写入的结果。
+    fetch_func 的返回值必须可 JSON 序列化；抛出的异常会传递给所有等待者且不会被缓存。
+    decode 用于把 JSON 值转换为内存中的紧凑结构，文件中始终保存原始 JSON 值。
+    """
+    ttl = DEFAULT_TTL if ttl is None else ttl
+    value = _lookup_memory(key, ttl)
+    if value is not _MISS:
+        return value
+
+    with _lock:
+        flight = _inflight.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _inflight[key] = _Flight()
+
+    if not is_leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    try:
+        flight.value = _fetch_shared(key, fetch_func, ttl, decode)
+        return flight.value
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        flight.done.set()
+
+
+def get_stale(key, decode=None):
+    """
+    域控不可达时的降级读取：返回最近一次成功拉取的 (value, fetched_at)，忽略 TTL 和代际；
+    从未拉取过时返回 None。
+    """
+    entry = _entries.get(key)
+    if entry:
+        return entry[2], entry[0]
+    try:
+        with open(_cache_path(key, 'json'), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    value = decode(data['value']) if decode else data['value']
+    # 以代际 -1 保存，下次正常读取时仍视为未命中并重新拉取
+    _entries[key] = (data['fetched_at'], -1, value)
+    return value, data['fetched_at']
+
+
+def get_local(key, loader):
+    """
+    进程内缓存 loader() 的结果 (如规则、职位数据)，不设 TTL。
+    只有对应命名空间被 invalidate 后才会重新加载，返回值应视为只读。
+    """
+    generation = _generation(key)
+    entry = _local.get(key)
+    if entry and entry[0] == generation:
+        return entry[1]
+    value = loader()
+    _local[key] = (generation, value)
+    return value
+
+
+def invalidate(*namespaces):
+    """
+    写入后调用：递增这些命名空间的代际计数。
+    本节点上所有 worker 在下一次读取时都会发现代际变化并丢弃旧缓存。
+    """
+    with _file_lock('generations'):
+        _generations['stamp'] = None  # 强制重新读取，避免基于过期的计数递增
+        data = dict(_current_generations())
+        invalidated_at = dict(data.get('_invalidated_at', {}))
+        for namespace in namespaces:
+            data[namespace] = data.get(namespace, 0) + 1
+            invalidated_at[namespace] = time.time()
+        data['_invalidated_at'] = invalidated_at
+        _write_json(GENERATION_FILE, data)
+    with _lock:
+        for key in [k for k in _entries if _namespace(k) in namespaces]:
+            _entries.pop(key, None)
+
+
+def invalidated_within(namespace, seconds):
+    """本节点上任意 worker 是否在最近 seconds 秒内失效过该命名空间 (即刚刚写入过)"""
+    return time.time() - _current_generations().get('_invalidated_at', {}).get(namespace, 0) < seconds
@@ -0,0 +1,151 @@
+# /dn_store.py
+import sys
+from array import array
+from collections import namedtuple
+from dn_utils import parse_dn, split_rdn
+
+# 批量构建时绕过 LRU：一次性的数万个 DN 不应挤掉缓存，也不应被缓存引用而无法释放
+_parse_dn_uncached = parse_dn.__wrapped__
+_split_rdn_uncached = split_rdn.__wrapped__
+
+# 模板中使用的下拉选项：完整 DN、相对于 Base DN 的显示路径、叶子节点名称
+DNOption = namedtuple('DNOption', ['dn', 'name', 'leaf'])
+
+
+class DNStore:
+    """
+    紧凑的 DN 集合。
+    所有 DN 组成一棵树：每个节点只保存驻留 (intern) 后的 RDN 和父节点下标，
+    成千上万次重复的 'OU=...,DC=sk1,DC=net,DC=cn' 后缀只保存一份。
+    RDN 的值 (去掉 'OU=' 等前缀) 在构造时一次性拆出并驻留，
+    完整 DN 和显示名称在需要时沿父指针拼接，渲染时无需再解析字符串。
+    """
+
+    def __init__(self, dns=(), base_dn=None):
+        self._rdns = []                # 节点 -> RDN
+        self._values = []              # 节点 -> RDN 值，用于显示
+        self._parents = array('i')     # 节点 -> 父节点，-1 表示根
+        self._is_member = bytearray()  # 节点本身是否在集合中 (中间节点可能只是后缀)
+        index = {}                     # 仅构造期间使用: (父节点, RDN) -> 节点
+
+        members = []
+        for dn in sorted(set(dns)):
+            node = -1
+            for rdn in reversed(_parse_dn_uncached(dn)):
+                key = (node, rdn)
+                child = index.get(key)
+                if child is None:
+                    child = len(self._rdns)
+                    index[key] = child
+                    self._rdns.append(sys.intern(rdn))
+                    self._values.append(sys.intern(_split_rdn_uncached(rdn)[1]))
+                    self._parents.append(node)
+                    self._is_member.append(0)
+                node = child
+            if node >= 0 and not self._is_member[node]:
+                self._is_member[node] = 1
+                members.append(node)
+        self._members = array('i', members)  # 按 DN 排序
+
+        # 子节点按 RDN 排序后以 CSR 形式保存 (偏移数组 + 子节点数组)，查找时二分
+        children = [[] for _ in range(len(self._rdns) + 1)]  # 最后一项存放根节点
+        for (parent, rdn), child in sorted(index.items(), key=lambda item: item[0][1]):
+            children[parent].append(child)
+        self._child_offsets = array('i', [0])
+        self._child_nodes = array('i')
+        for node_children in children:
+            self._child_nodes.extend(node_children)
+            self._child_offsets.append(len(self._child_nodes))
+
+        self._base_node = self._find(base_dn) if base_dn else -1
+
+    def _children_of(self, node):
+        slot = node if node >= 0 else len(self._rdns)
+        return self._child_nodes[self._child_offsets[slot]:self._child_offsets[slot + 1]]
+
+    def _find_child(self, node, rdn):
+        candidates = self._children_of(node)
+        lo, hi = 0, len(candidates)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._rdns[candidates[mid]] < rdn:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(candidates) and self._rdns[candidates[lo]] == rdn:
+            return candidates[lo]
+        return None
+
+    def _find(self, dn):
+        """DN -> 节点下标，O(深度 · log 分支数)；不存在时返回 None"""
+        node = -1
+        for rdn in reversed(parse_dn(dn)):
+            node = self._find_child(node, rdn)
+            if node is None:
+                return None
+        return node if node >= 0 else None
+
+    def _dn(self, node):
+        parts = []
+        while node >= 0:
+            parts.append(self._rdns[node])
+            node = self._parents[node]
+        return ','.join(parts)
+
+    def _display_name(self, node):
+        values = []
+        while node >= 0 and node != self._base_node:
+            values.append(self._values[node])
+            node = self._parents[node]
+        values.reverse()
+        return ' / '.join(values) if values else "Domain Root"
+
+    def __len__(self):
+        return len(self._members)
+
+    def __iter__(self):
+        return (self._dn(node) for node in self._members)
+
+    def __contains__(self, dn):
+        node = self._find(dn)
+        return node is not None and bool(self._is_member[node])
+
+    def to_list(self):
+        """还原为排序后的 DN 字符串列表 (用于序列化)"""
+        return list(self)
+
+    def parent(self, dn):
+        """父 DN；DN 不在树中或已是根时返回 None"""
+        node = self._find(dn)
+        if node is None or self._parents[node] < 0:
+            return None
+        return self._dn(self._parents[node])
+
+    def children(self, dn):
+        """集合中直接位于 dn 之下的 DN"""
+        node = self._find(dn)
+        if node is None:
+            return []
+        return [self._dn(child) for child in self._children_of(node) if self._is_member[child]]
+
+    def subtree(self, dn):
+        """集合中位于 dn 子树内 (含自身) 的所有 DN，耗时与子树大小成正比"""
+        node = self._find(dn)
+        if node is None:
+            return []
+        result, stack = [], [node]
+        while stack:
+            current = stack.pop()
+            if self._is_member[current]:
+                result.append(self._dn(current))
+            stack.extend(self._children_of(current))
+        return sorted(result)
+
+    def display_name(self, dn):
+        node = self._find(dn)
+        return self._display_name(node) if node is not None else None
+
+    def options(self):
+        """供模板渲染的下拉选项，按 DN 排序"""
+        for node in self._members:
+            yield DNOption(self._dn(node), self._display_name(node), self._values[node])
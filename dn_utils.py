@@ -0,0 +1,151 @@
+# /dn_utils.py
+"""
+DN 解析工具：支持转义字符 (如 'OU=Sales\\, East')，解析结果带 LRU 缓存。
+应用中所有对 DN 的拆分、取父级、比较都应通过这里完成，不要直接 split(',')。
+"""
+from functools import lru_cache
+
+DN_CACHE_SIZE = 65536
+
+_ESCAPE_CHARS = ',+"\\<>;='
+
+
+def _split_unescaped(text, separator):
+    """按未转义、不在引号内的分隔符拆分，保留原始转义"""
+    parts, current = [], []
+    escaped = quoted = False
+    for ch in text:
+        if escaped:
+            current.append(ch)
+            escaped = False
+        elif ch == '\\':
+            current.append(ch)
+            escaped = True
+        elif ch == '"':
+            current.append(ch)
+            quoted = not quoted
+        elif ch == separator and not quoted:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append(''.join(current))
+    return parts
+
+
+def _strip_unescaped(text):
+    """去掉首尾空白，但保留被转义的末尾空格 ('a\\ ')"""
+    stripped = text.strip()
+    if not stripped.endswith('\\'):
+        return stripped
+    text = text.lstrip()
+    if len(stripped) < len(text) and (len(stripped) - len(stripped.rstrip('\\'))) % 2 == 1:
+        stripped += text[len(stripped)]
+    return stripped
+
+
+def unescape_value(value):
+    """还原 RDN 值中的转义：'\\,' -> ','，'\\E6\\AD\\A6' -> '武'"""
+    value = _strip_unescaped(value)
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1]
+    if '\\' not in value:
+        return value
+    result = bytearray()
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch == '\\' and i + 1 < len(value):
+            pair = value[i + 1:i + 3]
+            if len(pair) == 2 and all(c in '0123456789abcdefABCDEF' for c in pair):
+                result.append(int(pair, 16))
+                i += 3
+                continue
+            result.extend(value[i + 1].encode('utf-8'))
+            i += 2
+            continue
+        result.extend(ch.encode('utf-8'))
+        i += 1
+    return result.decode('utf-8', errors='replace')
+
+
+def escape_rdn_value(value):
+    """转义 RDN 值，用于拼接 DN (如 CN={显示名})"""
+    escaped = ''.join('\\' + ch if ch in _ESCAPE_CHARS else ch for ch in value)
+    if escaped.startswith((' ', '#')):
+        escaped = '\\' + escaped
+    if escaped.endswith(' ') and escaped != '\\ ':  # 值只有一个空格时开头的转义已覆盖
+        escaped = escaped[:-1] + '\\ '
+    return escaped
+
+
+@lru_cache(maxsize=DN_CACHE_SIZE)
+def parse_dn(dn):
+    """DN -> RDN 元组 (从叶子到根)，保留原始转义"""
+    if not dn:
+        return ()
+    rdns = []
+    for part in _split_unescaped(dn, ','):
+        rdn = part.strip()
+        if rdn.endswith('\\'):
+            rdn = _strip_unescaped(part)
+        if rdn:
+            rdns.append(rdn)
+    return tuple(rdns)
+
+
+def _split_ava(ava):
+    if '=' not in ava:
+        return '', unescape_value(ava)
+    attr = _split_unescaped(ava, '=')[0]
+    return attr.strip(), unescape_value(ava[len(attr) + 1:])
+
+
+@lru_cache(maxsize=DN_CACHE_SIZE)
+def split_rdn(rdn):
+    """'OU=Sales\\, East' -> ('OU', 'Sales, East')；多值 RDN ('CN=a+UID=b') 取第一个属性"""
+    return _split_ava(_split_unescaped(rdn, '+')[0] if '+' in rdn else rdn)
+
+
+def rdn_value(rdn):
+    return split_rdn(rdn)[1]
+
+
+def parent_dn(dn):
+    """父级 DN；已经是根时返回空字符串"""
+    return ','.join(parse_dn(dn)[1:])
+
+
+@lru_cache(maxsize=DN_CACHE_SIZE)
+def normalize_dn(dn):
+    """
+    规范形式：属性名和值小写、去掉多余空格、统一转义，用于大小写无关的比较。
+    多值 RDN 的各个属性排序后以 '+' 连接，与书写顺序无关；值中的 '+' 始终转义，不会与多值 RDN 混淆。
+    """
+    normalized = []
+    for rdn in parse_dn(dn):
+        if '+' in rdn:
+            avas = sorted(f"{attr.lower()}={escape_rdn_value(value.lower())}"
+                          for attr, value in map(_split_ava, _split_unescaped(rdn, '+')))
+            normalized.append('+'.join(avas))
+        else:
+            attr, value = split_rdn(rdn)
+            normalized.append(f"{attr.lower()}={escape_rdn_value(value.lower())}")
+    return ','.join(normalized)
+
+
+@lru_cache(maxsize=DN_CACHE_SIZE)
+def dn_suffixes(dn):
+    """DN 自身及其所有祖先的规范形式，用于判断某个 DN 是否位于另一个 DN 之下"""
+    # 规范形式中值里的逗号都已转义，按未转义的逗号拆分即可
+    rdns = _split_unescaped(normalize_dn(dn), ',') if dn else []
+    return frozenset(','.join(rdns[i:]) for i in range(len(rdns)))
+
+
+def is_within(dn, ancestor_dn):
+    """dn 是否等于 ancestor_dn 或位于其子树中 (大小写无关)"""
+    return normalize_dn(ancestor_dn) in dn_suffixes(dn)
+
+
+def same_dn(dn_a, dn_b):
+    return normalize_dn(dn_a) == normalize_dn(dn_b)
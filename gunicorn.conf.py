@@ -0,0 +1,29 @@
+# /gunicorn.conf.py
+# gunicorn 多线程部署配置，用法: gunicorn wsgi:app (gunicorn 会自动读取当前目录下的 gunicorn.conf.py)
+# 这个文件在 master 进程中执行，不能导入 wsgi/run/utils：一旦导入应用，master 就已经加载了应用，
+# preload_app = False 也不再生效，每个 worker 都继承 master 中的状态。因此这里直接读取 config.json。
+import json
+import os
+
+
+def _load_config():
+    try:
+        with open('config.json', 'r', encoding='utf-8') as f:
+            return json.loads(f.read() or '{}')
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+_CONFIG = _load_config()
+
+# 每个 worker 进程内多个线程并发处理请求，LDAP 连接通过连接池独占借出，会话保存在服务端存储中。
+# 批量创建会长时间占用一个线程，timeout 需要足够长。
+# 批量任务的 SSE 进度连接也各占一个线程：每个 worker 最多 BATCH_SSE_MAX_STREAMS 个 (默认 2)，
+# threads 应比它大出交互请求所需的余量；调大 BATCH_SSE_MAX_STREAMS 时同步调大 threads。
+bind = os.environ.get('ADUSER_BIND', '0.0.0.0:5001')
+worker_class = 'gthread'
+workers = int(os.environ.get('ADUSER_WORKERS') or _CONFIG.get('GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('ADUSER_THREADS') or _CONFIG.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('ADUSER_TIMEOUT') or _CONFIG.get('GUNICORN_TIMEOUT', 300))
+# 与 wsgi.preload_enabled() 使用同样的开关：开启时 master 在 fork 前导入 wsgi 并预加载目录快照
+preload_app = os.environ.get('ADUSER_PRELOAD') == '1' or bool(_CONFIG.get('PRELOAD_DIRECTORY'))
@@ -0,0 +1,200 @@
+# /hr_watcher.py
+"""
+监视 HR 投放目录，自动导入每天导出的新员工 CSV，替代手工上传到 /batch_create。
+
+    cd /opt/aduser && python -m hr_watcher --credentials /etc/aduser/bind.json
+    python -m hr_watcher --credentials bind.json --once      # 只扫描一次 (适合 cron)
+
+每隔 HR_POLL_INTERVAL 秒扫描 HR_DROP_DIR 中的 *.csv：
+  - 最后修改超过 HR_SETTLE_SECONDS 秒的文件才处理，避免读到仍在复制中的文件
+  - 按内容的 SHA-256 去重：同样内容的文件再次投放时不重复导入，直接移到归档目录的 duplicates/ 下
+  - 逐个文件经 bulk_import 的同一流程导入 (batch 通道，工作线程数上限 HR_WORKERS)
+  - 处理完的文件和结果报告一起移到 HR_ARCHIVE_DIR/<日期>/，无法解析的文件移到 rejected/
+已处理文件的哈希记录在 HR_ARCHIVE_DIR/processed.json。导入中途进程退出时，
+重启后同一文件按已写入的报告继续，不会重复创建已成功的用户；有出错行 (如中途域控断开) 的文件
+归档后不记为已处理，重新投放同一文件时只重试未成功的行。
+无法连接域控或绑定失败时文件保留在投放目录，下一轮重试。
+"""
+import os
+import sys
+import csv
+import json
+import time
+import signal
+import shutil
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from utils import CONFIG
+from bulk_import import load_credentials, check_bind, completed_logins, import_rows
+
+HR_DROP_DIR = CONFIG.get('HR_DROP_DIR', 'hr_drop')
+HR_ARCHIVE_DIR = CONFIG.get('HR_ARCHIVE_DIR', 'hr_archive')
+HR_POLL_INTERVAL = CONFIG.get('HR_POLL_INTERVAL', 60)
+HR_SETTLE_SECONDS = CONFIG.get('HR_SETTLE_SECONDS', 10)
+HR_WORKERS = CONFIG.get('HR_WORKERS')
+
+_stop = threading.Event()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ProcessedIndex:
+    """已处理文件的哈希 -> 处理记录，保存在归档目录的 JSON 文件中"""
+
+    def __init__(self, archive_dir):
+        self.path = os.path.join(archive_dir, 'processed.json')
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def get(self, digest):
+        return self.entries.get(digest)
+
+    def set(self, digest, entry):
+        self.entries[digest] = entry
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def pending_files(drop_dir, settle_seconds):
+    """投放目录中已写完的 CSV 文件，按修改时间排序"""
+    now = time.time()
+    files = []
+    for entry in os.scandir(drop_dir):
+        if entry.is_file() and entry.name.lower().endswith('.csv'):
+            mtime = entry.stat().st_mtime
+            if now - mtime >= settle_seconds:
+                files.append((mtime, entry.path))
+    return [path for _, path in sorted(files)]
+
+
+def _archive_path(directory, name):
+    """归档目录中不与已有文件重名的路径"""
+    os.makedirs(directory, exist_ok=True)
+    stem, ext = os.path.splitext(name)
+    path, n = os.path.join(directory, name), 1
+    while os.path.exists(path):
+        path, n = os.path.join(directory, f"{stem}.{n}{ext}"), n + 1
+    return path
+
+
+def process_file(path, index, archive_dir, bind_username, bind_password, workers=None):
+    """导入一个文件；返回 False 表示暂时无法处理 (如域控不可达)，文件留在投放目录等待下一轮"""
+    from batch import parse_csv
+
+    name = os.path.basename(path)
+    digest = file_hash(path)
+    entry = index.get(digest)
+    if entry and entry.get('status') == 'done':
+        target = _archive_path(os.path.join(archive_dir, 'duplicates'), name)
+        shutil.move(path, target)
+        print(f"INFO: '{name}' 与 {entry['processed_at']} 处理过的 '{entry['file']}' 内容相同，已跳过: {target}")
+        return True
+
+    try:
+        with open(path, 'rb') as f:
+            rows = parse_csv(f.read())
+    except (UnicodeDecodeError, csv.Error) as e:
+        target = _archive_path(os.path.join(archive_dir, 'rejected'), name)
+        shutil.move(path, target)
+        print(f"ERROR: '{name}' 不是有效的 UTF-8 CSV 文件 ({e})，已移到 {target}", file=sys.stderr)
+        return True
+
+    success, message = check_bind(bind_username, bind_password)
+    if not success:
+        print(f"ERROR: {message}，'{name}' 将在下一轮重试。", file=sys.stderr)
+        return False
+
+    resuming = bool(entry)  # 上次处理到一半或有出错的行，按已写入的报告继续
+    if resuming:
+        report_path = entry['report']
+        done = completed_logins(report_path)
+        rows = [(line_no, row) for line_no, row in rows if len(row) < 2 or row[1].strip() not in done]
+        print(f"继续处理 '{name}'：跳过 {len(done)} 个已成功的登录名，剩余 {len(rows)} 行。")
+    else:
+        day_dir = os.path.join(archive_dir, datetime.now().strftime('%Y-%m-%d'))
+        report_path = _archive_path(day_dir, os.path.splitext(name)[0] + '.report.csv')
+        entry = {'file': name, 'status': 'running', 'report': report_path,
+                 'started_at': datetime.now().isoformat(timespec='seconds')}
+        index.set(digest, entry)
+        print(f"开始导入 '{name}': {len(rows)} 行，结果报告: {report_path}")
+
+    counts, elapsed = import_rows(rows, bind_username, bind_password, report_path, workers=workers,
+                                  append=resuming)
+    target = _archive_path(os.path.dirname(report_path), name)
+    shutil.move(path, target)
+    # 有错误 (如导入中途域控断开) 时不记为完成：同一文件再次投放时按报告继续，只重试未成功的行
+    status = 'done' if counts['error'] == 0 else 'incomplete'
+    entry.update({'status': status, 'archived_as': target, 'counts': counts,
+                  'processed_at': datetime.now().isoformat(timespec='seconds')})
+    index.set(digest, entry)
+    print(f"完成 '{name}': 用时 {elapsed:.1f} 秒 — 成功 {counts['success']}，失败 {counts['failure']}，"
+          f"跳过 {counts['skipped']}，错误 {counts['error']}。已归档到 {target}")
+    if status == 'incomplete':
+        print(f"WARNING: '{name}' 有 {counts['error']} 行出错，未记为已处理；重新投放该文件即可重试未成功的行。",
+              file=sys.stderr)
+    return True
+
+
+def scan_once(drop_dir, archive_dir, bind_username, bind_password, settle_seconds=HR_SETTLE_SECONDS,
+              workers=HR_WORKERS):
+    """处理投放目录中当前所有已写完的文件"""
+    index = ProcessedIndex(archive_dir)
+    for path in pending_files(drop_dir, settle_seconds):
+        if _stop.is_set():
+            return
+        try:
+            if not process_file(path, index, archive_dir, bind_username, bind_password, workers):
+                return  # 域控不可达时其余文件也无法处理
+        except Exception as e:
+            print(f"ERROR: 处理 '{os.path.basename(path)}' 时出错: {e}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='监视 HR 投放目录并自动批量导入新员工 CSV。')
+    parser.add_argument('--drop-dir', default=HR_DROP_DIR)
+    parser.add_argument('--archive-dir', default=HR_ARCHIVE_DIR)
+    parser.add_argument('--interval', type=float, default=HR_POLL_INTERVAL, help='扫描间隔 (秒)')
+    parser.add_argument('--settle', type=float, default=HR_SETTLE_SECONDS,
+                        help='文件最后修改超过该秒数才处理')
+    parser.add_argument('--workers', type=int, default=HR_WORKERS, help='工作线程数上限 (默认 BATCH_WORKERS)')
+    parser.add_argument('--bind-user', help='绑定账号')
+    parser.add_argument('--credentials', help='包含 bind_username / bind_password 的 JSON 凭据文件')
+    parser.add_argument('--once', action='store_true', help='只扫描一次后退出')
+    args = parser.parse_args(argv)
+
+    try:
+        bind_username, bind_password = load_credentials(args.bind_user, args.credentials)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    os.makedirs(args.drop_dir, exist_ok=True)
+    os.makedirs(args.archive_dir, exist_ok=True)
+
+    # 收到 SIGTERM/SIGINT 后处理完当前文件再退出
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: _stop.set())
+
+    print(f"INFO: 监视 '{args.drop_dir}'，每 {args.interval:g} 秒扫描一次，归档到 '{args.archive_dir}'。")
+    while not _stop.is_set():
+        scan_once(args.drop_dir, args.archive_dir, bind_username, bind_password, args.settle, args.workers)
+        if args.once:
+            break
+        _stop.wait(args.interval)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
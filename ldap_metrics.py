@@ -0,0 +1,306 @@
+# /ldap_metrics.py
+"""
+LDAP 操作埋点与 Prometheus 文本格式导出。
+指标保存在各 worker 进程内存中，/metrics 返回的是处理该请求的 worker 的数据。
+"""
+import time
+import random
+import threading
+import contextvars
+from ldap3 import Connection
+from ldap3.core.exceptions import LDAPSocketReceiveError
+import audit
+import deadlines
+from scheduler import SCHEDULER, LANES, current_lane
+
+# 写入审计日志的操作
+AUDITED_OPERATIONS = {'add', 'modify', 'delete', 'modify_dn'}
+
+# 域控返回 busy (51) / unavailable (52) 时可以安全重发的操作，重试间隔带随机抖动
+IDEMPOTENT_OPERATIONS = {'bind', 'search'}
+RETRYABLE_RESULTS = {51, 52}
+LDAP_RETRY_ATTEMPTS = 3
+LDAP_RETRY_BASE_DELAY = 0.2
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name, self.documentation, self.label_names = name, documentation, tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            if not self.label_names and not self._values:
+                lines.append(f"{self.name} 0")
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.label_names = name, documentation, tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label_values -> [每个桶的计数..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value):
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, data in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, data):
+                    labels = _format_labels(self.label_names, label_values, [('le', repr(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.label_names, label_values, [('le', '+Inf')])
+                lines.append(f"{self.name}_bucket{labels} {data[-1]}")
+                plain = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{plain} {data[-2]}")
+                lines.append(f"{self.name}_count{plain} {data[-1]}")
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+LDAP_OP_DURATION = register(Histogram('aduser_ldap_operation_duration_seconds', 'LDAP operation latency.',
+                                      ('operation', 'call_site')))
+LDAP_OPS = register(Counter('aduser_ldap_operations_total', 'LDAP operations by LDAP result code.',
+                            ('operation', 'call_site', 'result')))
+LDAP_ENTRIES = register(Counter('aduser_ldap_entries_returned_total', 'Entries returned by LDAP searches.',
+                                ('call_site',)))
+LDAP_BYTES = register(Counter('aduser_ldap_bytes_total', 'Bytes exchanged with the domain controller.',
+                              ('direction', 'call_site')))
+BATCHES = register(Counter('aduser_batches_total', 'Batch create jobs processed.'))
+BATCH_ROWS = register(Counter('aduser_batch_rows_total', 'Batch create rows by outcome.', ('outcome',)))
+BATCH_SECONDS = register(Counter('aduser_batch_seconds_total', 'Wall time spent processing batch jobs.'))
+LDAP_BUDGET_EXCEEDED = register(Counter('aduser_ldap_budget_exceeded_total',
+                                        'Requests that used more LDAP round-trips than their budget.',
+                                        ('method', 'endpoint')))
+LDAP_CONNECT_PHASE = register(Histogram('aduser_ldap_connect_phase_seconds',
+                                        'Time spent opening connections, by phase (dns, connect, tls).', ('phase',)))
+LDAP_TLS_HANDSHAKES = register(Counter('aduser_ldap_tls_handshakes_total',
+                                       'TLS handshakes with the domain controller, full or resumed.', ('kind',)))
+LDAP_QUEUE_WAIT = register(Histogram('aduser_ldap_queue_wait_seconds',
+                                     'Time LDAP operations waited for a scheduler slot, by lane.', ('lane',)))
+LDAP_IN_FLIGHT = register(Gauge('aduser_ldap_in_flight', 'LDAP operations currently in flight, by lane.', ('lane',)))
+LDAP_CONCURRENCY_LIMIT = register(Gauge('aduser_ldap_concurrency_limit',
+                                         'Current adaptive concurrency limit, by scheduler lane.', ('lane',)))
+LDAP_RETRIES = register(Counter('aduser_ldap_retries_total', 'LDAP operations retried after busy/unavailable.',
+                                ('operation', 'result')))
+LDAP_DEADLINE_EXCEEDED = register(Counter('aduser_ldap_deadline_exceeded_total',
+                                          'LDAP operations aborted by the request deadline.', ('call_site',)))
+LDAP_CIRCUIT_OPEN = register(Gauge('aduser_ldap_circuit_open',
+                                   '1 while the LDAP circuit breaker is open and connections fail fast.'))
+
+for _lane in LANES:
+    LDAP_CONCURRENCY_LIMIT.set(_lane, value=SCHEDULER.lane_limits.get(_lane, SCHEDULER.max_in_flight))
+
+# 当前请求的 LDAP 操作收集器，由 request_timing 在请求开始时设置
+current_request_ops = contextvars.ContextVar('current_request_ops', default=None)
+
+
+def render_prometheus():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def record_operation(operation, call_site, duration, result, entries=0, bytes_sent=0, bytes_received=0):
+    collector = current_request_ops.get()
+    if collector is not None:
+        collector.record(operation, duration)
+    LDAP_OP_DURATION.observe(operation, call_site, value=duration)
+    LDAP_OPS.inc(operation, call_site, str(result))
+    if entries:
+        LDAP_ENTRIES.inc(call_site, amount=entries)
+    if bytes_sent:
+        LDAP_BYTES.inc('sent', call_site, amount=bytes_sent)
+    if bytes_received:
+        LDAP_BYTES.inc('received', call_site, amount=bytes_received)
+
+
+def record_connect_phase(phase, duration):
+    """记录建立连接各阶段的耗时，同时计入当前请求的 Server-Timing (不算作 LDAP 往返)"""
+    collector = current_request_ops.get()
+    if collector is not None:
+        collector.record(phase, duration)
+    LDAP_CONNECT_PHASE.observe(phase, value=duration)
+
+
+class InstrumentedConnection(Connection):
+    """
+    记录每次 bind/search/add/modify/delete/modify_dn/unbind 的耗时、结果码、返回条目数和字节数，
+    并以创建连接时传入的 call_site 作为标签；写操作同时记入审计日志。
+    每个操作受当前请求截止时间约束 (见 deadlines)，超时抛出 DeadlineExceeded；
+    发送前经 scheduler 按通道领取执行名额。
+    """
+
+    def __init__(self, *args, call_site='unknown', **kwargs):
+        self.call_site = call_site  # 必须在父类构造之前设置，auto_bind 会在构造过程中调用 bind
+        kwargs.setdefault('collect_usage', True)
+        super().__init__(*args, **kwargs)
+
+    def _apply_deadline(self, operation, args, kwargs):
+        """操作前检查截止时间，设置套接字接收超时和搜索的服务端 time_limit；返回是否设置了 time_limit"""
+        if deadlines.expired():
+            LDAP_DEADLINE_EXCEEDED.inc(self.call_site)
+            raise deadlines.DeadlineExceeded()
+        if self.socket is not None:
+            self.socket.settimeout(deadlines.receive_timeout())
+        # search 的第 7 个位置参数是 time_limit；调用方显式指定时不覆盖
+        if operation == 'search' and len(args) < 7 and not kwargs.get('time_limit'):
+            limit = deadlines.time_limit()
+            if limit:
+                kwargs['time_limit'] = limit
+                return True
+        return False
+
+    def _instrumented(self, operation, func, *args, **kwargs):
+        if operation == 'unbind':
+            return self._execute(operation, func, False, *args, **kwargs)  # 没有响应，不占用名额
+        attempt = 0
+        while True:
+            value, outcome = self._scheduled(operation, func, args, dict(kwargs))
+            if operation not in IDEMPOTENT_OPERATIONS or outcome not in RETRYABLE_RESULTS \
+                    or attempt >= LDAP_RETRY_ATTEMPTS:
+                return value
+            # 指数退避 + 全抖动，避免所有 worker 同时重发；剩余时间不足时不再重试
+            delay = random.uniform(0, LDAP_RETRY_BASE_DELAY * 2 ** attempt)
+            left = deadlines.remaining()
+            if left is not None and left <= delay:
+                return value
+            LDAP_RETRIES.inc(operation, str(outcome))
+            time.sleep(delay)
+            attempt += 1
+
+    def _scheduled(self, operation, func, args, kwargs):
+        """领取调度名额后执行一次操作，返回 (返回值, 结果码或 'timeout')；结果同时反馈给该通道的并发控制器"""
+        lane = current_lane.get()
+        start = time.perf_counter()
+        ticket = SCHEDULER.acquire(lane, self.user, deadlines.remaining())
+        if ticket is None:
+            LDAP_DEADLINE_EXCEEDED.inc(self.call_site)
+            raise deadlines.DeadlineExceeded()
+        outcome, started = 'error', None
+        try:
+            LDAP_QUEUE_WAIT.observe(lane, value=time.perf_counter() - start)
+            LDAP_IN_FLIGHT.set(lane, value=SCHEDULER.in_flight(lane))
+            limited = self._apply_deadline(operation, args, kwargs)  # 排队之后再按剩余时间设置超时
+            started = time.perf_counter()
+            value = self._execute(operation, func, limited, *args, **kwargs)
+            outcome = self.result.get('result', 'error') if isinstance(self.result, dict) else 'error'
+            return value, outcome
+        except (deadlines.DeadlineExceeded, LDAPSocketReceiveError):
+            outcome = 'timeout'
+            raise
+        finally:
+            # 未发出的操作 (如排队后已超时) 不反馈给并发控制器
+            SCHEDULER.release(ticket, time.perf_counter() - started if started else None, outcome)
+            LDAP_IN_FLIGHT.set(lane, value=SCHEDULER.in_flight(lane))
+            LDAP_CONCURRENCY_LIMIT.set(lane, value=SCHEDULER.lane_limits.get(lane, SCHEDULER.max_in_flight))
+
+    def _execute(self, operation, func, limited, *args, **kwargs):
+        usage = self._usage
+        sent_before, received_before = (usage.bytes_transmitted, usage.bytes_received) if usage else (0, 0)
+        self.result = None
+        start = time.perf_counter()
+        result_code = 'error'
+        entries = 0
+        try:
+            try:
+                return_value = func(*args, **kwargs)
+            except LDAPSocketReceiveError as e:
+                # 接收超时后 ldap3 已关闭套接字，域控随之放弃该连接上未完成的操作
+                if deadlines.expired():
+                    LDAP_DEADLINE_EXCEEDED.inc(self.call_site)
+                    raise deadlines.DeadlineExceeded() from e
+                raise
+            if operation == 'unbind':
+                result_code = 'ok'
+            elif isinstance(self.result, dict):
+                result_code = self.result.get('result', 'error')
+            if operation == 'search' and self.response:
+                entries = sum(1 for item in self.response if item.get('type') == 'searchResEntry')
+            if limited and result_code == 3:
+                # timeLimitExceeded: 域控按 time_limit 中止了搜索，只返回了部分结果，不能当作完整列表使用
+                LDAP_DEADLINE_EXCEEDED.inc(self.call_site)
+                raise deadlines.DeadlineExceeded()
+            return return_value
+        finally:
+            duration = time.perf_counter() - start
+            sent = usage.bytes_transmitted - sent_before if usage else 0
+            received = usage.bytes_received - received_before if usage else 0
+            record_operation(operation, self.call_site, duration, result_code, entries, sent, received)
+            if operation in AUDITED_OPERATIONS:
+                dn, changes = audit.describe_changes(operation, args, kwargs)
+                description = self.result.get('description') if isinstance(self.result, dict) else None
+                audit.record(operation, dn, result_code, duration, operator=self.user,
+                             description=description, changes=changes)
+
+    def bind(self, *args, **kwargs):
+        return self._instrumented('bind', super().bind, *args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self._instrumented('search', super().search, *args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        return self._instrumented('add', super().add, *args, **kwargs)
+
+    def modify(self, *args, **kwargs):
+        return self._instrumented('modify', super().modify, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._instrumented('delete', super().delete, *args, **kwargs)
+
+    def modify_dn(self, *args, **kwargs):
+        return self._instrumented('modify_dn', super().modify_dn, *args, **kwargs)
+
+    def unbind(self, *args, **kwargs):
+        return self._instrumented('unbind', super().unbind, *args, **kwargs)
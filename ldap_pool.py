@@ -0,0 +1,98 @@
+# /ldap_pool.py
+"""
+已绑定 LDAP 连接的进程内连接池，用于 gthread 等多线程 worker。
+
+ldap3 的 SYNC 连接对象不能被多个线程同时使用，这里不共享连接，而是独占式借出：
+一个连接同一时刻只属于一个线程，用完归还后才能被其他请求复用。
+应用代码依赖 conn.result / conn.entries (SAFE_SYNC 策略不再维护这两个属性)，
+因此保留 SYNC 策略，由独占借出保证线程安全，同时省去每个请求重新建立 TLS 和绑定的往返。
+"""
+import os
+import time
+import threading
+from collections import defaultdict
+
+
+class ConnectionPool:
+    """
+    按 key (域控、绑定账号、密码摘要等) 分组保存空闲连接。
+    factory() 负责创建新的已绑定连接；空闲超过 idle_timeout 秒或已断开的连接在借出前丢弃。
+    """
+
+    def __init__(self, max_idle=4, idle_timeout=60):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)  # key -> [(归还时间, 连接), ...]，末尾为最近归还
+        self._pid = os.getpid()
+        self._last_sweep = time.monotonic()
+
+    def _check_fork(self):
+        # fork 之后子进程不能继续使用父进程的套接字，直接丢弃引用 (不发送 unbind，连接仍属于父进程)
+        if self._pid != os.getpid():
+            self._idle = defaultdict(list)
+            self._pid = os.getpid()
+
+    def checkout(self, key, factory):
+        """借出一个连接；没有可用的空闲连接时调用 factory() 新建"""
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            self._check_fork()
+            idle = self._idle.get(key)
+            while idle:
+                returned_at, candidate = idle.pop()
+                if now - returned_at < self.idle_timeout and not candidate.closed and candidate.bound:
+                    conn = candidate
+                    break
+                stale.append(candidate)
+            stale.extend(self._sweep(now))
+        _close_all(stale)
+        return conn if conn is not None else factory()
+
+    def checkin(self, key, conn):
+        """归还连接；池已满或连接已断开时直接关闭"""
+        if conn.closed or not conn.bound:
+            return
+        with self._lock:
+            self._check_fork()
+            idle = self._idle[key]
+            if len(idle) < self.max_idle:
+                idle.append((time.monotonic(), conn))
+                return
+        _close_all([conn])
+
+    def _sweep(self, now):
+        """每隔一段时间清理所有 key 下过期的空闲连接，调用方持有锁"""
+        if now - self._last_sweep < self.idle_timeout:
+            return []
+        self._last_sweep = now
+        expired = []
+        for key in list(self._idle):
+            keep = [(t, c) for t, c in self._idle[key] if now - t < self.idle_timeout]
+            expired.extend(c for t, c in self._idle[key] if now - t >= self.idle_timeout)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return expired
+
+    def close_all(self):
+        with self._lock:
+            self._check_fork()
+            conns = [c for idle in self._idle.values() for _, c in idle]
+            self._idle = defaultdict(list)
+        _close_all(conns)
+
+    def idle_count(self):
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+
+def _close_all(conns):
+    for conn in conns:
+        try:
+            conn.unbind()
+        except Exception:
+            pass
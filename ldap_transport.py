@@ -0,0 +1,116 @@
+# /ldap_transport.py
+"""
+域控连接的传输层：DNS 缓存和 TLS 会话复用。
+  - DNS: 域控主机名解析结果在进程内缓存 DNS_CACHE_TTL 秒；dc_health 的后台探测会定期刷新缓存，
+    建立连接时通常无需等待解析
+  - TLS: 所有连接共享同一个 SSLContext，并按 (域控, 端口) 保存最近的 TLS 会话，
+    重新连接时携带该会话，域控接受后只需简化握手
+解析、TCP 连接和 TLS 握手的耗时分别记录到 aduser_ldap_connect_phase_seconds 和当前请求的 Server-Timing。
+"""
+import ssl
+import time
+import socket
+import threading
+from ldap3 import Server, Tls, IP_V4_ONLY, IP_V6_ONLY
+from ldap_metrics import record_connect_phase, LDAP_TLS_HANDSHAKES
+from utils import CONFIG
+
+DNS_CACHE_TTL = CONFIG.get('DNS_CACHE_TTL', 300)
+
+_dns_lock = threading.Lock()
+_dns_cache = {}  # (主机, 地址族) -> (过期时间, getaddrinfo 结果)
+_sessions = {}   # (主机, 端口) -> ssl.SSLSession
+_phase = threading.local()  # 当前线程正在建立的连接的开始时间
+
+
+def _create_context():
+    # 与此前每个连接单独创建的上下文一致：TLS 客户端，不校验证书
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+_context = _create_context()
+
+
+def client_context():
+    """共享的客户端 SSLContext"""
+    return _context
+
+
+def resolve(host, port, family=socket.AF_UNSPEC):
+    """带缓存的 getaddrinfo；缓存不区分端口，返回的地址中端口替换为 port。解析失败时抛出 socket.gaierror"""
+    now = time.monotonic()
+    with _dns_lock:
+        cached = _dns_cache.get((host, family))
+    if cached is None or cached[0] <= now:
+        start = time.perf_counter()
+        addresses = socket.getaddrinfo(host, 0, family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        record_connect_phase('dns', time.perf_counter() - start)
+        cached = (now + DNS_CACHE_TTL, addresses)
+        with _dns_lock:
+            _dns_cache[(host, family)] = cached
+    return [(af, kind, proto, name, (sockaddr[0], port) + tuple(sockaddr[2:]))
+            for af, kind, proto, name, sockaddr in cached[1]]
+
+
+class CachedServer(Server):
+    """地址解析走进程内 DNS 缓存的 ldap3 Server，并记录连接开始时间用于区分 TCP 连接与 TLS 握手耗时"""
+
+    @property
+    def address_info(self):
+        if self.ipc:
+            return super().address_info
+        family = {IP_V4_ONLY: socket.AF_INET, IP_V6_ONLY: socket.AF_INET6}.get(self.mode, socket.AF_UNSPEC)
+        try:
+            addresses = resolve(self.host, self.port, family)
+        except socket.gaierror:
+            addresses = []
+        # 保留 ldap3 记录在地址项末尾的可用性状态
+        known = {tuple(item[:5]): item for item in self._address_info}
+        self._address_info = [known.get(tuple(address)) or list(address) + [None, None] for address in addresses]
+        return self._address_info
+
+    def candidate_addresses(self):
+        _phase.connect_started = time.perf_counter()
+        return super().candidate_addresses()
+
+
+class SessionTls(Tls):
+    """使用共享 SSLContext 并复用 TLS 会话的 ldap3 Tls 配置"""
+
+    def __init__(self):
+        super().__init__(validate=ssl.CERT_NONE, version=ssl.PROTOCOL_TLS_CLIENT)
+
+    def wrap_socket(self, connection, do_handshake=False):
+        started = time.perf_counter()
+        connect_started = getattr(_phase, 'connect_started', None)
+        if connect_started is not None:
+            record_connect_phase('connect', started - connect_started)
+            _phase.connect_started = None
+        # 简化握手时客户端的 Finished 与紧随其后的绑定请求是两次小写入，
+        # 开启 Nagle 算法时后者要等待服务端的延迟确认 (数十到数百毫秒)
+        connection.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        key = (connection.server.host, connection.server.port)
+        wrapped = _context.wrap_socket(connection.socket, server_side=False, do_handshake_on_connect=do_handshake,
+                                       session=_sessions.get(key))
+        if do_handshake:
+            record_connect_phase('tls', time.perf_counter() - started)
+            LDAP_TLS_HANDSHAKES.inc('resumed' if wrapped.session_reused else 'full')
+        connection.socket = wrapped
+        remember_session(connection)
+
+
+def remember_session(connection):
+    """
+    保存连接的 TLS 会话供下次连接复用。
+    TLS 1.2 握手完成即可取得会话；TLS 1.3 的会话票据在握手之后才到达，需要在收到第一个响应 (如绑定) 后再调用一次。
+    """
+    sock = connection.socket
+    session = getattr(sock, 'session', None) if isinstance(sock, ssl.SSLSocket) else None
+    if session is not None and (session.has_ticket or session.id):
+        _sessions[(connection.server.host, connection.server.port)] = session
+
+
+SESSION_TLS = SessionTls()
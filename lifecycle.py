@@ -0,0 +1,228 @@
+# /lifecycle.py
+"""
+批量账号生命周期操作 (离职、调岗)：禁用、移动、删除、移出安全组、重置密码。
+与批量创建共用 batch 的工作线程、连接池和 batch 通道的并发控制，结果逐行写入报告。
+
+    cd /opt/aduser && python -m lifecycle ops.csv --credentials /etc/aduser/bind.json
+    python -m lifecycle ops.csv --credentials bind.json --dry-run     # 只检查并列出将执行的操作
+
+CSV 第一行为表头，列为 操作,登录名,参数：
+    disable,zhangsan                      禁用账号 (userAccountControl 置 ACCOUNTDISABLE 位)
+    move,zhangsan,"OU=离职,DC=corp,DC=com" 移动到目标 OU
+    delete,zhangsan                       删除账号
+    remove_groups,zhangsan,"CN=G1,...|CN=G2,..." 从安全组中移出，多个组用 | 分隔；参数为 * 时移出所有组
+    reset_password,zhangsan[,新密码]       重置密码 (默认 DEFAULT_USER_PASSWORD)，用户下次登录时必须修改
+disable、move、delete、remove_groups 先读取账号当前状态，已处于目标状态时不写入
+(如已禁用、已在目标 OU、不在指定组中)，重复执行这些操作是安全的。
+reset_password 无法判断是否已执行过：重复运行同一 CSV 会再次重置密码，包括已经改过密码的用户。
+同一登录名的多行由同一个工作线程按 CSV 顺序依次执行 (如先移出安全组、再移动、最后删除)，不同账号之间并发。
+中断或部分失败后重新运行时应加 --resume，跳过报告中已成功的行 (按 行号+操作+登录名 匹配，
+同一账号参数不同的多行分别记录；修改 CSV 导致行号变化的行会重新执行)：
+    python -m lifecycle ops.csv --credentials bind.json --resume
+"""
+import os
+import sys
+import csv
+import argparse
+from ldap3 import SUBTREE, MODIFY_REPLACE
+from ldap3.utils.conv import escape_filter_chars
+from utils import CONFIG
+from dn_utils import same_dn, parent_dn, parse_dn
+from ad_utils import get_base_dn
+
+ACCOUNTDISABLE = 0x2
+
+REPORT_FIELDS = ['行号', '操作', '登录名', '结果', '说明']
+
+OPERATIONS = {
+    'disable': '禁用',
+    'move': '移动',
+    'delete': '删除',
+    'remove_groups': '移出安全组',
+    'reset_password': '重置密码',
+}
+
+
+def _find_user(conn, username):
+    """按登录名查找用户，返回条目；不存在时返回 None"""
+    conn.search(search_base=get_base_dn(CONFIG['DOMAIN_NAME']),
+                search_filter=f'(&(objectClass=user)(!(objectClass=computer))'
+                              f'(sAMAccountName={escape_filter_chars(username)}))',
+                search_scope=SUBTREE, attributes=['distinguishedName', 'userAccountControl', 'memberOf'])
+    return conn.entries[0] if conn.entries else None
+
+
+def _disable(conn, dn, entry, argument, dry_run):
+    uac = int(entry.userAccountControl.value or 0)
+    if uac & ACCOUNTDISABLE:
+        return True, "账号已是禁用状态，无需修改。"
+    if dry_run:
+        return True, f"[试运行] 将禁用账号 {dn}。"
+    conn.modify(dn, {'userAccountControl': [(MODIFY_REPLACE, [str(uac | ACCOUNTDISABLE)])]})
+    if conn.result['result'] != 0:
+        return False, f"禁用失败: {conn.result['description']}"
+    return True, "账号已禁用。"
+
+
+def _move(conn, dn, entry, target_ou, dry_run):
+    if not target_ou:
+        return None, "缺少目标 OU。"
+    if same_dn(parent_dn(dn), target_ou):
+        return True, f"账号已位于 '{target_ou}'，无需移动。"
+    if dry_run:
+        return True, f"[试运行] 将把 {dn} 移动到 '{target_ou}'。"
+    rdn = parse_dn(dn)[0]
+    conn.modify_dn(dn, rdn, new_superior=target_ou)
+    if conn.result['result'] != 0:
+        return False, f"移动失败: {conn.result['description']}"
+    return True, f"已移动到 '{target_ou}'。"
+
+
+def _delete(conn, dn, entry, argument, dry_run):
+    if dry_run:
+        return True, f"[试运行] 将删除账号 {dn}。"
+    conn.delete(dn)
+    if conn.result['result'] != 0:
+        return False, f"删除失败: {conn.result['description']}"
+    return True, f"账号 {dn} 已删除。"
+
+
+def _remove_groups(conn, dn, entry, argument, dry_run):
+    if not argument:
+        return None, "缺少要移出的安全组。"
+    member_of = list(entry.memberOf.values) if 'memberOf' in entry else []
+    if argument.strip() == '*':
+        groups = member_of
+    else:
+        requested = [group.strip() for group in argument.split('|') if group.strip()]
+        groups = [group for group in member_of if any(same_dn(group, wanted) for wanted in requested)]
+    if not groups:
+        return True, "账号不在指定的安全组中，无需修改。"
+    if dry_run:
+        return True, f"[试运行] 将从以下组中移出: {', '.join(groups)}。"
+    # 成员关系已按 memberOf 核对过，不再让 ldap3 逐组检查 (fix=False)
+    if not conn.extend.microsoft.remove_members_from_groups([dn], groups, fix=False):
+        return False, f"移出安全组失败: {conn.result['description']}"
+    return True, f"已从 {len(groups)} 个组中移出: {', '.join(groups)}。"
+
+
+def _reset_password(conn, dn, entry, new_password, dry_run):
+    if dry_run:
+        return True, f"[试运行] 将重置 {dn} 的密码，并要求下次登录时修改。"
+    if not conn.extend.microsoft.modify_password(dn, new_password or CONFIG['DEFAULT_USER_PASSWORD']):
+        return False, f"重置密码失败: {conn.result['description']}"
+    conn.modify(dn, {'pwdLastSet': [(MODIFY_REPLACE, ['0'])]})  # 下次登录时必须修改密码
+    if conn.result['result'] != 0:
+        return True, f"密码已重置，但设置“下次登录时须更改密码”失败: {conn.result['description']}"
+    return True, "密码已重置，用户下次登录时必须修改密码。"
+
+
+_HANDLERS = {
+    'disable': _disable,
+    'move': _move,
+    'delete': _delete,
+    'remove_groups': _remove_groups,
+    'reset_password': _reset_password,
+}
+
+
+def process_operation(conn, bind_username, bind_password, line_no, row, dry_run=False):
+    """batch.run_batch 的处理函数：执行一行操作，返回 (结果说明, 结果分类)"""
+    if len(row) < 2:
+        return f"第 {line_no} 行: 格式错误，至少需要 操作,登录名 两列。", 'skipped'
+    operation, username = row[0].strip().lower(), row[1].strip()
+    argument = row[2].strip() if len(row) > 2 else ''
+    handler = _HANDLERS.get(operation)
+    if handler is None:
+        return f"第 {line_no} 行: 未知操作 '{row[0]}'，可用操作: {', '.join(OPERATIONS)}。", 'skipped'
+    if not username:
+        return f"第 {line_no} 行: 跳过，登录名为空。", 'skipped'
+
+    label = f"第 {line_no} 行 [{OPERATIONS[operation]} {username}]"
+    entry = _find_user(conn, username)
+    if entry is None:
+        if operation == 'delete':
+            return f"{label}: 跳过，账号不存在 (可能已删除)。", 'skipped'
+        return f"{label}: ❌ 失败 - 账号不存在。", 'failure'
+
+    success, message = handler(conn, entry.entry_dn, entry, argument, dry_run)
+    if success is None:
+        return f"{label}: 跳过，{message}", 'skipped'
+    result_prefix = "✅ 成功" if success else "❌ 失败"
+    return f"{label}: {result_prefix} - {message}", 'success' if success else 'failure'
+
+
+def _operation_key(line_no, row):
+    return str(line_no), row[0].strip().lower(), row[1].strip().lower()
+
+
+def _login_key(row):
+    """同一登录名的行归为一组，由同一个工作线程按顺序执行"""
+    return (row[1].strip().lower() or None) if len(row) > 1 else None
+
+
+def completed_operations(report_path):
+    """读取已有报告，返回最近一次结果为成功的 (行号, 操作, 小写登录名) 集合"""
+    last = {}
+    if not os.path.exists(report_path):
+        return set()
+    with open(report_path, 'r', encoding='utf-8-sig', newline='') as f:
+        for record in csv.DictReader(f):
+            key = (record.get('行号', '').strip(), record.get('操作', '').strip().lower(),
+                   record.get('登录名', '').strip().lower())
+            last[key] = record.get('结果')
+    return {key for key, outcome in last.items() if all(key) and outcome == 'success'}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='从 CSV 批量执行账号生命周期操作 (列: 操作,登录名[,参数])。')
+    parser.add_argument('csv_path', help='CSV 文件 (UTF-8，第一行为表头)')
+    parser.add_argument('--bind-user', help='绑定账号')
+    parser.add_argument('--credentials', help='包含 bind_username / bind_password 的 JSON 凭据文件')
+    parser.add_argument('--workers', type=int, default=None, help='工作线程数上限 (默认 BATCH_WORKERS)')
+    parser.add_argument('--dry-run', action='store_true', help='只检查账号状态并列出将执行的操作，不写入 AD')
+    parser.add_argument('--resume', action='store_true', help='跳过报告中已成功的行 (按 行号+操作+登录名 匹配)')
+    parser.add_argument('--report', help='结果报告路径 (默认 <csv>.report.csv，试运行为 <csv>.dry-run.csv)')
+    args = parser.parse_args(argv)
+
+    from batch import parse_csv
+    from bulk_import import load_credentials, check_bind, import_rows
+
+    report_path = args.report or (os.path.splitext(args.csv_path)[0] +
+                                  ('.dry-run.csv' if args.dry_run else '.report.csv'))
+    try:
+        bind_username, bind_password = load_credentials(args.bind_user, args.credentials)
+        with open(args.csv_path, 'rb') as f:
+            rows = parse_csv(f.read())
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    if args.resume:
+        done = completed_operations(report_path)
+        rows = [(line_no, row) for line_no, row in rows
+                if len(row) < 2 or _operation_key(line_no, row) not in done]
+        print(f"继续上次执行：跳过 {len(done)} 个已成功的操作，剩余 {len(rows)} 行。")
+    elif not args.dry_run and any(row and row[0].strip().lower() == 'reset_password' for _, row in rows) \
+            and os.path.exists(report_path):
+        print(f"WARNING: '{report_path}' 已存在，重复运行会再次重置其中已成功的密码；继续上次执行请加 --resume。",
+              file=sys.stderr)
+    if not rows:
+        print("没有需要处理的行。")
+        return 0
+
+    success, message = check_bind(bind_username, bind_password)
+    if not success:
+        print(f"ERROR: {message}", file=sys.stderr)
+        return 2
+
+    print(f"{'试运行' if args.dry_run else '开始执行'}: {len(rows)} 行，结果报告: {report_path}")
+    counts, elapsed = import_rows(rows, bind_username, bind_password, report_path, workers=args.workers,
+                                  dry_run=args.dry_run, append=args.resume, process=process_operation,
+                                  fields=REPORT_FIELDS, key=_login_key)
+    print(f"完成: {sum(counts.values())} 行，用时 {elapsed:.1f} 秒 — 成功 {counts['success']}，"
+          f"失败 {counts['failure']}，跳过 {counts['skipped']}，错误 {counts['error']}。")
+    return 1 if counts['failure'] or counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# /profiler.py
+"""
+按需开启的请求级 cProfile 采样：按比例随机采样，或对匹配路径前缀的请求全部采样。
+每个被采样的请求在 PROFILE_DIR 下生成一个 .prof 文件和一个按累计耗时排序的前 N 行摘要 (.txt)，
+目录中只保留最近 PROFILE_KEEP 份，旧文件自动删除。
+
+开关来源 (取两者的并集)：
+  - 设置页面 (需登录) / config.json: PROFILE_SAMPLE_RATE (0~1)、PROFILE_PATHS (路径前缀列表)，保存后所有 worker 立即生效
+  - 环境变量: ADUSER_PROFILE_RATE、ADUSER_PROFILE_PATHS (逗号分隔)
+关闭时每个请求只多一次 stat 调用 (检查配置代际是否变化)。
+"""
+import io
+import os
+import time
+import random
+import pstats
+import cProfile
+import threading
+from flask import request, g
+from utils import load_config, CONFIG
+from dir_cache import cache_key, get_local
+
+PROFILE_DIR = CONFIG.get('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = CONFIG.get('PROFILE_KEEP', 50)
+PROFILE_TOP_N = CONFIG.get('PROFILE_TOP_N', 40)
+
+# Python 3.12 起 cProfile 基于进程级的 sys.monitoring，同一时刻只能有一个分析器处于活动状态；
+# 旧版本中各线程互不影响，但为保持行为一致，同样只允许一个请求被分析，其余请求直接跳过
+_active = threading.Lock()
+
+
+def parse_paths(text):
+    """'/rules, /dashboard' -> ['/rules', '/dashboard']"""
+    return [p.strip() for p in (text or '').split(',') if p.strip()]
+
+
+def _env_settings():
+    try:
+        rate = float(os.environ.get('ADUSER_PROFILE_RATE') or 0)
+    except ValueError:
+        rate = 0.0
+    return rate, parse_paths(os.environ.get('ADUSER_PROFILE_PATHS'))
+
+
+def _load_settings():
+    # 从文件读取而不是使用本进程的 CONFIG：设置页面只更新了处理该请求的 worker 的 CONFIG
+    config, _ = load_config()
+    env_rate, env_paths = _env_settings()
+    try:
+        rate = float(config.get('PROFILE_SAMPLE_RATE') or 0)
+    except (TypeError, ValueError):
+        rate = 0.0
+    paths = tuple(config.get('PROFILE_PATHS') or []) + tuple(env_paths)
+    return max(rate, env_rate), paths
+
+
+def current_settings():
+    """(采样率, 路径前缀元组)；设置页面保存后调用 invalidate('profiler') 使其重新加载"""
+    return get_local(cache_key('profiler'), _load_settings)
+
+
+def _should_profile(rate, paths):
+    if paths and request.path.startswith(paths):
+        return True
+    return rate > 0 and random.random() < rate
+
+
+def _before_request():
+    rate, paths = current_settings()
+    if rate <= 0 and not paths:
+        return
+    if not _should_profile(rate, paths) or not _active.acquire(blocking=False):
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # 其他分析工具 (调试器、覆盖率) 正在运行
+        _active.release()
+        return
+    g.profile = profile
+    g.profile_started = time.perf_counter()
+
+
+def _teardown_request(exc):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    profile.disable()
+    _active.release()
+    elapsed_ms = (time.perf_counter() - g.pop('profile_started')) * 1000
+    try:
+        write_profile(profile, request.method, request.path, request.endpoint, elapsed_ms)
+    except OSError as e:
+        print(f"WARNING: Failed to write request profile: {e}")
+
+
+def write_profile(profile, method, path, endpoint, elapsed_ms):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    name = f"{stamp}-{os.getpid()}-{(endpoint or 'none').replace('.', '_')}-{elapsed_ms:.0f}ms"
+    prof_path = os.path.join(PROFILE_DIR, name + '.prof')
+    profile.dump_stats(prof_path)
+
+    summary = io.StringIO()
+    summary.write(f"{method} {path} endpoint={endpoint} total_ms={elapsed_ms:.1f}\n\n")
+    stats = pstats.Stats(profile, stream=summary)
+    stats.sort_stats('cumulative').print_stats(PROFILE_TOP_N)
+    with open(os.path.join(PROFILE_DIR, name + '.txt'), 'w', encoding='utf-8') as f:
+        f.write(summary.getvalue())
+    _rotate()
+    print(f"INFO: Request profile written to {prof_path}")
+
+
+def _rotate():
+    """只保留最近 PROFILE_KEEP 份分析结果 (每份包含 .prof 和 .txt)；文件名以时间戳开头，按名称排序即按时间排序"""
+    try:
+        names = sorted({os.path.splitext(n)[0] for n in os.listdir(PROFILE_DIR) if n.endswith(('.prof', '.txt'))})
+    except OSError:
+        return
+    for name in names[:max(len(names) - PROFILE_KEEP, 0)]:
+        for suffix in ('.prof', '.txt'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,397 @@
+# /reconcile.py
+"""
+按 HR 全量花名册对账 AD：计算 AD 与期望状态的差异，生成可审阅的计划，确认后只写入有变化的属性。
+
+    cd /opt/aduser && python -m reconcile plan roster.csv --credentials /etc/aduser/bind.json
+    python -m reconcile apply roster.plan.json --credentials bind.json --dry-run    # 逐项检查，不写入 AD
+    python -m reconcile apply roster.plan.json --credentials bind.json
+
+花名册与批量创建的 CSV 格式相同 (列: 姓名,登录名,OU路径[,职位])。
+plan 只用少量分页搜索读取当前状态 (全部用户一次，受管安全组的成员按每 RECONCILE_GROUP_CHUNK 个组一次)，
+在内存中按登录名和 DN 做哈希连接，得出：
+  - create   花名册中有、AD 中没有的用户，按批量创建的流程创建
+  - update   已有用户的最小修改：移动到花名册中的 OU、按 description_rules.json 更新描述、
+             按 positions.json 和自动加组规则加入/移出受管安全组
+  - orphans  位于花名册涉及的 OU 中、但不在花名册里的用户，只列出不处理
+             (可用 --orphans-csv 导出为 lifecycle 的禁用清单，审阅后再执行)
+受管安全组是 positions.json 和自动加组规则中出现过的组，其他组的成员关系不会被修改；
+描述规则没有匹配的用户不修改现有描述。
+
+计划保存为 JSON (默认 <csv>.plan.json)。apply 经 batch 通道并发执行，每个用户一行写入结果报告；
+计划生成后账号又被改动 (如已被移走) 时该用户报告失败，重新生成计划即可。
+超过 RECONCILE_PLAN_MAX_AGE 秒的计划需要加 --force 才会执行。
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import datetime
+from ldap3 import SUBTREE, MODIFY_ADD, MODIFY_DELETE, MODIFY_REPLACE
+from ldap3.utils.conv import escape_filter_chars
+from utils import CONFIG
+from dn_utils import normalize_dn, parent_dn, parse_dn
+from ad_utils import (get_base_dn, get_cached_positions, get_compiled_rules, compute_description, ou_rule_groups,
+                      create_ad_user, acquire_connection, release_connection)
+
+RECONCILE_PAGE_SIZE = CONFIG.get('RECONCILE_PAGE_SIZE', 1000)
+RECONCILE_GROUP_CHUNK = CONFIG.get('RECONCILE_GROUP_CHUNK', 100)
+RECONCILE_PLAN_MAX_AGE = CONFIG.get('RECONCILE_PLAN_MAX_AGE', 24 * 3600)
+
+REPORT_FIELDS = ['序号', '操作', '登录名', '结果', '说明']
+
+ACTIONS = {'create': '创建', 'update': '更新'}
+
+
+def _first(value):
+    """分页搜索返回的属性值可能是列表 (如多值属性 description)，取第一个值"""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _paged_search(conn, search_filter, attributes):
+    """在整个域内分页搜索，逐条产出 (DN, 属性字典)"""
+    for entry in conn.extend.standard.paged_search(get_base_dn(CONFIG['DOMAIN_NAME']), search_filter, SUBTREE,
+                                                   attributes=attributes, paged_size=RECONCILE_PAGE_SIZE,
+                                                   generator=True):
+        if entry.get('type') == 'searchResEntry':
+            yield entry['dn'], entry['attributes']
+
+
+def managed_groups():
+    """受管安全组：positions.json 和自动加组规则中出现过的组，返回 {规范 DN: DN}"""
+    groups = {}
+    for position_groups in get_cached_positions().values():
+        for group_dn in position_groups:
+            groups.setdefault(normalize_dn(group_dn), group_dn)
+    for _, _, group_dn in get_compiled_rules()['ou_group_rules']:
+        groups.setdefault(normalize_dn(group_dn), group_dn)
+    return groups
+
+
+def load_directory_state(conn, groups):
+    """
+    读取当前状态，返回 (用户, 成员关系, 存在的受管组)：
+      用户      {小写登录名: {'login', 'dn', 'description'}}
+      成员关系  {用户规范 DN: {受管组规范 DN, ...}}
+    """
+    users = {}
+    for dn, attributes in _paged_search(conn, '(&(objectClass=user)(!(objectClass=computer)))',
+                                        ['sAMAccountName', 'description']):
+        login = _first(attributes.get('sAMAccountName'))
+        if login:
+            users[login.lower()] = {'login': login, 'dn': dn, 'description': _first(attributes.get('description'))}
+
+    memberships, found = {}, set()
+    group_keys = list(groups)
+    for i in range(0, len(group_keys), RECONCILE_GROUP_CHUNK):
+        chunk = group_keys[i:i + RECONCILE_GROUP_CHUNK]
+        terms = ''.join(f"(distinguishedName={escape_filter_chars(groups[key])})" for key in chunk)
+        for dn, attributes in _paged_search(conn, f"(&(objectClass=group)(|{terms}))", ['member']):
+            group_key = normalize_dn(dn)
+            found.add(group_key)
+            for member in attributes.get('member') or []:
+                memberships.setdefault(normalize_dn(member), set()).add(group_key)
+    return users, memberships, found
+
+
+def parse_roster(rows):
+    """花名册行 -> ({小写登录名: 记录}, 错误列表)；同一登录名出现多次时以第一次为准"""
+    roster, errors = {}, []
+    for line_no, row in rows:
+        if len(row) < 3 or not all(value.strip() for value in row[:3]):
+            errors.append(f"第 {line_no} 行: 跳过，姓名、登录名或 OU 路径为空。")
+            continue
+        record = {'line': line_no, 'display_name': row[0].strip(), 'login': row[1].strip(),
+                  'ou_path': row[2].strip(), 'position': row[3].strip() if len(row) > 3 and row[3] else None}
+        key = record['login'].lower()
+        if key in roster:
+            errors.append(f"第 {line_no} 行: 跳过，登录名 '{record['login']}' 与第 {roster[key]['line']} 行重复。")
+            continue
+        roster[key] = record
+    return roster, errors
+
+
+def compute_plan(roster, users, memberships, groups, found_groups):
+    """按花名册和当前状态计算计划，只包含需要修改的用户和属性"""
+    positions = get_cached_positions()
+    actions, warnings = [], []
+    missing_groups = set()
+
+    for key, record in roster.items():
+        expected = {}
+        for group_dn in list(positions.get(record['position'], [])) + ou_rule_groups(record['ou_path']):
+            group_key = normalize_dn(group_dn)
+            if group_key not in found_groups:
+                missing_groups.add(group_dn)
+                continue
+            expected.setdefault(group_key, group_dn)
+
+        current = users.get(key)
+        if current is None:
+            actions.append({'action': 'create', 'login': record['login'], 'display_name': record['display_name'],
+                            'ou_path': record['ou_path'], 'position': record['position']})
+            continue
+
+        dn = current['dn']
+        change = {'action': 'update', 'login': current['login'], 'dn': dn}
+        if normalize_dn(parent_dn(dn)) != normalize_dn(record['ou_path']):
+            change['move_to'] = record['ou_path']
+        description = compute_description(record['display_name'], record['ou_path'], record['position'])
+        if description and description != current['description']:
+            change['description'] = [current['description'], description]
+        member_of = memberships.get(normalize_dn(dn), set())
+        add_groups = sorted(group_dn for group_key, group_dn in expected.items() if group_key not in member_of)
+        remove_groups = sorted(groups[group_key] for group_key in member_of if group_key not in expected)
+        if add_groups:
+            change['add_groups'] = add_groups
+        if remove_groups:
+            change['remove_groups'] = remove_groups
+        if len(change) > 3:
+            actions.append(change)
+
+    for group_dn in sorted(missing_groups):
+        warnings.append(f"安全组 '{group_dn}' 在 AD 中不存在，相关用户不会加入该组。")
+
+    roster_ous = {normalize_dn(record['ou_path']) for record in roster.values()}
+    orphans = sorted(({'login': user['login'], 'dn': user['dn']} for key, user in users.items()
+                      if key not in roster and normalize_dn(parent_dn(user['dn'])) in roster_ous),
+                     key=lambda orphan: orphan['login'].lower())
+    return actions, orphans, warnings
+
+
+def summarize(actions, orphans):
+    summary = {'create': 0, 'move': 0, 'description': 0, 'add_groups': 0, 'remove_groups': 0,
+               'orphans': len(orphans)}
+    for action in actions:
+        if action['action'] == 'create':
+            summary['create'] += 1
+            continue
+        for field in ('move_to', 'description', 'add_groups', 'remove_groups'):
+            if field in action:
+                summary['move' if field == 'move_to' else field] += 1
+    return summary
+
+
+def describe(action):
+    """计划中一项的可读说明"""
+    if action['action'] == 'create':
+        text = f"创建 '{action['display_name']}' 于 '{action['ou_path']}'"
+        return text + (f"，职位 {action['position']}" if action.get('position') else '')
+    parts = []
+    if 'move_to' in action:
+        parts.append(f"移动到 '{action['move_to']}'")
+    if 'description' in action:
+        old, new = action['description']
+        parts.append(f"描述 '{old or ''}' -> '{new}'")
+    if action.get('add_groups'):
+        parts.append(f"加入 {', '.join(action['add_groups'])}")
+    if action.get('remove_groups'):
+        parts.append(f"移出 {', '.join(action['remove_groups'])}")
+    return '；'.join(parts)
+
+
+def build_plan(roster_rows, bind_username, bind_password, roster_path=None):
+    """读取当前状态并计算计划 (dict，可直接保存为 JSON)"""
+    from scheduler import lane
+
+    roster, errors = parse_roster(roster_rows)
+    groups = managed_groups()
+    conn = None
+    failed = True
+    try:
+        with lane('batch'):
+            conn = acquire_connection(bind_username, bind_password, 'reconcile_plan', role='read')
+            if not conn.bound:
+                raise ConnectionError(f"LDAP 认证失败: {conn.result}")
+            started = time.perf_counter()
+            users, memberships, found_groups = load_directory_state(conn, groups)
+            print(f"INFO: 读取 {len(users)} 个用户、{len(found_groups)} 个受管安全组，"
+                  f"用时 {time.perf_counter() - started:.1f} 秒。")
+        failed = False
+    finally:
+        if conn:
+            release_connection(conn, discard=failed)
+
+    actions, orphans, warnings = compute_plan(roster, users, memberships, groups, found_groups)
+    return {'generated_at': time.time(), 'roster': roster_path, 'summary': summarize(actions, orphans),
+            'actions': actions, 'orphans': orphans, 'errors': errors, 'warnings': warnings}
+
+
+def _apply_update(conn, action, dry_run):
+    if dry_run:
+        return True, f"[试运行] 将{describe(action)}。"
+    dn, done = action['dn'], []
+    if 'move_to' in action:
+        rdn = parse_dn(dn)[0]
+        conn.modify_dn(dn, rdn, new_superior=action['move_to'])
+        if conn.result['result'] != 0:
+            return False, f"移动失败: {conn.result['description']} (账号可能已被改动，请重新生成计划)"
+        dn = f"{rdn},{action['move_to']}"
+        done.append(f"已移动到 '{action['move_to']}'")
+    if 'description' in action:
+        conn.modify(dn, {'description': [(MODIFY_REPLACE, [action['description'][1]])]})
+        if conn.result['result'] != 0:
+            return False, '；'.join(done + [f"更新描述失败: {conn.result['description']}"])
+        done.append(f"描述已设为 '{action['description'][1]}'")
+    for group_dn in action.get('add_groups', []):
+        conn.modify(group_dn, {'member': [(MODIFY_ADD, [dn])]})
+        if conn.result['result'] not in (0, 68):  # 68: 已是组成员
+            return False, '；'.join(done + [f"加入组 '{group_dn}' 失败: {conn.result['description']}"])
+    if action.get('add_groups'):
+        done.append(f"已加入 {len(action['add_groups'])} 个组")
+    for group_dn in action.get('remove_groups', []):
+        conn.modify(group_dn, {'member': [(MODIFY_DELETE, [dn])]})
+        if conn.result['result'] not in (0, 16):  # 16: 已不是组成员
+            return False, '；'.join(done + [f"移出组 '{group_dn}' 失败: {conn.result['description']}"])
+    if action.get('remove_groups'):
+        done.append(f"已移出 {len(action['remove_groups'])} 个组")
+    return True, '；'.join(done) + '。'
+
+
+def _apply_create(conn, bind_username, bind_password, action, dry_run):
+    groups_to_add = list(get_cached_positions().get(action.get('position'), []))  # 复制一份，避免修改缓存
+    return create_ad_user(
+        domain_controller_ip=CONFIG['DOMAIN_CONTROLLER_IP'],
+        bind_username=bind_username, bind_password=bind_password,
+        username=action['login'], display_name=action['display_name'],
+        password=CONFIG['DEFAULT_USER_PASSWORD'], ou_path=action['ou_path'], domain_name=CONFIG['DOMAIN_NAME'],
+        position_name=action.get('position'), groups_to_add=groups_to_add,
+        conn_external=conn, dry_run=dry_run
+    )
+
+
+def process_action(conn, bind_username, bind_password, line_no, row, dry_run=False):
+    """batch.run_batch 的处理函数：row 为 [操作, 登录名, 计划项 JSON]，返回 (结果说明, 结果分类)"""
+    action = json.loads(row[2])
+    label = f"第 {line_no} 项 [{ACTIONS[action['action']]} {action['login']}]"
+    if action['action'] == 'create':
+        success, message = _apply_create(conn, bind_username, bind_password, action, dry_run)
+    else:
+        success, message = _apply_update(conn, action, dry_run)
+    result_prefix = "✅ 成功" if success else "❌ 失败"
+    return f"{label}: {result_prefix} - {message}", 'success' if success else 'failure'
+
+
+def write_orphans_csv(path, orphans):
+    """不在花名册中的用户导出为 lifecycle 的操作清单 (disable)，审阅后可直接执行"""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['操作', '登录名', '参数'])
+        for orphan in orphans:
+            writer.writerow(['disable', orphan['login'], ''])
+
+
+def print_plan(plan, limit):
+    summary = plan['summary']
+    print(f"计划: 创建 {summary['create']}，移动 {summary['move']}，更新描述 {summary['description']}，"
+          f"加入组 {summary['add_groups']}，移出组 {summary['remove_groups']}；"
+          f"不在花名册中的用户 {summary['orphans']} (不处理)。")
+    for action in plan['actions'][:limit]:
+        print(f"  {action['login']}: {describe(action)}")
+    if len(plan['actions']) > limit:
+        print(f"  ... 其余 {len(plan['actions']) - limit} 项见计划文件。")
+    for orphan in plan['orphans'][:limit]:
+        print(f"  不在花名册中: {orphan['login']} ({orphan['dn']})")
+    for message in plan['errors'] + plan['warnings']:
+        print(f"WARNING: {message}", file=sys.stderr)
+
+
+def _plan_command(args, bind_username, bind_password):
+    from batch import parse_csv
+    from bulk_import import check_bind
+
+    try:
+        with open(args.roster, 'rb') as f:
+            rows = parse_csv(f.read())
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    success, message = check_bind(bind_username, bind_password)
+    if not success:
+        print(f"ERROR: {message}", file=sys.stderr)
+        return 2
+
+    plan = build_plan(rows, bind_username, bind_password, os.path.abspath(args.roster))
+    plan_path = args.out or os.path.splitext(args.roster)[0] + '.plan.json'
+    with open(plan_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=2, ensure_ascii=False)
+    print_plan(plan, args.show)
+    if args.orphans_csv:
+        write_orphans_csv(args.orphans_csv, plan['orphans'])
+        print(f"不在花名册中的用户已导出为禁用清单: {args.orphans_csv}")
+    print(f"计划已保存: {plan_path}，审阅后执行: python -m reconcile apply {plan_path}")
+    return 0
+
+
+def _apply_command(args, bind_username, bind_password):
+    from bulk_import import check_bind, import_rows
+
+    try:
+        with open(args.plan, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    age = time.time() - plan['generated_at']
+    if age > RECONCILE_PLAN_MAX_AGE and not args.force:
+        print(f"ERROR: 计划生成于 {datetime.fromtimestamp(plan['generated_at']):%Y-%m-%d %H:%M}，已过期，"
+              f"请重新生成或加 --force。", file=sys.stderr)
+        return 2
+    rows = [(index, [action['action'], action['login'], json.dumps(action, ensure_ascii=False)])
+            for index, action in enumerate(plan['actions'], 1)]
+    if not rows:
+        print("计划中没有需要执行的修改。")
+        return 0
+
+    success, message = check_bind(bind_username, bind_password)
+    if not success:
+        print(f"ERROR: {message}", file=sys.stderr)
+        return 2
+
+    report_path = args.report or (os.path.splitext(args.plan)[0] +
+                                  ('.dry-run.csv' if args.dry_run else '.report.csv'))
+    print(f"{'试运行' if args.dry_run else '开始执行'}: {len(rows)} 项，结果报告: {report_path}")
+    counts, elapsed = import_rows(rows, bind_username, bind_password, report_path, workers=args.workers,
+                                  dry_run=args.dry_run, process=process_action, fields=REPORT_FIELDS)
+    print(f"完成: {sum(counts.values())} 项，用时 {elapsed:.1f} 秒 — 成功 {counts['success']}，"
+          f"失败 {counts['failure']}，跳过 {counts['skipped']}，错误 {counts['error']}。")
+    return 1 if counts['failure'] or counts['error'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按 HR 全量花名册对账 AD：生成差异计划，审阅后执行。')
+    parser.add_argument('--bind-user', help='绑定账号')
+    parser.add_argument('--credentials', help='包含 bind_username / bind_password 的 JSON 凭据文件')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = commands.add_parser('plan', help='读取 AD 当前状态，生成计划 (不写入 AD)')
+    plan_parser.add_argument('roster', help='花名册 CSV (UTF-8，列: 姓名,登录名,OU路径[,职位])')
+    plan_parser.add_argument('--out', help='计划文件路径 (默认 <csv>.plan.json)')
+    plan_parser.add_argument('--orphans-csv', help='把不在花名册中的用户导出为 lifecycle 禁用清单')
+    plan_parser.add_argument('--show', type=int, default=50, help='屏幕上最多列出的计划项数')
+
+    apply_parser = commands.add_parser('apply', help='执行计划文件')
+    apply_parser.add_argument('plan', help='plan 生成的计划文件')
+    apply_parser.add_argument('--workers', type=int, default=None, help='工作线程数上限 (默认 BATCH_WORKERS)')
+    apply_parser.add_argument('--dry-run', action='store_true', help='只检查并列出将执行的修改，不写入 AD')
+    apply_parser.add_argument('--force', action='store_true', help='执行已过期的计划')
+    apply_parser.add_argument('--report', help='结果报告路径 (默认 <计划>.report.csv，试运行为 <计划>.dry-run.csv)')
+    args = parser.parse_args(argv)
+
+    from bulk_import import load_credentials
+
+    try:
+        bind_username, bind_password = load_credentials(args.bind_user, args.credentials)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    if args.command == 'plan':
+        return _plan_command(args, bind_username, bind_password)
+    return _apply_command(args, bind_username, bind_password)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# /request_timing.py
+"""
+按请求统计 LDAP 往返次数和耗时：输出 Server-Timing 响应头 (浏览器开发者工具可见)，
+每个请求记录一行摘要日志，并在超出端点的 LDAP 往返预算时告警。
+"""
+import time
+import logging
+import threading
+from flask import request, g, template_rendered, before_render_template
+from utils import CONFIG
+from ldap_metrics import current_request_ops, LDAP_BUDGET_EXCEEDED
+
+# "请求方法 端点" -> 允许的 LDAP 往返次数 (不含 bind)，可在 config.json 的 LDAP_OP_BUDGETS 中覆盖。
+# 只统计列出的方法：同一端点的 POST (如仪表盘上的单个创建) 写入量取决于表单内容，不设预算。
+# 仪表盘页面在缓存全冷时需要一次 OU 搜索和一次安全组搜索；缓存命中时为 0。
+DEFAULT_LDAP_OP_BUDGETS = {'GET main.dashboard': 2}
+
+# unbind 没有响应报文，建立连接的各阶段 (见 ldap_transport) 不是 LDAP 操作，都不计入往返次数
+_NO_ROUND_TRIP = {'unbind', 'dns', 'connect', 'tls'}
+# bind 与建立连接一样取决于连接池是否有空闲连接，而不是端点本身的查询逻辑，不计入预算
+_NOT_BUDGETED = _NO_ROUND_TRIP | {'bind'}
+
+
+class RequestOps:
+    """
+    一次请求内的 LDAP 操作计数与耗时 (秒)。
+    /batch_create 等批量请求的工作线程复制请求上下文，共用同一个实例，因此 record 加锁，读取时先取快照。
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, duration):
+        with self._lock:
+            self.counts[operation] = self.counts.get(operation, 0) + 1
+            self.durations[operation] = self.durations.get(operation, 0.0) + duration
+
+    def snapshot(self):
+        """返回当前计数的副本；流式响应的工作线程在响应头生成之后仍可能继续记录"""
+        copy = RequestOps()
+        with self._lock:
+            copy.counts, copy.durations = dict(self.counts), dict(self.durations)
+        return copy
+
+    @property
+    def round_trips(self):
+        return sum(count for op, count in self.counts.items() if op not in _NO_ROUND_TRIP)
+
+    @property
+    def budgeted_round_trips(self):
+        return sum(count for op, count in self.counts.items() if op not in _NOT_BUDGETED)
+
+    @property
+    def total_duration(self):
+        return sum(self.durations.values())
+
+
+def _op_budget(method, endpoint):
+    budgets = dict(DEFAULT_LDAP_OP_BUDGETS)
+    budgets.update(CONFIG.get('LDAP_OP_BUDGETS', {}))
+    return budgets.get(f"{method} {endpoint}")
+
+
+def _server_timing(ops, render_seconds, total_seconds):
+    metrics = []
+    for operation in sorted(ops.counts):
+        metrics.append(f'ldap-{operation};desc="{ops.counts[operation]}x {operation}";'
+                       f'dur={ops.durations[operation] * 1000:.1f}')
+    metrics.append(f'ldap;desc="{ops.round_trips} round-trips";dur={ops.total_duration * 1000:.1f}')
+    metrics.append(f'render;dur={render_seconds * 1000:.1f}')
+    metrics.append(f'total;dur={total_seconds * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.render_seconds = 0.0
+    g.request_ops = RequestOps()
+    g.request_ops_token = current_request_ops.set(g.request_ops)
+
+
+def _before_render(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        g.render_seconds += time.perf_counter() - started
+
+
+def _after_request(response):
+    ops = g.get('request_ops')
+    if ops is None:
+        return response
+    ops = ops.snapshot()
+    total_seconds = time.perf_counter() - g.request_started
+    response.headers['Server-Timing'] = _server_timing(ops, g.render_seconds, total_seconds)
+
+    op_summary = ' '.join(f"{op}={count}" for op, count in sorted(ops.counts.items())) or '-'
+    logger = logging.getLogger('aduser.requests')
+    logger.info(f"{request.method} {request.path} endpoint={request.endpoint} status={response.status_code} "
+                f"ldap_round_trips={ops.round_trips} ({op_summary}) ldap_ms={ops.total_duration * 1000:.1f} "
+                f"render_ms={g.render_seconds * 1000:.1f} total_ms={total_seconds * 1000:.1f}")
+
+    budget = _op_budget(request.method, request.endpoint)
+    if budget is not None and ops.budgeted_round_trips > budget:
+        LDAP_BUDGET_EXCEEDED.inc(request.method, request.endpoint)
+        logger.warning(f"LDAP op budget exceeded: {request.method} {request.endpoint} used "
+                       f"{ops.budgeted_round_trips} round-trips excluding bind (budget {budget})")
+    return response
+
+
+def _teardown_request(exc):
+    token = g.pop('request_ops_token', None)
+    if token is not None:
+        current_request_ops.reset(token)
+
+
+def init_app(app):
+    logger = logging.getLogger('aduser.requests')
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_template_rendered, app)
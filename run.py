@@ -1,23 +1,41 @@
 # /run.py
-import os
 from flask import Flask, redirect, url_for, session
 from utils import load_config
+import profiler
+from sessions import load_secret_key, create_session_interface
+import request_timing
+import deadlines
 from blueprints.auth import auth_bp
 from blueprints.main import main_bp
 from blueprints.management import management_bp
+from blueprints.monitoring import monitoring_bp
+from blueprints.api import api_bp
 
 # 加载配置并检查是否是首次运行
 CONFIG, IS_FIRST_RUN = load_config()
 
 # 创建 Flask 应用实例，并指定 static 文件夹
 app = Flask(__name__, static_folder='static')
-app.secret_key = os.urandom(24)
+# 持久化的签名密钥 + 服务端会话存储：多个 worker 之间共享会话，重启后无需重新登录
+app.secret_key = load_secret_key()
+app.session_interface = create_session_interface()
 app.config['IS_FIRST_RUN'] = IS_FIRST_RUN
 
 # 注册蓝图
 app.register_blueprint(auth_bp)
 app.register_blueprint(main_bp)
 app.register_blueprint(management_bp)
+app.register_blueprint(monitoring_bp)
+app.register_blueprint(api_bp)
+
+# 按需开启的请求性能分析 (在设置页面或环境变量中开启)，最先注册以覆盖其他钩子的耗时
+profiler.init_app(app)
+
+# 每个请求的 LDAP 往返统计与 Server-Timing 响应头
+request_timing.init_app(app)
+
+# 按端点的请求截止时间，传递到每个 LDAP 操作 (time_limit、接收超时)
+deadlines.init_app(app)
 
 # 添加根路径重定向，以处理初始访问
 @app.route('/')
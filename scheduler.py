@@ -0,0 +1,128 @@
+# /scheduler.py
+"""
+LDAP 操作调度：每个操作发送前在这里领取一个执行名额，限制本进程同时在途的操作数，保护域控。
+等待名额的操作分为三条优先级通道，名额空出时按以下顺序放行：
+  - interactive: 页面上的单个操作 (默认)
+  - refresh: OU/安全组列表等缓存的刷新，页面正在等待其结果
+  - batch: 批量导入等后台任务；最多占用 LDAP_BATCH_MAX_IN_FLIGHT 个名额，其余名额始终留给前两条通道。
+    实际上限由 AIMD 控制器 (见 adaptive_limit) 按域控延迟和 busy/unavailable 结果在 1 ~ 该值之间调整
+同一通道内按操作人轮转，多个批量任务同时运行时各操作人平均分配名额，而不是按提交的行数分配。
+"""
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from utils import CONFIG
+from adaptive_limit import AIMDLimit
+
+LANES = ('interactive', 'refresh', 'batch')
+
+LDAP_MAX_IN_FLIGHT = CONFIG.get('LDAP_MAX_IN_FLIGHT', 16)
+LDAP_BATCH_MAX_IN_FLIGHT = CONFIG.get('LDAP_BATCH_MAX_IN_FLIGHT', 12)
+
+current_lane = contextvars.ContextVar('current_lane', default='interactive')
+
+
+class _Ticket:
+    __slots__ = ('lane', 'operator', 'granted')
+
+    def __init__(self, lane, operator):
+        self.lane, self.operator, self.granted = lane, operator, False
+
+
+class Scheduler:
+    def __init__(self, max_in_flight=LDAP_MAX_IN_FLIGHT, lane_limits=None):
+        self.max_in_flight = max_in_flight
+        self.lane_limits = dict(lane_limits or {})  # 通道 -> 该通道最多占用的名额，未列出的通道只受总数限制
+        self._cond = threading.Condition()
+        self._in_flight = {lane: 0 for lane in LANES}
+        self._waiting = {lane: OrderedDict() for lane in LANES}  # 通道 -> {操作人: deque[_Ticket]}，按轮转顺序
+        self._controllers = {}  # 通道 -> AIMDLimit
+
+    def set_controller(self, lane, controller):
+        """由 controller 根据该通道操作的耗时和结果调整通道上限"""
+        self._controllers[lane] = controller
+        self.set_lane_limit(lane, controller.limit)
+
+    def set_lane_limit(self, lane, limit):
+        """调整通道名额上限 (如自适应并发控制)，放宽时立即放行等待者"""
+        with self._cond:
+            self.lane_limits[lane] = limit
+            self._dispatch()
+
+    def in_flight(self, lane=None):
+        return self._in_flight[lane] if lane else sum(self._in_flight.values())
+
+    def waiting(self, lane):
+        return sum(len(tickets) for tickets in self._waiting[lane].values())
+
+    def _has_capacity(self, lane):
+        if sum(self._in_flight.values()) >= self.max_in_flight:
+            return False
+        limit = self.lane_limits.get(lane)
+        return limit is None or self._in_flight[lane] < limit
+
+    def _dispatch(self):
+        """按通道优先级、通道内按操作人轮转放行等待者；调用方持有锁"""
+        granted = False
+        for lane in LANES:
+            queue = self._waiting[lane]
+            while queue and self._has_capacity(lane):
+                operator, tickets = next(iter(queue.items()))
+                ticket = tickets.popleft()
+                del queue[operator]
+                if tickets:
+                    queue[operator] = tickets  # 该操作人排到队尾
+                ticket.granted = True
+                self._in_flight[lane] += 1
+                granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, lane, operator, timeout=None):
+        """领取名额，返回的凭据在操作完成后交给 release()；超时返回 None"""
+        ticket = _Ticket(lane, operator)
+        with self._cond:
+            if not self._waiting[lane] and self._has_capacity(lane) and not self._higher_lanes_waiting(lane):
+                ticket.granted = True
+                self._in_flight[lane] += 1
+                return ticket
+            self._waiting[lane].setdefault(operator, deque()).append(ticket)
+            if not self._cond.wait_for(lambda: ticket.granted, timeout):
+                self._waiting[lane][operator].remove(ticket)
+                if not self._waiting[lane][operator]:
+                    del self._waiting[lane][operator]
+                return None
+        return ticket
+
+    def _higher_lanes_waiting(self, lane):
+        return any(self._waiting[other] for other in LANES[:LANES.index(lane)])
+
+    def release(self, ticket, duration=None, outcome=None):
+        """归还名额；duration / outcome (LDAP 结果码或 'timeout') 交给该通道的并发控制器"""
+        with self._cond:
+            self._in_flight[ticket.lane] -= 1
+            self._dispatch()
+        controller = self._controllers.get(ticket.lane)
+        if controller is not None and duration is not None:
+            if controller.record(duration, outcome) is not None:
+                self.set_lane_limit(ticket.lane, controller.limit)  # 取最新值，避免并发调整时写回旧值
+
+
+@contextmanager
+def lane(name):
+    """在该上下文中发出的 LDAP 操作进入指定通道"""
+    if name not in LANES:
+        raise ValueError(f"unknown lane: {name}")
+    token = current_lane.set(name)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+SCHEDULER = Scheduler()
+SCHEDULER.set_controller('batch', AIMDLimit(initial=CONFIG.get('BATCH_CONCURRENCY_INITIAL', 2),
+                                            max_limit=LDAP_BATCH_MAX_IN_FLIGHT,
+                                            window=CONFIG.get('AIMD_WINDOW', 20),
+                                            tolerance=CONFIG.get('AIMD_LATENCY_TOLERANCE', 1.5)))
@@ -0,0 +1,194 @@
+# /sessions.py
+"""
+服务端会话存储与持久化签名密钥。
+Cookie 中只保存签名后的会话 ID，会话数据 (包括绑定密码) 保存在服务端存储中，
+因此多个 worker / 重启之后会话依然有效，Cookie 也足够小。
+
+存储后端由 CONFIG['SESSION_BACKEND'] 选择：
+  - 'sqlite' (默认): 本机 SQLite 文件 SESSION_DB，同一台机器上的所有 worker 共享
+  - 'module:ClassName': 自定义的 SessionStore 子类 (无参构造)，例如多节点共享的 Redis 存储
+多节点部署时各节点必须使用同一个签名密钥 (同一份 secret_key 文件或 ADUSER_SECRET_KEY 环境变量)，
+并使用共享后端或在负载均衡上开启会话保持。
+"""
+import os
+import json
+import time
+import sqlite3
+import secrets
+import importlib
+import threading
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+from utils import CONFIG
+
+SECRET_KEY_FILE = CONFIG.get('SECRET_KEY_FILE', 'secret_key')
+SESSION_DB = CONFIG.get('SESSION_DB', 'sessions.sqlite3')
+SESSION_LIFETIME = timedelta(hours=CONFIG.get('SESSION_LIFETIME_HOURS', 12))
+
+
+def load_secret_key():
+    """签名密钥：环境变量 ADUSER_SECRET_KEY > 配置项 SECRET_KEY > 密钥文件 (不存在时生成)"""
+    key = os.environ.get('ADUSER_SECRET_KEY') or CONFIG.get('SECRET_KEY')
+    if key:
+        return key
+    try:
+        # O_EXCL 保证多个 worker 同时启动时只有一个生成密钥，其余读取它写入的文件
+        fd = os.open(SECRET_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(SECRET_KEY_FILE, 'r', encoding='utf-8') as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.1)  # 另一个进程刚创建文件，尚未写完
+        raise RuntimeError(f"'{SECRET_KEY_FILE}' is empty, delete it to generate a new key")
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(key)
+    print(f"INFO: Generated a new session signing key in '{SECRET_KEY_FILE}'.")
+    return key
+
+
+class SessionStore(ABC):
+    """会话存储后端接口；数据为可 JSON 序列化的 dict，expires_at 为 Unix 时间戳"""
+
+    @abstractmethod
+    def load(self, sid):
+        """返回 (data, expires_at)；不存在或已过期时返回 None"""
+
+    @abstractmethod
+    def save(self, sid, data, expires_at):
+        pass
+
+    @abstractmethod
+    def delete(self, sid):
+        pass
+
+    def purge_expired(self):
+        """删除过期会话；后端自带过期机制 (如 Redis TTL) 时无需实现"""
+
+
+class SqliteSessionStore(SessionStore):
+    def __init__(self, path=SESSION_DB):
+        self.path = path
+        self._local = threading.local()
+        self._restrict_permissions()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+                         '(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires_at)')
+
+    def _restrict_permissions(self):
+        """
+        会话中含有绑定密码，数据库及其 -wal/-shm 文件都只允许本用户读写。
+        在首次连接之前以 0600 预先创建这三个文件：SQLite 打开已存在的文件时不改权限，
+        之后重新创建 -wal/-shm 时沿用数据库文件的权限，不受进程 umask 影响。
+        """
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+            os.chmod(path, 0o600)  # 旧版本创建的文件可能是 0644
+
+    def _connect(self):
+        # sqlite3 连接不能跨线程使用，也不能在 fork 后继续使用父进程的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, sid):
+        row = self._connect().execute('SELECT data, expires_at FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save(self, sid, data, expires_at):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                         (sid, json.dumps(data, ensure_ascii=False), expires_at))
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE expires_at < ?', (time.time(),))
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, data=None, sid=None, expires_at=None, new=False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(data, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = new
+        self.modified = False
+        self.replaced_sid = None
+
+    def regenerate(self):
+        """登录成功后更换会话 ID，防止会话固定攻击"""
+        if self.replaced_sid is None and not self.new:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store, lifetime=SESSION_LIFETIME):
+        self.store = store
+        self.lifetime = lifetime
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='aduser-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('ascii')
+            except BadSignature:
+                sid = None
+            stored = self.store.load(sid) if sid else None
+            if stored is not None:
+                return ServerSideSession(stored[0], sid=sid, expires_at=stored[1])
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name, domain, path = self.get_cookie_name(app), self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.replaced_sid:
+            self.store.delete(session.replaced_sid)
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        lifetime = self.lifetime.total_seconds()
+        # 滑动过期：数据变化或剩余有效期不足一半时才写存储，避免每个请求都写一次
+        if session.modified or session.expires_at is None or session.expires_at - now < lifetime / 2:
+            self.store.save(session.sid, dict(session), now + lifetime)
+            if session.new and secrets.randbelow(100) == 0:
+                self.store.purge_expired()
+        if session.new or session.modified:
+            response.set_cookie(name, self._signer(app).sign(session.sid).decode('ascii'),
+                                domain=domain, path=path, httponly=self.get_cookie_httponly(app),
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+
+def create_session_interface():
+    backend = CONFIG.get('SESSION_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        store = SqliteSessionStore()
+    else:
+        module_name, _, class_name = backend.partition(':')
+        store = getattr(importlib.import_module(module_name), class_name)()
+    return ServerSideSessionInterface(store)
@@ -0,0 +1,91 @@
+# /tests/test_adaptive_limit.py
+import unittest
+from unittest import mock
+from adaptive_limit import AIMDLimit
+from scheduler import Scheduler
+
+
+class AIMDLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('adaptive_limit.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fill_window(self, limit, duration):
+        """写满一个窗口，返回最后一次 record 的结果"""
+        result = None
+        for _ in range(limit.window):
+            result = limit.record(duration, 0)
+        return result
+
+    def test_initial_limit_is_clamped(self):
+        self.assertEqual(AIMDLimit(initial=50, max_limit=12).limit, 12)
+        self.assertEqual(AIMDLimit(initial=0, min_limit=1).limit, 1)
+
+    def test_increases_by_one_per_stable_window(self):
+        limit = AIMDLimit(initial=2, window=5)
+        for _ in range(4):
+            self.assertIsNone(limit.record(0.01, 0))
+        self.assertEqual(limit.record(0.01, 0), 3)
+        self.assertEqual(self.fill_window(limit, 0.01), 4)
+
+    def test_does_not_exceed_max_limit(self):
+        limit = AIMDLimit(initial=3, max_limit=3, window=5)
+        self.assertIsNone(self.fill_window(limit, 0.01))
+        self.assertEqual(limit.limit, 3)
+
+    def test_holds_when_latency_rises_above_tolerance(self):
+        limit = AIMDLimit(initial=2, window=5, tolerance=1.5)
+        self.assertEqual(self.fill_window(limit, 0.010), 3)
+        self.assertIsNone(self.fill_window(limit, 0.020))
+        self.assertEqual(limit.limit, 3)
+        self.assertEqual(self.fill_window(limit, 0.012), 4)
+
+    def test_overload_backs_off_multiplicatively(self):
+        limit = AIMDLimit(initial=8, backoff=0.5)
+        self.assertEqual(limit.record(0.5, 51), 4)
+        self.now += 2
+        self.assertEqual(limit.record(0.5, 52), 2)
+        self.now += 2
+        self.assertEqual(limit.record(0.5, 'timeout'), 1)
+        self.now += 2
+        self.assertIsNone(limit.record(0.5, 'timeout'))
+        self.assertEqual(limit.limit, 1)
+
+    def test_backs_off_once_per_cooldown(self):
+        limit = AIMDLimit(initial=8, backoff=0.5, cooldown=1.0)
+        self.assertEqual(limit.record(0.5, 51), 4)
+        self.now += 0.5
+        self.assertIsNone(limit.record(0.5, 51))
+        self.assertEqual(limit.limit, 4)
+        self.now += 0.6
+        self.assertEqual(limit.record(0.5, 51), 2)
+
+    def test_overload_discards_partial_window(self):
+        limit = AIMDLimit(initial=4, window=5)
+        for _ in range(4):
+            limit.record(0.01, 0)
+        self.assertEqual(limit.record(0.5, 51), 2)
+        for _ in range(4):
+            self.assertIsNone(limit.record(0.01, 0))
+        self.assertEqual(limit.record(0.01, 0), 3)
+
+    def test_other_errors_count_as_samples(self):
+        limit = AIMDLimit(initial=2, window=2)
+        self.assertIsNone(limit.record(0.01, 32))
+        self.assertEqual(limit.record(0.01, 68), 3)
+
+    def test_scheduler_applies_controller_limit(self):
+        scheduler = Scheduler(max_in_flight=16)
+        scheduler.set_controller('batch', AIMDLimit(initial=4, backoff=0.5))
+        self.assertEqual(scheduler.lane_limits['batch'], 4)
+        ticket = scheduler.acquire('batch', 'alice')
+        scheduler.release(ticket, duration=0.5, outcome=51)
+        self.assertEqual(scheduler.lane_limits['batch'], 2)
+        tickets = [scheduler.acquire('batch', 'alice', timeout=0) for _ in range(3)]
+        self.assertIsNone(tickets[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# /tests/test_audit.py
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+import audit
+
+
+def entry(ts, operator='admin', dn='CN=u1,OU=x,DC=corp,DC=com'):
+    return {'ts': ts, 'operator': operator, 'operation': 'add', 'dn': dn, 'result': 0, 'padding': 'x' * 200}
+
+
+class OperatorNameTest(unittest.TestCase):
+    def test_bind_account_forms_map_to_one_name(self):
+        for user in ('Admin@corp.com', 'CORP\\Admin', 'admin', 'CN=Admin,CN=Users,DC=corp,DC=com'):
+            self.assertEqual(audit.operator_name(user), 'admin', user)
+
+    def test_api_clients_and_empty_values_are_kept(self):
+        self.assertEqual(audit.operator_name('api:hr'), 'api:hr')
+        self.assertEqual(audit.operator_name(None), '')
+
+
+class AuditIndexRotationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        path = self.directory.name
+        patcher = mock.patch.multiple(audit, AUDIT_DIR=path, AUDIT_FILE=os.path.join(path, 'audit.jsonl'),
+                                      AUDIT_INDEX=os.path.join(path, 'audit_index.sqlite3'),
+                                      AUDIT_MAX_BYTES=1000, AUDIT_BACKUP_COUNT=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, index, start, count):
+        for ts in range(start, start + count):
+            index = audit._write_batch([entry(float(ts))], index)
+        return index
+
+    def indexed_ts(self, index):
+        return [row[0] for row in index.execute("SELECT ts FROM audit ORDER BY ts")]
+
+    def test_rotation_prunes_entries_of_deleted_log_files(self):
+        index = self.write(None, 1, 40)
+        self.addCleanup(index.close)
+        logged = []
+        for path in audit._log_files():
+            with open(path, encoding='utf-8') as f:
+                logged.extend(json.loads(line)['ts'] for line in f)
+        self.assertLess(len(logged), 40)  # 最旧的文件已被轮转删除
+        self.assertEqual(self.indexed_ts(index), sorted(logged))
+
+    def test_search_matches_operator_in_any_form(self):
+        index = audit._write_batch([entry(1.0, 'admin@corp.com'), entry(2.0, 'CORP\\admin'),
+                                    entry(3.0, 'other@corp.com')], None)
+        index.close()
+        self.assertEqual([e['ts'] for e in audit.search(operator='Admin@corp.com')], [2.0, 1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
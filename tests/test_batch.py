@@ -0,0 +1,26 @@
+# /tests/test_batch.py
+import unittest
+from batch import _group_rows
+
+
+def login(row):
+    return row[1].lower() or None
+
+
+class GroupRowsTest(unittest.TestCase):
+    def test_without_key_every_row_is_its_own_unit(self):
+        rows = [(2, ['disable', 'a']), (3, ['delete', 'a'])]
+        self.assertEqual(_group_rows(rows, None), [[rows[0]], [rows[1]]])
+
+    def test_rows_with_same_key_stay_together_in_order(self):
+        rows = [(2, ['disable', 'a']), (3, ['disable', 'B']), (4, ['move', 'A']), (5, ['delete', 'b']),
+                (6, ['delete', 'a'])]
+        self.assertEqual(_group_rows(rows, login), [[rows[0], rows[2], rows[4]], [rows[1], rows[3]]])
+
+    def test_unparsed_rows_and_empty_keys_are_not_grouped(self):
+        rows = [(2, None), (3, ['disable', '']), (4, None), (5, ['disable', ''])]
+        self.assertEqual(_group_rows(rows, login), [[row] for row in rows])
+
+
+if __name__ == '__main__':
+    unittest.main()
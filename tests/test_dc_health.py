@@ -0,0 +1,72 @@
+# /tests/test_dc_health.py
+import unittest
+from unittest import mock
+import dc_health
+from dc_health import LDAPS_PORT, GLOBAL_CATALOG_SSL_PORT
+from utils import CONFIG
+
+
+class DCHealthTest(unittest.TestCase):
+    """probe 被替换为按 (域控, 端口) 查表，不发起真实连接"""
+
+    def setUp(self):
+        self.reachable = {}
+        self.probed = []
+        saved = {key: CONFIG.get(key) for key in ('DOMAIN_CONTROLLER_IP', 'READ_DOMAIN_CONTROLLERS',
+                                                  'WRITE_DOMAIN_CONTROLLER', 'READ_FROM_GLOBAL_CATALOG')}
+        self.addCleanup(CONFIG.update, saved)
+        CONFIG.update(DOMAIN_CONTROLLER_IP='dc1, dc2', READ_DOMAIN_CONTROLLERS='', WRITE_DOMAIN_CONTROLLER='',
+                      READ_FROM_GLOBAL_CATALOG=True)
+        patcher = mock.patch.object(dc_health, 'probe', side_effect=self._probe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        dc_health._state.update(targets=(), results={}, checked_at=0.0, refreshing=False)
+
+    def _probe(self, host, port=LDAPS_PORT, timeout=None):
+        self.probed.append((host, port))
+        latency = self.reachable.get((host, port))
+        if latency is None:
+            return False, None, 'connection refused'
+        return True, latency, None
+
+    def test_reads_probe_global_catalog_port(self):
+        self.reachable = {('dc1', LDAPS_PORT): 1, ('dc2', LDAPS_PORT): 5, ('dc2', GLOBAL_CATALOG_SSL_PORT): 5}
+        # dc1 的 636 可达但全局编录不可达：读应切到 dc2，写仍然首选 dc1
+        self.assertEqual(dc_health.read_controllers(), ['dc2', 'dc1'])
+        self.assertEqual(dc_health.write_controllers(), ['dc1', 'dc2'])
+        self.assertEqual(set(self.probed), {(h, p) for h in ('dc1', 'dc2')
+                                            for p in (LDAPS_PORT, GLOBAL_CATALOG_SSL_PORT)})
+
+    def test_reads_without_global_catalog_probe_ldaps_only(self):
+        CONFIG['READ_FROM_GLOBAL_CATALOG'] = False
+        self.reachable = {('dc1', LDAPS_PORT): 5, ('dc2', LDAPS_PORT): 1}
+        self.assertEqual(dc_health.read_controllers(), ['dc2', 'dc1'])
+        self.assertEqual(set(self.probed), {('dc1', LDAPS_PORT), ('dc2', LDAPS_PORT)})
+
+    def test_status_reports_each_port(self):
+        self.reachable = {('dc1', GLOBAL_CATALOG_SSL_PORT): 1, ('dc2', LDAPS_PORT): 1}
+        rows = {(row['host'], row['port']): row for row in dc_health.status()}
+        self.assertEqual(set(rows), {(h, p) for h in ('dc1', 'dc2') for p in (LDAPS_PORT, GLOBAL_CATALOG_SSL_PORT)})
+        self.assertTrue(rows[('dc1', GLOBAL_CATALOG_SSL_PORT)]['healthy'])
+        self.assertFalse(rows[('dc1', LDAPS_PORT)]['healthy'])
+        self.assertEqual([target for target, row in rows.items() if row['reader']], [('dc1', GLOBAL_CATALOG_SSL_PORT)])
+        self.assertEqual([target for target, row in rows.items() if row['writer']], [('dc2', LDAPS_PORT)])
+
+    def test_status_uses_one_snapshot(self):
+        self.reachable = {('dc1', GLOBAL_CATALOG_SSL_PORT): 1, ('dc1', LDAPS_PORT): 1}
+        with mock.patch.object(dc_health, '_current_results', wraps=dc_health._current_results) as current:
+            dc_health.status()
+        self.assertEqual(current.call_count, 1)
+
+    def test_mark_down_only_affects_that_port(self):
+        self.reachable = {target: 1 for target in [('dc1', LDAPS_PORT), ('dc1', GLOBAL_CATALOG_SSL_PORT),
+                                                   ('dc2', LDAPS_PORT), ('dc2', GLOBAL_CATALOG_SSL_PORT)]}
+        dc_health.read_controllers()
+        dc_health.mark_down('dc1', 'connection failed', GLOBAL_CATALOG_SSL_PORT)
+        with mock.patch.object(dc_health, '_refresh_in_background'):
+            self.assertEqual(dc_health.read_controllers(), ['dc2', 'dc1'])
+            self.assertEqual(dc_health.write_controllers(), ['dc1', 'dc2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
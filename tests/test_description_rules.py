@@ -0,0 +1,58 @@
+# /tests/test_description_rules.py
+import unittest
+from unittest import mock
+from ad_utils import compile_rules, _rule_matches
+from dn_utils import dn_suffixes
+
+BASE = 'DC=corp,DC=com'
+
+
+class RuleKeywordTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict('utils.CONFIG', {'DOMAIN_NAME': 'corp.com'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def matches(self, keyword, ou_path):
+        (keyword, keyword_dn, _value), = compile_rules({'battalion_rules': {keyword: 'X'}})['battalion_rules']
+        return _rule_matches(keyword, keyword_dn, dn_suffixes(ou_path), ou_path)
+
+    def test_full_dn_keyword_is_compiled_and_matches_subtree(self):
+        compiled = compile_rules({'battalion_rules': {f'OU=武汉1营,OU=武汉,{BASE}': 'WH1'}})
+        self.assertEqual(compiled['battalion_rules'], ((f'OU=武汉1营,OU=武汉,{BASE}', f'ou=武汉1营,ou=武汉,{BASE.lower()}',
+                                                       'WH1'),))
+        self.assertTrue(self.matches(f'OU=武汉1营,OU=武汉,{BASE}', f'OU=武汉1营,OU=武汉,{BASE}'))
+        self.assertTrue(self.matches(f'OU=武汉1营,OU=武汉,{BASE}', f'OU=一连,OU=武汉1营,OU=武汉,{BASE}'))
+
+    def test_full_dn_keyword_ignores_case_spacing_and_escapes(self):
+        self.assertTrue(self.matches(f'ou=武汉1营, ou=武汉, dc=CORP, dc=com', f'OU=武汉1营,OU=武汉,{BASE}'))
+        self.assertTrue(self.matches(f'OU=\\E6\\AD\\A6\\E6\\B1\\89,{BASE}', f'OU=一连,OU=武汉,{BASE}'))
+
+    def test_full_dn_keyword_does_not_match_by_prefix_of_value(self):
+        # DN 关键字按 RDN 边界匹配：'武汉11营' 不在 '武汉1营' 之下，值的后缀 '1营' 也不是上级 OU
+        self.assertFalse(self.matches(f'OU=1营,OU=武汉,{BASE}', f'OU=武汉1营,OU=武汉,{BASE}'))
+        self.assertFalse(self.matches(f'OU=武汉1营,OU=武汉,{BASE}', f'OU=武汉11营,OU=武汉,{BASE}'))
+
+    def test_full_dn_keyword_with_escaped_comma(self):
+        keyword = f'OU=Sales\\, East,{BASE}'
+        self.assertTrue(self.matches(keyword, f'OU=Team,OU=Sales\\, East,{BASE}'))
+        self.assertFalse(self.matches(keyword, f'OU=East,{BASE}'))
+
+    def test_partial_dn_keyword_falls_back_to_substring(self):
+        compiled = compile_rules({'battalion_rules': {'OU=武汉1营': 'WH1'}})
+        self.assertIsNone(compiled['battalion_rules'][0][1])
+        self.assertTrue(self.matches('OU=武汉1营', f'OU=一连,OU=武汉1营,OU=武汉,{BASE}'))
+        self.assertFalse(self.matches('OU=武汉1营', f'OU=武汉2营,OU=武汉,{BASE}'))
+
+    def test_dn_from_another_domain_falls_back_to_substring(self):
+        keyword = 'OU=武汉1营,DC=other,DC=com'
+        self.assertIsNone(compile_rules({'battalion_rules': {keyword: 'X'}})['battalion_rules'][0][1])
+        self.assertFalse(self.matches(keyword, f'OU=武汉1营,{BASE}'))
+
+    def test_plain_keyword_matches_substring(self):
+        self.assertTrue(self.matches('武汉', f'OU=一连,OU=武汉1营,{BASE}'))
+        self.assertFalse(self.matches('上海', f'OU=武汉1营,{BASE}'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# /tests/test_dn_store.py
+import unittest
+from dn_store import DNStore, DNOption
+
+BASE = 'DC=corp,DC=com'
+DNS = [
+    f'OU=武汉,{BASE}',
+    f'OU=武汉1营,OU=武汉,{BASE}',
+    f'OU=Sales\\, East,OU=武汉,{BASE}',
+    f'OU=上海,{BASE}',
+    f'OU=Team\\+1,OU=上海,{BASE}',
+]
+
+
+class DNStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = DNStore(DNS + [DNS[0]], base_dn=BASE)
+
+    def test_members_round_trip_sorted_without_duplicates(self):
+        self.assertEqual(len(self.store), len(DNS))
+        self.assertEqual(self.store.to_list(), sorted(DNS))
+
+    def test_suffix_only_nodes_are_not_members(self):
+        self.assertIn(DNS[0], self.store)
+        self.assertNotIn(BASE, self.store)
+        self.assertNotIn('DC=com', self.store)
+        self.assertNotIn(f'OU=广州,{BASE}', self.store)
+
+    def test_escaped_rdns_are_single_nodes(self):
+        self.assertIn(f'OU=Sales\\, East,OU=武汉,{BASE}', self.store)
+        self.assertNotIn(f'OU=East,OU=武汉,{BASE}', self.store)
+        self.assertEqual(self.store.parent(f'OU=Sales\\, East,OU=武汉,{BASE}'), f'OU=武汉,{BASE}')
+
+    def test_lookup_is_by_exact_rdn(self):
+        # 存储保留原始 RDN 文本，大小写无关的比较由 dn_utils.same_dn 负责
+        self.assertNotIn(f'ou=武汉,{BASE}', self.store)
+
+    def test_parent_and_children(self):
+        self.assertEqual(self.store.parent(f'OU=武汉1营,OU=武汉,{BASE}'), f'OU=武汉,{BASE}')
+        self.assertEqual(self.store.parent(f'OU=武汉,{BASE}'), BASE)
+        self.assertIsNone(self.store.parent('DC=com'))
+        self.assertIsNone(self.store.parent(f'OU=广州,{BASE}'))
+        self.assertEqual(sorted(self.store.children(f'OU=武汉,{BASE}')), sorted(DNS[1:3]))
+        self.assertEqual(sorted(self.store.children(BASE)), sorted([DNS[0], DNS[3]]))
+        self.assertEqual(self.store.children(f'OU=广州,{BASE}'), [])
+
+    def test_subtree(self):
+        self.assertEqual(self.store.subtree(f'OU=武汉,{BASE}'), sorted(DNS[:3]))
+        self.assertEqual(self.store.subtree(BASE), sorted(DNS))
+        self.assertEqual(self.store.subtree(f'OU=Team\\+1,OU=上海,{BASE}'), [DNS[4]])
+
+    def test_display_names_are_relative_to_base_and_unescaped(self):
+        self.assertEqual(self.store.display_name(f'OU=Sales\\, East,OU=武汉,{BASE}'), '武汉 / Sales, East')
+        self.assertEqual(self.store.display_name(f'OU=Team\\+1,OU=上海,{BASE}'), '上海 / Team+1')
+        self.assertEqual(self.store.display_name(BASE), 'Domain Root')
+        self.assertIsNone(self.store.display_name(f'OU=广州,{BASE}'))
+
+    def test_options(self):
+        options = list(self.store.options())
+        self.assertEqual([option.dn for option in options], sorted(DNS))
+        self.assertIn(DNOption(DNS[1], '武汉 / 武汉1营', '武汉1营'), options)
+
+    def test_without_base_dn_names_include_domain_components(self):
+        store = DNStore([DNS[0]])
+        self.assertEqual(store.display_name(DNS[0]), 'com / corp / 武汉')
+
+    def test_empty_store(self):
+        store = DNStore()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(list(store.options()), [])
+        self.assertNotIn(BASE, store)
+
+
+if __name__ == '__main__':
+    unittest.main()
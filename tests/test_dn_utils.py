@@ -0,0 +1,105 @@
+# /tests/test_dn_utils.py
+import unittest
+from dn_utils import (parse_dn, split_rdn, rdn_value, parent_dn, normalize_dn, dn_suffixes, is_within, same_dn,
+                      escape_rdn_value, unescape_value)
+
+
+class ParseDNTest(unittest.TestCase):
+    def test_plain_dn(self):
+        self.assertEqual(parse_dn('OU=Sales,DC=corp,DC=com'), ('OU=Sales', 'DC=corp', 'DC=com'))
+        self.assertEqual(parse_dn(''), ())
+        self.assertEqual(parse_dn(None), ())
+
+    def test_whitespace_around_rdns_is_dropped(self):
+        self.assertEqual(parse_dn(' OU=Sales , DC=corp ,DC=com'), ('OU=Sales', 'DC=corp', 'DC=com'))
+
+    def test_escaped_comma_does_not_split(self):
+        self.assertEqual(parse_dn('OU=Sales\\, East,DC=corp'), ('OU=Sales\\, East', 'DC=corp'))
+        self.assertEqual(rdn_value('OU=Sales\\, East'), 'Sales, East')
+
+    def test_escaped_backslash_before_comma_splits(self):
+        self.assertEqual(parse_dn('CN=a\\\\,DC=corp'), ('CN=a\\\\', 'DC=corp'))
+        self.assertEqual(rdn_value('CN=a\\\\'), 'a\\')
+
+    def test_quoted_value_does_not_split(self):
+        self.assertEqual(parse_dn('OU="Sales, East",DC=corp'), ('OU="Sales, East"', 'DC=corp'))
+        self.assertEqual(rdn_value('OU="Sales, East"'), 'Sales, East')
+
+    def test_escaped_trailing_space_is_kept(self):
+        self.assertEqual(parse_dn('CN=a\\ ,DC=corp'), ('CN=a\\ ', 'DC=corp'))
+        self.assertEqual(rdn_value('CN=a\\ '), 'a ')
+
+    def test_parent_dn(self):
+        self.assertEqual(parent_dn('CN=Smith\\, John,OU=Sales,DC=corp'), 'OU=Sales,DC=corp')
+        self.assertEqual(parent_dn('DC=corp'), '')
+
+
+class RDNValueTest(unittest.TestCase):
+    def test_hex_escapes_decode_as_utf8(self):
+        self.assertEqual(unescape_value('\\E6\\AD\\A6\\E6\\B1\\89'), '武汉')
+        self.assertEqual(rdn_value('OU=\\e6\\ad\\a6\\e6\\b1\\89'), '武汉')
+
+    def test_escaped_special_characters(self):
+        self.assertEqual(rdn_value('CN=a\\+b\\=c\\;d\\#'), 'a+b=c;d#')
+        self.assertEqual(rdn_value('CN=\\#1'), '#1')
+
+    def test_multi_valued_rdn_uses_first_attribute(self):
+        self.assertEqual(split_rdn('CN=Smith+UID=jsmith'), ('CN', 'Smith'))
+        self.assertEqual(split_rdn('CN=a\\+UID\\=b'), ('CN', 'a+UID=b'))
+
+    def test_rdn_without_attribute(self):
+        self.assertEqual(split_rdn('Sales'), ('', 'Sales'))
+
+    def test_escape_round_trip(self):
+        for value in ('a ', ' a', '  ', ' ', '#a', 'a#', 'a,b', 'a+b', 'x=y', 'a"b', 'a;b<c>', 'a\\ ', '\\',
+                      '武汉 1营'):
+            escaped = escape_rdn_value(value)
+            self.assertEqual(parse_dn(f'CN={escaped},DC=corp')[1:], ('DC=corp',), escaped)
+            self.assertEqual(rdn_value(parse_dn(f'CN={escaped},DC=corp')[0]), value, escaped)
+
+
+class NormalizeDNTest(unittest.TestCase):
+    def test_case_and_whitespace_are_folded(self):
+        self.assertEqual(normalize_dn(' OU = Sales ,dc=Corp, DC=COM'), 'ou=sales,dc=corp,dc=com')
+        self.assertTrue(same_dn('OU=Sales,DC=corp,DC=com', 'ou=SALES, dc=corp, dc=com'))
+
+    def test_equivalent_escapes_compare_equal(self):
+        self.assertTrue(same_dn('OU=\\E6\\AD\\A6\\E6\\B1\\89,DC=corp', 'OU=武汉,DC=corp'))
+        self.assertTrue(same_dn('OU="Sales, East",DC=corp', 'OU=Sales\\, East,DC=corp'))
+        self.assertTrue(same_dn('OU=Sales\\2C East,DC=corp', 'OU=Sales\\, East,DC=corp'))
+
+    def test_escaped_comma_is_not_a_separator(self):
+        self.assertFalse(same_dn('OU=Sales\\, East,DC=corp', 'OU=Sales,OU=East,DC=corp'))
+
+    def test_multi_valued_rdn_order_does_not_matter(self):
+        self.assertTrue(same_dn('CN=a+UID=b,DC=corp', 'UID=b+CN=a,DC=corp'))
+
+    def test_multi_valued_rdn_differs_from_escaped_plus(self):
+        self.assertFalse(same_dn('CN=a+UID=b,DC=corp', 'CN=a\\+UID\\=b,DC=corp'))
+
+    def test_trailing_space_is_significant_only_when_escaped(self):
+        self.assertTrue(same_dn('CN=a ,DC=corp', 'CN=a,DC=corp'))
+        self.assertFalse(same_dn('CN=a\\ ,DC=corp', 'CN=a,DC=corp'))
+
+
+class SubtreeTest(unittest.TestCase):
+    def test_dn_suffixes(self):
+        self.assertEqual(dn_suffixes('OU=A\\, B,DC=Corp'), frozenset({'ou=a\\, b,dc=corp', 'dc=corp'}))
+        self.assertEqual(dn_suffixes(''), frozenset())
+
+    def test_is_within(self):
+        self.assertTrue(is_within('CN=u,OU=Sales,DC=corp', 'ou=sales,dc=CORP'))
+        self.assertTrue(is_within('OU=Sales,DC=corp', 'OU=Sales,DC=corp'))
+        self.assertFalse(is_within('OU=Sales,DC=corp', 'CN=u,OU=Sales,DC=corp'))
+
+    def test_escaped_comma_is_not_an_ancestor_boundary(self):
+        # 'OU=East' 只是 'OU=Sales\, East' 的值的一部分，不是上级 OU
+        self.assertFalse(is_within('OU=Sales\\, East,DC=corp', 'OU=East,DC=corp'))
+        self.assertFalse(is_within('CN=u,OU=a\\,OU=b,DC=corp', 'OU=b,DC=corp'))
+
+    def test_value_suffix_is_not_an_ancestor(self):
+        self.assertFalse(is_within('OU=武汉1营,DC=corp', 'OU=1营,DC=corp'))
+
+
+if __name__ == '__main__':
+    unittest.main()
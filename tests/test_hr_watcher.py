@@ -0,0 +1,109 @@
+# /tests/test_hr_watcher.py
+import os
+import csv
+import tempfile
+import unittest
+from unittest import mock
+from ldap3.core.exceptions import LDAPSessionTerminatedByServerError, LDAPSocketOpenError
+import hr_watcher
+from utils import CONFIG
+from ad_utils import get_base_dn
+
+
+class FakeDirectory:
+    """只支持创建用户所需操作的域控；dropped 后已有连接断开、新连接无法建立"""
+
+    def __init__(self, drop_after_adds=None):
+        self.users = []
+        self.drop_after_adds = drop_after_adds
+
+    @property
+    def dropped(self):
+        return self.drop_after_adds is not None and len(self.users) >= self.drop_after_adds
+
+    def connect(self, *args, **kwargs):
+        if self.dropped:
+            raise LDAPSocketOpenError('socket connection error while opening: [Errno 111] Connection refused')
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, directory):
+        self.directory, self.bound, self.closed = directory, True, False
+        self.entries, self.result = [], {'result': 0, 'description': 'success'}
+
+    def _check(self):
+        if self.directory.dropped:
+            self.closed = True
+            raise LDAPSessionTerminatedByServerError('session terminated by server')
+
+    def search(self, search_base, search_filter, *args, **kwargs):
+        self._check()
+        self.entries = []
+        return False
+
+    def add(self, dn, *args, **kwargs):
+        self._check()
+        self.directory.users.append(dn)
+        return True
+
+
+class DCDropTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.drop_dir = os.path.join(self.directory.name, 'drop')
+        self.archive_dir = os.path.join(self.directory.name, 'archive')
+        os.makedirs(self.drop_dir)
+        self.ou = f"OU=新员工,{get_base_dn(CONFIG['DOMAIN_NAME'])}"
+        self.dc = FakeDirectory(drop_after_adds=2)
+        patches = [
+            mock.patch('hr_watcher.check_bind', return_value=(True, "绑定成功。")),
+            mock.patch('batch.acquire_connection', side_effect=lambda *a, **k: self.dc.connect()),
+            mock.patch('batch.release_connection'),
+            mock.patch('batch.get_cached_positions', return_value={}),
+            mock.patch('ad_utils.create_ou_if_not_exists', return_value=(True, "OU exists.")),
+            mock.patch('ad_utils.compute_description', return_value=''),
+            mock.patch('ad_utils.ou_rule_groups', return_value=[]),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def drop_file(self):
+        path = os.path.join(self.drop_dir, 'new_hires.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['姓名', '登录名', 'OU路径', '职位'])
+            for i in range(4):
+                writer.writerow([f'员工{i}', f'hire{i}', self.ou, ''])
+        return path
+
+    def process(self):
+        index = hr_watcher.ProcessedIndex(self.archive_dir)
+        self.assertTrue(hr_watcher.process_file(self.drop_file(), index, self.archive_dir, 'svc', 'pw', workers=1))
+        return hr_watcher.ProcessedIndex(self.archive_dir).entries
+
+    def test_dc_drop_mid_file_leaves_file_incomplete_and_retries_rows(self):
+        entry, = self.process().values()
+        self.assertEqual(entry['status'], 'incomplete')
+        self.assertEqual(entry['counts'], {'success': 2, 'failure': 0, 'skipped': 0, 'error': 2})
+        self.assertEqual(len(self.dc.users), 2)
+
+        # 域控恢复后重新投放同一文件：只重试出错的两行
+        self.dc.drop_after_adds = None
+        entry, = self.process().values()
+        self.assertEqual(entry['status'], 'done')
+        self.assertEqual(entry['counts'], {'success': 2, 'failure': 0, 'skipped': 0, 'error': 0})
+        self.assertEqual(len(self.dc.users), 4)
+
+    def test_duplicate_of_done_file_is_skipped(self):
+        self.dc.drop_after_adds = None
+        self.assertEqual(self.process().popitem()[1]['status'], 'done')
+        self.process()
+        self.assertEqual(len(self.dc.users), 4)
+        self.assertTrue(os.listdir(os.path.join(self.archive_dir, 'duplicates')))
+
+
+if __name__ == '__main__':
+    unittest.main()
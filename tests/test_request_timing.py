@@ -0,0 +1,46 @@
+# /tests/test_request_timing.py
+import threading
+import unittest
+from request_timing import RequestOps, _op_budget
+
+
+class RequestOpsTest(unittest.TestCase):
+    def test_concurrent_records_are_not_lost(self):
+        ops = RequestOps()
+
+        def work():
+            for _ in range(5000):
+                ops.record('search', 0.001)
+                ops.record('bind', 0.001)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(ops.counts, {'search': 40000, 'bind': 40000})
+        self.assertEqual(ops.round_trips, 80000)
+        self.assertEqual(ops.budgeted_round_trips, 40000)
+
+    def test_snapshot_is_independent(self):
+        ops = RequestOps()
+        ops.record('search', 0.5)
+        snapshot = ops.snapshot()
+        ops.record('search', 0.5)
+        self.assertEqual(snapshot.counts, {'search': 1})
+        self.assertEqual(snapshot.total_duration, 0.5)
+
+    def test_unbind_and_connect_phases_are_not_round_trips(self):
+        ops = RequestOps()
+        for operation in ('dns', 'connect', 'tls', 'bind', 'search', 'unbind'):
+            ops.record(operation, 0.0)
+        self.assertEqual(ops.round_trips, 2)
+        self.assertEqual(ops.budgeted_round_trips, 1)
+
+    def test_budget_applies_to_listed_method_only(self):
+        self.assertEqual(_op_budget('GET', 'main.dashboard'), 2)
+        self.assertIsNone(_op_budget('POST', 'main.dashboard'))
+
+
+if __name__ == '__main__':
+    unittest.main()
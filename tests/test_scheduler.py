@@ -0,0 +1,136 @@
+# /tests/test_scheduler.py
+import threading
+import time
+import unittest
+from scheduler import Scheduler
+
+
+class _Waiter:
+    """在后台线程中领取名额，记录放行顺序"""
+
+    def __init__(self, scheduler, lane, operator, granted, timeout=5):
+        self.ticket = None
+        self.thread = threading.Thread(target=self._run, args=(scheduler, lane, operator, granted, timeout), daemon=True)
+
+    def _run(self, scheduler, lane, operator, granted, timeout):
+        self.ticket = scheduler.acquire(lane, operator, timeout=timeout)
+        granted.append((lane, operator, self.ticket))
+
+
+def wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler(max_in_flight=1)
+        self.granted = []
+
+    def enqueue(self, lane, operator):
+        """排队一个等待者，返回前确认它已进入等待队列，保证排队顺序确定"""
+        before = self.scheduler.waiting(lane)
+        waiter = _Waiter(self.scheduler, lane, operator, self.granted)
+        waiter.thread.start()
+        wait_until(lambda: self.scheduler.waiting(lane) == before + 1)
+        return waiter
+
+    def release_next(self, ticket):
+        """归还一个名额并返回因此被放行的 (通道, 操作人, 凭据)"""
+        count = len(self.granted)
+        self.scheduler.release(ticket)
+        wait_until(lambda: len(self.granted) == count + 1)
+        return self.granted[-1]
+
+    def test_acquire_without_contention_is_immediate(self):
+        ticket = self.scheduler.acquire('batch', 'alice', timeout=0)
+        self.assertIsNotNone(ticket)
+        self.assertEqual(self.scheduler.in_flight('batch'), 1)
+        self.scheduler.release(ticket)
+        self.assertEqual(self.scheduler.in_flight(), 0)
+
+    def test_lanes_are_served_in_priority_order(self):
+        holder = self.scheduler.acquire('interactive', 'alice')
+        self.enqueue('batch', 'alice')
+        self.enqueue('refresh', 'alice')
+        self.enqueue('interactive', 'bob')
+
+        order = []
+        ticket = holder
+        for _ in range(3):
+            lane, _operator, ticket = self.release_next(ticket)
+            order.append(lane)
+        self.assertEqual(order, ['interactive', 'refresh', 'batch'])
+        self.scheduler.release(ticket)
+        self.assertEqual(self.scheduler.in_flight(), 0)
+
+    def test_new_arrival_does_not_bypass_higher_lane_waiters(self):
+        self.scheduler.max_in_flight = 2
+        holders = [self.scheduler.acquire('interactive', 'alice') for _ in range(2)]
+        self.enqueue('interactive', 'bob')
+        self.scheduler.release(holders[0])
+        wait_until(lambda: len(self.granted) == 1)
+        # 名额已被 bob 占用，batch 不能插队
+        self.assertIsNone(self.scheduler.acquire('batch', 'carol', timeout=0))
+
+    def test_operators_take_turns_within_a_lane(self):
+        holder = self.scheduler.acquire('batch', 'alice')
+        for _ in range(3):
+            self.enqueue('batch', 'alice')
+        self.enqueue('batch', 'bob')
+        self.enqueue('batch', 'carol')
+
+        order = []
+        ticket = holder
+        for _ in range(5):
+            _lane, operator, ticket = self.release_next(ticket)
+            order.append(operator)
+        self.assertEqual(order, ['alice', 'bob', 'carol', 'alice', 'alice'])
+
+    def test_lane_limit_reserves_capacity_for_other_lanes(self):
+        self.scheduler.max_in_flight = 2
+        self.scheduler.set_lane_limit('batch', 1)
+        batch = self.scheduler.acquire('batch', 'alice')
+        self.assertIsNone(self.scheduler.acquire('batch', 'bob', timeout=0))
+        interactive = self.scheduler.acquire('interactive', 'carol', timeout=0)
+        self.assertIsNotNone(interactive)
+        self.scheduler.release(batch)
+        self.scheduler.release(interactive)
+
+    def test_raising_lane_limit_dispatches_waiters(self):
+        self.scheduler.max_in_flight = 2
+        self.scheduler.set_lane_limit('batch', 1)
+        self.scheduler.acquire('batch', 'alice')
+        self.enqueue('batch', 'bob')
+        self.scheduler.set_lane_limit('batch', 2)
+        wait_until(lambda: len(self.granted) == 1)
+        self.assertEqual(self.granted[0][1], 'bob')
+        self.assertEqual(self.scheduler.in_flight('batch'), 2)
+
+    def test_timeout_removes_ticket_from_queue(self):
+        holder = self.scheduler.acquire('batch', 'alice')
+        self.assertIsNone(self.scheduler.acquire('batch', 'bob', timeout=0.01))
+        self.assertEqual(self.scheduler.waiting('batch'), 0)
+        self.assertNotIn('bob', self.scheduler._waiting['batch'])
+
+        # 超时的等待者不能在名额空出后被放行而占住名额
+        self.scheduler.release(holder)
+        self.assertEqual(self.scheduler.in_flight(), 0)
+        self.assertIsNotNone(self.scheduler.acquire('batch', 'carol', timeout=0))
+
+    def test_timeout_keeps_other_tickets_of_same_operator(self):
+        holder = self.scheduler.acquire('batch', 'alice')
+        waiter = self.enqueue('batch', 'bob')
+        self.assertIsNone(self.scheduler.acquire('batch', 'bob', timeout=0.01))
+        self.assertEqual(self.scheduler.waiting('batch'), 1)
+
+        _lane, operator, ticket = self.release_next(holder)
+        self.assertEqual(operator, 'bob')
+        self.assertIs(ticket, waiter.ticket)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# /tests/test_sessions.py
+import os
+import stat
+import tempfile
+import unittest
+from sessions import SqliteSessionStore
+
+
+class SqliteSessionStorePermissionsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sessions.sqlite3')
+        self.old_umask = os.umask(0o022)
+
+    def tearDown(self):
+        os.umask(self.old_umask)
+        self.directory.cleanup()
+
+    def assert_private(self):
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            self.assertTrue(os.path.exists(path), path)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600, path)
+
+    def test_database_and_wal_files_are_private(self):
+        store = SqliteSessionStore(self.path)
+        store.save('sid', {'bind_password': 'secret'}, 2 ** 31)
+        self.assertEqual(store.load('sid')[0], {'bind_password': 'secret'})
+        self.assert_private()
+
+    def test_existing_files_are_tightened(self):
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            open(path, 'wb').close()
+            os.chmod(path, 0o644)
+        store = SqliteSessionStore(self.path)
+        store.save('sid', {'bind_password': 'secret'}, 2 ** 31)
+        self.assert_private()
+
+
+if __name__ == '__main__':
+    unittest.main()
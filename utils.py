@@ -4,6 +4,7 @@ import sys
 import json
 from functools import wraps
 from flask import session, flash, redirect, url_for
+from dn_utils import parse_dn, rdn_value, is_within
 
 CONFIG_FILE, POSITIONS_FILE, RULES_FILE = 'config.json', 'positions.json', 'description_rules.json'
 
@@ -69,10 +70,11 @@ def save_rules(data):
 
 
 def simplify_dn(dn_string, base_dn):
-    readable_part = dn_string.replace(f',{base_dn}', '').replace(f'{base_dn}', '')
-    parts = readable_part.split(',')
-    cleaned_parts = [p.split('=')[1] for p in parts if p]
-    cleaned_parts.reverse()
+    rdns = parse_dn(dn_string)
+    base_depth = len(parse_dn(base_dn))
+    if base_depth and is_within(dn_string, base_dn):
+        rdns = rdns[:len(rdns) - base_depth]
+    cleaned_parts = [rdn_value(rdn) for rdn in reversed(rdns)]
     return ' / '.join(cleaned_parts) if cleaned_parts else "Domain Root"
 
 
@@ -1,4 +1,38 @@
+import gc
+import os
 from run import app
+from utils import CONFIG
+from ad_utils import preload_directory_snapshot, close_pooled_connections
+
+
+def preload_enabled():
+    """通过环境变量 ADUSER_PRELOAD=1 或配置项 PRELOAD_DIRECTORY 开启预加载 (gunicorn.conf.py 中的 preload_app 与此保持一致)"""
+    return os.environ.get('ADUSER_PRELOAD') == '1' or bool(CONFIG.get('PRELOAD_DIRECTORY'))
+
+
+def preload():
+    """
+    配合 `gunicorn wsgi:app` (gunicorn.conf.py 中 preload_app 开启) 使用：在 master 进程 fork 之前加载目录快照和已编译规则。
+    预加载需要一个只读服务账号，因为此时还没有任何登录会话。
+    """
+    bind_username = os.environ.get('ADUSER_PRELOAD_USER') or CONFIG.get('PRELOAD_BIND_USERNAME')
+    bind_password = os.environ.get('ADUSER_PRELOAD_PASSWORD') or CONFIG.get('PRELOAD_BIND_PASSWORD')
+    if not bind_username or not bind_password:
+        print("WARNING: Preload skipped, no preload bind account configured.")
+        return
+    try:
+        ou_count, group_count = preload_directory_snapshot(bind_username, bind_password)
+        print(f"INFO: Preloaded {ou_count} OUs and {group_count} groups before fork.")
+    except Exception as e:
+        print(f"WARNING: Preload failed, workers will start cold: {e}")
+    # 预加载用过的 LDAP 连接不能被 fork 出的 worker 共享
+    close_pooled_connections()
+    # 把已加载的对象移出 GC 跟踪，避免 worker 中的垃圾回收触碰这些页面导致写时复制失效
+    gc.freeze()
+
+
+if preload_enabled():
+    preload()
 
 if __name__ == "__main__":
     app.run()